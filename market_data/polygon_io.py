@@ -2,19 +2,47 @@
 
 import requests
 import logging
+from concurrent.futures import ThreadPoolExecutor
+
+class UpstreamError(Exception):
+    # The feed itself failed (5xx), as opposed to having no trade for the ticker
+    pass
+
 
 class PolygonIO:
-    def __init__(self, api_key):
+    def __init__(self, api_key, base_url='https://api.polygon.io', timeout=2.0):
         self.api_key = api_key
-        self.base_url = 'https://api.polygon.io'
+        self.base_url = base_url
+        # Bounds how long a hung connection holds a thread, deadlines are enforced by the caller
+        self.timeout = timeout
+        # Reuse connections instead of a new TLS handshake per request
+        self.session = requests.Session()
+        self.last_prices = {}
 
     def get_last_trade(self, ticker):
         url = f"{self.base_url}/v2/last/trade/{ticker}"
         params = {'apiKey': self.api_key}
-        response = requests.get(url, params=params)
+        response = self.session.get(url, params=params, timeout=self.timeout)
         if response.status_code == 200:
             data = response.json()
-            return data['results']['price']
+            price = data['results']['price']
+            self.last_prices[ticker] = price
+            return price
+        elif response.status_code >= 500:
+            raise UpstreamError(f"Polygon.io returned {response.status_code}")
         else:
             logging.error(f"Polygon.io API error: {response.text}")
             return None
+
+    def prefetch(self, tickers, workers=8):
+        # Prime prices for the given tickers so the first orders don't pay for a cold lookup
+        def fetch(ticker):
+            try:
+                return ticker, self.get_last_trade(ticker)
+            except Exception as e:
+                logging.error(f"Failed to prefetch market price for {ticker}: {e}")
+                return ticker, None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(executor.map(fetch, tickers))
+        return {ticker: price for ticker, price in results.items() if price is not None}
@@ -0,0 +1,212 @@
+# market_data/resilient.py
+
+import csv
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import requests
+from market_data.polygon_io import PolygonIO, UpstreamError
+
+# Only these mean the feed is unhealthy; a ticker without a trade (404) is a valid answer
+UPSTREAM_FAILURES = (requests.Timeout, requests.ConnectionError, UpstreamError)
+
+class CircuitBreaker:
+    # Closed: calls go upstream. Open: calls are skipped until reset_timeout has passed,
+    # then one probe is let through (half-open) and its result closes or reopens the breaker.
+    def __init__(self, failure_threshold=5, reset_timeout=10.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.lock = threading.Lock()
+
+    def allow(self):
+        with self.lock:
+            if self.opened_at is None:
+                return True
+            if self.probing or time.monotonic() - self.opened_at < self.reset_timeout:
+                return False
+            self.probing = True
+            return True
+
+    def record_success(self):
+        with self.lock:
+            if self.opened_at is not None:
+                logging.info("Market data circuit breaker closed.")
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            if self.probing or (self.opened_at is None and self.failures >= self.failure_threshold):
+                if self.opened_at is None:
+                    logging.warning(f"Market data circuit breaker opened after {self.failures} failures.")
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return 'closed'
+        return 'half_open' if self.probing else 'open'
+
+
+class FilePrices:
+    # Stand-in feed from a ticker,price CSV, re-read when the file changes
+    def __init__(self, path):
+        self.path = path
+        self.prices = {}
+        self.mtime = None
+        self.lock = threading.Lock()
+
+    def get_last_trade(self, ticker):
+        try:
+            mtime = os.stat(self.path).st_mtime_ns
+        except FileNotFoundError:
+            return None
+        if mtime != self.mtime:
+            with self.lock:
+                if mtime != self.mtime:
+                    with open(self.path, newline='') as f:
+                        self.prices = {row[0]: float(row[1]) for row in csv.reader(f) if len(row) >= 2 and row[1]}
+                    self.mtime = mtime
+        return self.prices.get(ticker)
+
+
+class ResilientMarketData:
+    # Same interface as PolygonIO; every lookup returns within the deadline, with a
+    # primary, a stale or a secondary price, or None when none of them has one.
+    def __init__(self, primary, secondary=None, config=None):
+        config = config or {}
+        self.primary = primary
+        self.secondary = secondary
+        self.deadline = config.get('deadline', 0.25)
+        self.hedge_after = config.get('hedge_after', 0.05)
+        self.max_staleness = config.get('max_staleness', 5.0)
+        self.breaker = CircuitBreaker(
+            config.get('failure_threshold', 5), config.get('reset_timeout', 10.0)
+        )
+        # Requests that overrun the deadline keep their thread until the HTTP timeout
+        self.executor = ThreadPoolExecutor(max_workers=config.get('workers', 32))
+        self.last_prices = {}
+        self.price_times = {}
+        self.metrics = dict.fromkeys([
+            'requests', 'primary', 'hedged', 'timeouts', 'errors', 'not_found', 'short_circuited',
+            'stale', 'secondary', 'unavailable'
+        ], 0)
+        self.metrics_lock = threading.Lock()
+        self.metrics_interval = config.get('metrics_interval', 60)
+        if self.metrics_interval:
+            threading.Thread(target=self.log_metrics, daemon=True).start()
+
+    def get_last_trade(self, ticker):
+        self.count('requests')
+        if self.breaker.allow():
+            price, failed = self.fetch_primary(ticker)
+            if failed:
+                self.breaker.record_failure()
+            else:
+                # No price is still an answer from a healthy feed
+                self.breaker.record_success()
+            if price is not None:
+                self.count('primary')
+                self.last_prices[ticker] = price
+                self.price_times[ticker] = time.monotonic()
+                return price
+        else:
+            self.count('short_circuited')
+        return self.fallback(ticker)
+
+    def fetch_primary(self, ticker):
+        # (price, failed): failed when the deadline passed or a request hit an upstream failure
+        started = time.monotonic()
+        failed = False
+        futures = {self.executor.submit(self.primary.get_last_trade, ticker)}
+        done, _ = wait(futures, timeout=min(self.hedge_after, self.deadline))
+        if not done:
+            # Slow tail, race a second request against the first
+            self.count('hedged')
+            futures.add(self.executor.submit(self.primary.get_last_trade, ticker))
+        while futures:
+            remaining = self.deadline - (time.monotonic() - started)
+            done, futures = wait(futures, timeout=max(remaining, 0), return_when=FIRST_COMPLETED)
+            if not done:
+                self.count('timeouts')
+                return None, True
+            for future in done:
+                try:
+                    price = future.result()
+                except Exception as e:
+                    logging.error(f"Market data request for {ticker} failed: {e}")
+                    failed = failed or isinstance(e, UPSTREAM_FAILURES)
+                    price = None
+                if price is not None:
+                    return price, False
+        self.count('errors' if failed else 'not_found')
+        return None, failed
+
+    def fallback(self, ticker):
+        price = self.last_prices.get(ticker)
+        if price is not None and time.monotonic() - self.price_times.get(ticker, 0) <= self.max_staleness:
+            self.count('stale')
+            return price
+        if self.secondary is not None:
+            try:
+                price = self.secondary.get_last_trade(ticker)
+            except Exception as e:
+                logging.error(f"Secondary market data request for {ticker} failed: {e}")
+                price = None
+            if price is not None:
+                self.count('secondary')
+                return price
+        self.count('unavailable')
+        logging.warning(f"No market price for {ticker} within the staleness bound.")
+        return None
+
+    def prefetch(self, tickers, workers=8):
+        # Prime prices for the given tickers so the first orders don't pay for a cold lookup
+        def fetch(ticker):
+            try:
+                return ticker, self.get_last_trade(ticker)
+            except Exception as e:
+                logging.error(f"Failed to prefetch market price for {ticker}: {e}")
+                return ticker, None
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            results = dict(executor.map(fetch, tickers))
+        return {ticker: price for ticker, price in results.items() if price is not None}
+
+    def count(self, name):
+        with self.metrics_lock:
+            self.metrics[name] += 1
+
+    def get_metrics(self):
+        with self.metrics_lock:
+            metrics = dict(self.metrics)
+        metrics['breaker'] = self.breaker.state
+        return metrics
+
+    def log_metrics(self):
+        while True:
+            time.sleep(self.metrics_interval)
+            logging.info(f"Market data: {self.get_metrics()}")
+
+
+def create_market_data(config):
+    market_data_config = config['market_data']
+    primary = PolygonIO(market_data_config['api_key'], timeout=market_data_config.get('http_timeout', 2.0))
+    secondary_config = market_data_config.get('secondary') or {}
+    secondary = None
+    if secondary_config.get('type') == 'file':
+        secondary = FilePrices(secondary_config['path'])
+    elif secondary_config.get('type') == 'polygon':
+        secondary = PolygonIO(
+            secondary_config['api_key'], base_url=secondary_config.get('base_url', 'https://api.polygon.io'),
+            timeout=market_data_config.get('http_timeout', 2.0)
+        )
+    return ResilientMarketData(primary, secondary, market_data_config)
@@ -1,10 +1,32 @@
 # risk_plugins/base.py
 
 class RiskPlugin:
+    # False for plugins whose result depends on wall-clock state, replays reuse the recorded result
+    deterministic = True
+
     def __init__(self, database, market_data=None):
         self.database = database
         self.market_data = market_data
+        self.reference_data = None
+        self.risk_state = None
 
     def check(self, order, account, session_id, risk_settings):
         raise NotImplementedError("Risk plugins must implement the 'check' method.")
 
+    def warm_up(self, reference_data):
+        # Bulk-loaded reference data; plugins fall back to the database when it is None
+        self.reference_data = reference_data
+
+    def get_open_exposure(self, account_id, asset_class=None):
+        # Exposure held by the account's working orders, none without in-memory state
+        if self.risk_state is None:
+            return 0.0
+        return self.risk_state.get_open_exposure(account_id, asset_class)
+
+    def get_state(self):
+        # Plugins holding in-process state return it here so it survives a restart
+        return None
+
+    def restore_state(self, state):
+        pass
+
@@ -2,6 +2,7 @@
 
 from .base import RiskPlugin
 import logging
+import numpy as np
 
 class CreditLimitCheck(RiskPlugin):
     def check(self, order, account, session_id, risk_settings):
@@ -11,20 +12,65 @@ class CreditLimitCheck(RiskPlugin):
                 return False, "Credit limit not set for session."
             
             positions = self.database.get_positions(account['account_id'])
-            total_position_value = sum(
-                position['total_quantity'] * self.get_market_price(position['ticker'])
-                for position in positions
-            )
+            total_position_value = self.calculate_position_value(positions)
             
-            order_value = order['quantity'] * order.get('price', 0)
-            if (total_position_value + order_value) > credit_limit:
+            # Contract value, the unit working orders are reserved in
+            if order.get('order_type') == 'SPREAD':
+                order_value = abs(sum(
+                    (leg.get('price') or 0) * leg['quantity'] * self.get_multiplier(leg['ticker'], leg)
+                    for leg in order.get('legs', [])
+                ))
+            else:
+                order_value = order['quantity'] * (order.get('price') or 0) * self.get_multiplier(order['ticker'], order)
+                if order.get('asset_class', 'EQUITY') == 'OPTION':
+                    order_delta = self.get_delta_notionals([dict(order, total_quantity=order['quantity'])])
+                    order_value = order_delta.get(order['ticker'], order_value)
+            open_order_value = self.get_open_exposure(account['account_id'])
+            if (total_position_value + open_order_value + order_value) > credit_limit:
                 return False, "Credit limit exceeded."
             return True, ""
         except Exception as e:
             logging.error(f"CreditLimitCheck error: {e}")
             return False, "Error in credit limit check."
     
+    def calculate_position_value(self, positions):
+        # Gross and marked to market, like the new order: a short uses credit as much as a long.
+        # The basket check values its positions with this too.
+        delta_notionals = self.get_delta_notionals(positions)
+        return sum(
+            delta_notionals[position['ticker']] if position['ticker'] in delta_notionals
+            else abs(position['total_quantity']) * self.get_market_price(position['ticker'])
+            * self.get_multiplier(position['ticker'], position)
+            for position in positions
+        )
+
+    def get_multiplier(self, ticker, item):
+        # Contract size for options and futures, same as the reserved and the notional values
+        if item.get('asset_class', 'EQUITY') not in ['OPTION', 'FUTURE'] or self.reference_data is None:
+            return 1.0
+        contract_size = self.reference_data['instruments'].contract_size(ticker)
+        return float(contract_size) if contract_size is not None else 1.0
+
+    def get_delta_notionals(self, positions):
+        # Option positions are valued at absolute delta-adjusted notional, all of them in one pass
+        option_analytics = self.reference_data.get('option_analytics') if self.reference_data is not None else None
+        options = [position for position in positions if position.get('asset_class', 'EQUITY') == 'OPTION']
+        if option_analytics is None or not options:
+            return {}
+        values = option_analytics.delta_notionals(
+            [position['ticker'] for position in options],
+            [position['total_quantity'] for position in options],
+            self.get_market_price
+        )
+        return {
+            position['ticker']: abs(float(value)) for position, value in zip(options, values) if not np.isnan(value)
+        }
+
     def get_market_price(self, ticker):
+        if self.market_data is not None:
+            price = self.market_data.get_last_trade(ticker)
+            if price is not None:
+                return price
         # Implement method to fetch current market price
         return 100.0  # Placeholder
 
@@ -57,6 +57,10 @@ class MarginCheck(RiskPlugin):
             return False, "Error in margin check"
 
     def get_margin_rates(self, asset_class, account_type, instrument_id=None):
+        if self.reference_data is not None:
+            if instrument_id and instrument_id in self.reference_data['margin_overrides']:
+                return self.reference_data['margin_overrides'][instrument_id]
+            return self.reference_data['margin_requirements'].get((asset_class, account_type))
         try:
             if instrument_id:
                 # Check for instrument-specific overrides
@@ -119,6 +123,8 @@ class MarginCheck(RiskPlugin):
             return None
 
     def get_contract_size(self, ticker):
+        if self.reference_data is not None:
+            return self.reference_data['instruments'].contract_size(ticker)
         try:
             cur = self.database.conn.cursor()
             cur.execute("""
@@ -214,6 +220,8 @@ class MarginCheck(RiskPlugin):
             return 0.0
 
     def get_option_strike_price(self, ticker):
+        if self.reference_data is not None:
+            return self.reference_data['instruments'].strike_price(ticker)
         try:
             cur = self.database.conn.cursor()
             cur.execute("""
@@ -6,27 +6,37 @@ import time
 import logging
 
 class MessageThrottlingCheck(RiskPlugin):
-    def __init__(self, database):
-        super().__init__(database)
-        self.message_counts = {}
+    deterministic = False
+
+    def __init__(self, database, market_data=None):
+        super().__init__(database, market_data)
+        self.message_counts = {}  # session_id -> [window, count]
         self.lock = threading.Lock()
-        self.reset_interval = 1  # Reset counts every second
-        threading.Thread(target=self.reset_counts, daemon=True).start()
+        self.reset_interval = 1  # Counts are per one-second window
+        # Windows roll over lazily on the next order, a reload doesn't leave a reset thread behind
 
-    def reset_counts(self):
-        while True:
-            time.sleep(self.reset_interval)
-            with self.lock:
-                self.message_counts.clear()
+    def get_state(self):
+        with self.lock:
+            return {session_id: list(window) for session_id, window in self.message_counts.items()}
+
+    def restore_state(self, state):
+        with self.lock:
+            # JSON turns integer keys into strings; counts without a window are from an older snapshot
+            self.message_counts = {
+                int(k): list(v) for k, v in state.items() if isinstance(v, (list, tuple))
+            }
 
     def check(self, order, account, session_id, risk_settings):
         try:
             max_messages = risk_settings.get('max_messages_per_second', 100)
+            window = int(time.time() // self.reset_interval)
             with self.lock:
-                count = self.message_counts.get(session_id, 0)
-                if count >= max_messages:
+                counts = self.message_counts.get(session_id)
+                if counts is None or counts[0] != window:
+                    counts = self.message_counts[session_id] = [window, 0]
+                if counts[1] >= max_messages:
                     return False, f"Message rate limit exceeded: {max_messages} messages per second."
-                self.message_counts[session_id] = count + 1
+                counts[1] += 1
             return True, ""
         except Exception as e:
             logging.error(f"MessageThrottlingCheck error: {e}")
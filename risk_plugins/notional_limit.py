@@ -2,6 +2,7 @@
 
 from .base import RiskPlugin
 import logging
+import numpy as np
 
 class NotionalLimitCheck(RiskPlugin):
     def __init__(self, database, market_data):
@@ -32,7 +33,12 @@ class NotionalLimitCheck(RiskPlugin):
                 return False, f"Order notional value {order_notional} exceeds maximum allowed {max_order_notional}"
 
             # Calculate total notional value of open positions including the new order
-            total_notional = self.calculate_total_notional(account['account_id'], order, order_notional)
+            total_notional = self.calculate_total_notional(
+                account['account_id'], order, self.calculate_exposure_notional(order, order_notional)
+            )
+
+            if total_notional is None:
+                return False, "Failed to calculate total notional value"
 
             # Check against max_total_notional
             if max_total_notional is not None and total_notional > max_total_notional:
@@ -44,6 +50,8 @@ class NotionalLimitCheck(RiskPlugin):
             return False, "Error in notional limit check"
 
     def get_notional_limits(self, session_id, asset_class):
+        if self.reference_data is not None:
+            return self.reference_data['notional_limits'].get((session_id, asset_class))
         try:
             cur = self.database.conn.cursor()
             cur.execute("""
@@ -89,6 +97,8 @@ class NotionalLimitCheck(RiskPlugin):
             return None
 
     def get_contract_size(self, ticker):
+        if self.reference_data is not None:
+            return self.reference_data['instruments'].contract_size(ticker)
         try:
             cur = self.database.conn.cursor()
             cur.execute("""
@@ -104,6 +114,39 @@ class NotionalLimitCheck(RiskPlugin):
             logging.error(f"Failed to fetch contract size for {ticker}: {e}")
             return None
 
+    def get_contract_sizes(self, tickers):
+        # One vectorized lookup for all of an account's derivative positions
+        if self.reference_data is not None and tickers:
+            instruments = self.reference_data['instruments']
+            sizes = instruments.contract_sizes(instruments.ids_of(tickers))
+            return {ticker: float(size) for ticker, size in zip(tickers, sizes) if not np.isnan(size)}
+        return {ticker: self.get_contract_size(ticker) for ticker in tickers}
+
+    def get_option_analytics(self):
+        if self.reference_data is None:
+            return None
+        return self.reference_data.get('option_analytics')
+
+    def get_delta_notionals(self, positions):
+        # Options count at their delta-adjusted notional, computed for all of them at once
+        option_analytics = self.get_option_analytics()
+        if option_analytics is None or not positions:
+            return {}
+        values = option_analytics.delta_notionals(
+            [position['ticker'] for position in positions],
+            [position['quantity'] for position in positions],
+            self.get_market_price
+        )
+        return {
+            position['ticker']: abs(float(value)) for position, value in zip(positions, values) if not np.isnan(value)
+        }
+
+    def calculate_exposure_notional(self, order, order_notional):
+        if order.get('asset_class', 'EQUITY') != 'OPTION' or order.get('order_type') == 'SPREAD':
+            return order_notional
+        delta_notionals = self.get_delta_notionals([order])
+        return delta_notionals.get(order['ticker'], order_notional)
+
     def calculate_spread_notional(self, order):
         try:
             legs = order.get('legs', [])
@@ -127,7 +170,31 @@ class NotionalLimitCheck(RiskPlugin):
         try:
             # Fetch current positions for the account
             positions = self.database.get_positions(account_id)
+            total_notional = self.calculate_positions_notional(account_id, positions)
+            if total_notional is None:
+                return None
+
+            # Working orders in the same asset class, then the new order
+            total_notional += self.get_open_exposure(account_id, order.get('asset_class', 'EQUITY'))
+            total_notional += order_notional
+
+            return total_notional
+        except Exception as e:
+            logging.error(f"Failed to calculate total notional: {e}")
+            return None
+
+    def calculate_positions_notional(self, account_id, positions):
+        # Marked to market; the basket check values its positions with this too
+        try:
             total_notional = 0.0
+            contract_sizes = self.get_contract_sizes([
+                position['ticker'] for position in positions
+                if position.get('asset_class', 'EQUITY') in ['OPTION', 'FUTURE']
+            ])
+            delta_notionals = self.get_delta_notionals([
+                position for position in positions
+                if position.get('asset_class', 'EQUITY') == 'OPTION' and position['quantity']
+            ])
 
             for position in positions:
                 # For each position, calculate its notional value
@@ -136,12 +203,17 @@ class NotionalLimitCheck(RiskPlugin):
                     continue
                 ticker = position['ticker']
                 asset_class = position.get('asset_class', 'EQUITY')
+                if ticker in delta_notionals:
+                    total_notional += delta_notionals[ticker]
+                    continue
                 price = self.get_market_price(ticker)
                 if price is None:
-                    continue
+                    # Leaving the position out would understate the total
+                    logging.error(f"No market price for position {ticker} of account {account_id}")
+                    return None
 
                 if asset_class in ['OPTION', 'FUTURE']:
-                    contract_size = self.get_contract_size(ticker)
+                    contract_size = contract_sizes.get(ticker)
                     if contract_size is None:
                         continue
                     position_notional = abs(position_quantity) * price * contract_size
@@ -150,12 +222,9 @@ class NotionalLimitCheck(RiskPlugin):
 
                 total_notional += position_notional
 
-            # Add the notional value of the new order
-            total_notional += order_notional
-
             return total_notional
         except Exception as e:
-            logging.error(f"Failed to calculate total notional: {e}")
+            logging.error(f"Failed to calculate position notional: {e}")
             return None
 
     def get_market_price(self, ticker):
@@ -26,6 +26,8 @@ class TradingModeCheck(RiskPlugin):
             return False, "Error in trading mode check"
 
     def get_trading_permissions(self, trading_mode, asset_class):
+        if self.reference_data is not None:
+            return self.reference_data['trading_permissions'].get((trading_mode, asset_class))
         try:
             cur = self.database.conn.cursor()
             cur.execute("""
@@ -1,35 +1,42 @@
-# src/risk_management.py
+# risk_plugins/volume_limit.py
 
-import importlib
+from .base import RiskPlugin
 import logging
 
-class RiskManagement:
-    def __init__(self, database, market_data):
-        self.database = database
-        self.market_data = market_data
-        self.plugins = {}
-        self.load_plugins()
+class VolumeLimitCheck(RiskPlugin):
+    def check(self, order, account, session_id, risk_settings):
+        try:
+            quantity = order['quantity']
+            max_order_volume = risk_settings.get('max_order_volume')
+            if max_order_volume is not None and quantity > max_order_volume:
+                return False, "Order quantity exceeds maximum order volume."
 
-    def load_plugins(self):
-        plugin_names = [
-            'credit_limit',
-            'margin_check',
-            'notional_limit',
-            'volume_limit',  # Include the volume_limit plugin
-            'trading_mode',
-            'portfolio_margin',
-            'equity_option_spread',
-            'message_throttling'
-        ]
-        for name in plugin_names:
-            try:
-                module = importlib.import_module(f"risk_plugins.{name}")
-                plugin_class_name = ''.join([part.title() for part in name.split('_')]) + "Check"
-                plugin_class = getattr(module, plugin_class_name)
-                self.plugins[name] = plugin_class(self.database, self.market_data)
-                logging.info(f"Loaded risk plugin: {name}")
-            except Exception as e:
-                logging.error(f"Failed to load plugin {name}: {e}")
+            max_daily_volume = risk_settings.get('max_daily_volume')
+            if max_daily_volume is not None:
+                daily_volume = self.get_daily_volume(session_id)
+                if daily_volume is None:
+                    return False, "Failed to fetch daily volume."
+                if daily_volume + quantity > max_daily_volume:
+                    return False, "Daily volume limit exceeded."
 
-    # Rest of the class remains the same...
+            return True, ""
+        except Exception as e:
+            logging.error(f"VolumeLimitCheck error: {e}")
+            return False, "Error in volume limit check"
 
+    def get_daily_volume(self, session_id):
+        if self.risk_state is not None:
+            return self.risk_state.get_daily_volume(session_id)
+        try:
+            cur = self.database.conn.cursor()
+            cur.execute("""
+                SELECT COALESCE(SUM(filled_quantity), 0)
+                FROM orders
+                WHERE session_id = %s AND created_at >= CURRENT_DATE;
+            """, (session_id,))
+            result = cur.fetchone()
+            cur.close()
+            return int(result[0]) if result else 0
+        except Exception as e:
+            logging.error(f"Failed to fetch daily volume for session {session_id}: {e}")
+            return None
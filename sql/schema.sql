@@ -114,6 +114,25 @@ CREATE TABLE orders (
     asset_class VARCHAR(20) NOT NULL,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    liquidity_tag VARCHAR(20) -- 'INTERNALIZED', 'EXTERNAL', etc.
+    liquidity_tag VARCHAR(20), -- 'INTERNALIZED', 'EXTERNAL', etc.
+    filled_quantity INTEGER DEFAULT 0
 );
+-- Indexes and daily partitioning of orders are applied by python -m src.migrations migrate
 
+-- Order Store Checkpoints Table: how much of each day's write-ahead log is in orders
+CREATE TABLE oms_checkpoints (
+    wal VARCHAR(100) PRIMARY KEY,
+    position INTEGER NOT NULL
+);
+
+
+-- Audit Logs Table
+CREATE TABLE audit_logs (
+    audit_id SERIAL PRIMARY KEY,
+    user_id INTEGER,
+    action VARCHAR(50) NOT NULL,
+    table_name VARCHAR(50) NOT NULL,
+    record_id VARCHAR(50),
+    changed_data JSONB,
+    timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+);
@@ -1,13 +1,25 @@
 # src/application.py
 
 import logging
+import threading
 import yaml
 from dotenv import load_dotenv
 from src.database import Database
 from src.fix_engine import FIXEngine
 from src.risk_management import RiskManagement
 from src.order_manager import OrderManager
-from market_data.polygon_io import PolygonIO
+from src.risk_state import RiskState
+from src.snapshot import RiskStateSnapshot
+from src.warmup import StartupWarmup
+from src.sharding import ShardRouter
+from src.limit_reservations import create_limit_reservations, get_authkey
+from src.audit import AuditJournal
+from src.decision_log import DecisionRecorder
+from src.order_store import OrderStore
+from src.kill_switch import KillSwitch, serve as serve_kill_switch
+from src.hot_reload import HotReloader
+from src.scheduler import FairScheduler
+from market_data.resilient import create_market_data
 from src.utils import setup_logging
 
 class TradingApplication:
@@ -20,19 +32,117 @@ class TradingApplication:
             self.config = yaml.safe_load(f)
         
         self.database = Database(self.config['database'])
-        self.market_data = PolygonIO(self.config['market_data']['api_key'])
-        self.risk_management = RiskManagement(self.database)
-        self.order_manager = OrderManager(self.database)
+        self.market_data = create_market_data(self.config)
+        self.risk_state = RiskState()
+        self.audit = AuditJournal(self.config)
+        self.audit.start()
+        self.recorder = None
+        if self.config.get('decision_log', {}).get('enabled', True):
+            self.recorder = DecisionRecorder(self.config, self.risk_state, self.market_data)
+
+        # With shards, account risk runs in worker processes and only per-session checks stay here
+        sharding_config = self.config.get('sharding', {})
+        self.shard_router = None
+        self.limit_reservations = None
+        if sharding_config.get('shards', 0) > 0:
+            self.shard_router = ShardRouter(self.config)
+            self.risk_management = RiskManagement(
+                self.database, self.risk_state,
+                plugin_names=sharding_config.get('session_plugins', ['message_throttling']),
+                audit=self.audit,
+                recorder=self.recorder,
+                market_data=self.market_data,
+                reserve_open_orders=False
+            )
+        else:
+            # Limits are leased from a shared coordinator so scaled-out gateways don't multiply them
+            self.limit_reservations = create_limit_reservations(self.config, self.risk_state)
+            self.risk_management = RiskManagement(
+                self.database, self.risk_state,
+                plugin_names=self.config.get('risk_management', {}).get('plugins'),
+                limit_reservations=self.limit_reservations, audit=self.audit, recorder=self.recorder,
+                market_data=self.market_data
+            )
+
+        # Warm restart: map the last snapshot and replay only what changed since
+        snapshot_config = self.config.get('snapshot', {})
+        self.snapshot = RiskStateSnapshot(snapshot_config.get('path', 'data/risk_state.snap'))
+
+        # Working orders live in memory, the orders table is replicated from the WAL behind them
+        self.order_store = OrderStore(self.config)
+        self.order_store.recover(self.database)
+
         self.fix_engine = FIXEngine('config/quickfix.cfg', self)
+        # Runs on the listener's threads, with a database connection of its own
+        self.kill_switch = KillSwitch(
+            self.config, self.order_store, self.fix_engine, self.risk_state, Database(self.config['database']),
+            self.audit, self.shard_router
+        )
+        self.order_manager = OrderManager(
+            self.database, self.fix_engine, self.shard_router or self.risk_state, self.audit, self.order_store,
+            self.limit_reservations, self.kill_switch
+        )
+        # Orders from the FIX sessions are queued per session and served fairly by weight
+        # process_order runs on the one database connection and the front end's plugin state, one
+        # order at a time, except for the wait for the shard's decision
+        self.order_lock = threading.Lock()
+        self.scheduler = None
+        if self.config.get('scheduler', {}).get('enabled', True):
+            workers = None
+            if self.shard_router is not None:
+                # Enough workers to keep every shard busy, each one waits on a shard with the lock released
+                workers = sharding_config['shards'] * sharding_config.get('in_flight', 4)
+            self.scheduler = FairScheduler(self.config, self.process_order, self.fix_engine.send_reject, workers)
+
+        # Load everything the order path needs before accepting any FIX connection
+        self.warmup = StartupWarmup(
+            self.config, self.database, self.risk_state, self.risk_management, self.market_data, self.snapshot,
+            order_store=self.order_store
+        )
+        if not self.warmup.run():
+            raise RuntimeError("Startup readiness check failed, FIX acceptor not started.")
+        if self.shard_router is not None:
+            if not self.shard_router.start():
+                raise RuntimeError("Risk shards failed to start, FIX acceptor not started.")
+            # The shards hold the open-order ledger, the working orders are only known here
+            self.shard_router.rebuild_open_orders(self.order_store.open_orders())
+        self.snapshot.start(self.risk_state, self.risk_management, snapshot_config.get('interval', 5))
+        # Watches the files when enabled, and refreshes accounts and limits from the database either way
+        session_plugins = sharding_config.get('session_plugins', ['message_throttling'])
+        plugin_filter = (lambda name: name in session_plugins) if self.shard_router is not None else None
+        HotReloader(config_file, self.risk_management, self.warmup, plugin_filter).start()
+        kill_switch_config = self.config.get('kill_switch', {})
+        if kill_switch_config.get('enabled', True):
+            serve_kill_switch(
+                self.kill_switch, kill_switch_config.get('host', '127.0.0.1'),
+                kill_switch_config.get('port', 6391), get_authkey(kill_switch_config, 'KILL_SWITCH_AUTHKEY')
+            )
+        if self.scheduler is not None:
+            self.scheduler.start()
         self.fix_engine.start()
+
+    def submit_order(self, order, session_id):
+        # Entry point for new orders from the FIX sessions
+        if self.scheduler is None:
+            return self.process_order(order, session_id)
+        return self.scheduler.submit(order, session_id)
     
     def process_order(self, order, session_id):
-        account = self.database.get_account(order['account_id'])
-        if not account:
-            logging.error(f"Account ID {order['account_id']} not found.")
-            return
-        
-        risk_passed, message = self.risk_management.check_order(order, account, session_id)
+        with self.order_lock:
+            account = self.risk_state.get_account(order['account_id']) or self.database.get_account(order['account_id'])
+            if not account:
+                logging.error(f"Account ID {order['account_id']} not found.")
+                return
+            risk_passed, message = self.risk_management.check_order(order, account, session_id)
+        if risk_passed and self.shard_router is not None:
+            # Other workers run their orders while this one waits for its shard
+            risk_passed, message = self.shard_router.check_order(order, account, session_id)
+        with self.order_lock:
+            self.finish_order(order, session_id, risk_passed, message)
+
+    def finish_order(self, order, session_id, risk_passed, message):
+        if risk_passed:
+            self.audit.record_decision(order, session_id, True)
         if not risk_passed:
             logging.warning(f"Order rejected: {message}")
             self.fix_engine.send_reject(order, session_id, message)
@@ -40,13 +150,22 @@ class TradingApplication:
         
         price = self.market_data.get_last_trade(order['ticker'])
         if not price:
-            logging.error("Failed to fetch market price.")
+            logging.error(f"No market price for {order['ticker']}, order rejected.")
+            self.order_manager.release_order(order)
+            self.fix_engine.send_reject(order, session_id, "Market price unavailable.")
             return
         
-        self.order_manager.process_order(order, session_id, price)
+        if not self.order_manager.process_order(order, session_id, price):
+            return
         self.fix_engine.send_execution_report(order, session_id, price)
     
     def shutdown(self):
         self.fix_engine.stop()
+        if self.shard_router is not None:
+            self.shard_router.stop()
+        if self.limit_reservations is not None:
+            self.limit_reservations.return_leases()
+        self.snapshot.write(self.risk_state, self.risk_management)
+        self.audit.stop()
         logging.info("Trading Application stopped.")
 
@@ -0,0 +1,212 @@
+# src/audit.py
+
+import csv
+import io
+import itertools
+import json
+import logging
+import os
+import struct
+import threading
+import time
+from datetime import datetime
+import psycopg2
+
+ORDER_ACCEPTED = 1
+ORDER_REJECTED = 2
+ORDER_STATUS = 3
+POSITION_UPDATE = 4
+
+EVENTS = {
+    ORDER_ACCEPTED: ('ORDER_ACCEPTED', 'orders'),
+    ORDER_REJECTED: ('RISK_REJECT', 'orders'),
+    ORDER_STATUS: ('ORDER_STATUS', 'orders'),
+    POSITION_UPDATE: ('POSITION_UPDATE', 'positions')
+}
+
+# timestamp, event, account_id, session_id, record_id, plugin length, message length, data length
+RECORD = struct.Struct('<dBiiqHHI')
+LENGTH = struct.Struct('<I')
+
+def encode_record(event, account_id, session_id, record_id, plugin='', message='', data=None):
+    plugin = plugin.encode()
+    message = message.encode()
+    data = json.dumps(data, separators=(',', ':'), default=str).encode() if data else b''
+    header = RECORD.pack(
+        time.time(), event, account_id or 0, session_id or 0,
+        record_id if isinstance(record_id, int) else -1, len(plugin), len(message), len(data)
+    )
+    return header + plugin + message + data
+
+def decode_record(record):
+    timestamp, event, account_id, session_id, record_id, plugin_length, message_length, data_length = \
+        RECORD.unpack_from(record, 0)
+    offset = RECORD.size
+    plugin = record[offset:offset + plugin_length].decode()
+    offset += plugin_length
+    message = record[offset:offset + message_length].decode()
+    offset += message_length
+    data = json.loads(record[offset:offset + data_length]) if data_length else {}
+    return {
+        'timestamp': datetime.fromtimestamp(timestamp),
+        'event': event,
+        'account_id': account_id,
+        'session_id': session_id,
+        'record_id': record_id if record_id >= 0 else None,
+        'plugin': plugin,
+        'message': message,
+        'data': data
+    }
+
+
+class AuditRing:
+    # Multi-producer single-consumer ring. Claiming a sequence number from
+    # itertools.count is atomic under the GIL, so producers never take a lock.
+    def __init__(self, size):
+        self.size = size
+        self.slots = [None] * size
+        self.sequence = itertools.count()
+        self.read_position = 0
+
+    def put(self, record):
+        sequence = next(self.sequence)
+        while sequence - self.read_position >= self.size:
+            # Writer has fallen a full lap behind, wait rather than lose audit records
+            time.sleep(0.0001)
+        self.slots[sequence % self.size] = (sequence, record)
+
+    def drain(self, limit):
+        records = []
+        while len(records) < limit:
+            slot = self.slots[self.read_position % self.size]
+            if slot is None or slot[0] != self.read_position:
+                break  # Not published yet
+            records.append(slot[1])
+            self.read_position += 1
+        return records
+
+
+class AuditJournal:
+    def __init__(self, config, path_suffix=''):
+        audit_config = config.get('audit', {})
+        self.db_config = config['database']
+        self.path = audit_config.get('path', 'data/audit.journal') + path_suffix
+        self.flush_interval = audit_config.get('flush_interval', 0.05)
+        self.load_interval = audit_config.get('load_interval', 1.0)
+        self.batch_size = audit_config.get('batch_size', 10000)
+        self.ring = AuditRing(audit_config.get('ring_size', 65536))
+        self.running = False
+        self.conn = None
+
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.journal = open(self.path, 'ab')
+
+    def record_decision(self, order, session_id, passed, plugin='', message=''):
+        self.ring.put(encode_record(
+            ORDER_ACCEPTED if passed else ORDER_REJECTED,
+            order.get('account_id'), session_id, order.get('order_id'), plugin, message,
+            {'order_id': order.get('order_id'), 'ticker': order.get('ticker'), 'side': order.get('side'),
+             'quantity': order.get('quantity'), 'price': order.get('price')}
+        ))
+
+    def record_order_status(self, order_id, status, account_id=None, session_id=None, **changes):
+        self.ring.put(encode_record(
+            ORDER_STATUS, account_id, session_id, order_id, data=dict(changes, status=status)
+        ))
+
+    def record_position(self, account_id, session_id, ticker, quantity, average_price):
+        self.ring.put(encode_record(
+            POSITION_UPDATE, account_id, session_id, None,
+            data={'ticker': ticker, 'quantity': quantity, 'average_price': average_price}
+        ))
+
+    def start(self):
+        self.running = True
+        self.writer = threading.Thread(target=self.run, daemon=True)
+        self.writer.start()
+
+    def stop(self):
+        self.running = False
+        self.writer.join()
+
+    def run(self):
+        last_load = 0.0
+        while True:
+            running = self.running
+            self.flush()
+            if time.monotonic() - last_load >= self.load_interval or not running:
+                try:
+                    self.load()
+                except Exception as e:
+                    logging.error(f"Failed to load audit journal into audit_logs: {e}")
+                    self.conn = None
+                last_load = time.monotonic()
+            if not running:
+                break
+            time.sleep(self.flush_interval)
+
+    def flush(self):
+        # Ring -> append-only file, so nothing is lost if the database is unavailable
+        while True:
+            records = self.ring.drain(self.batch_size)
+            if not records:
+                break
+            self.journal.write(b''.join(LENGTH.pack(len(record)) + record for record in records))
+            self.journal.flush()
+            os.fsync(self.journal.fileno())
+
+    def load(self):
+        # File -> audit_logs with COPY, resuming from the last offset that made it in
+        offset = self.read_offset()
+        with open(self.path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        if not data:
+            return
+
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        position = 0
+        while position + LENGTH.size <= len(data):
+            length = LENGTH.unpack_from(data, position)[0]
+            if position + LENGTH.size + length > len(data):
+                break  # Partially written record, pick it up next time
+            record = decode_record(data[position + LENGTH.size:position + LENGTH.size + length])
+            position += LENGTH.size + length
+            action, table_name = EVENTS[record['event']]
+            changed_data = dict(record['data'], account_id=record['account_id'], session_id=record['session_id'])
+            if record['plugin']:
+                changed_data['plugin'] = record['plugin']
+            if record['message']:
+                changed_data['message'] = record['message']
+            writer.writerow([
+                action, table_name, record['record_id'] if record['record_id'] is not None else '',
+                json.dumps(changed_data, default=str), record['timestamp'].isoformat()
+            ])
+        if position == 0:
+            return
+
+        if self.conn is None:
+            self.conn = psycopg2.connect(**self.db_config)
+        buffer.seek(0)
+        cur = self.conn.cursor()
+        cur.copy_expert("""
+            COPY audit_logs (action, table_name, record_id, changed_data, timestamp) FROM STDIN WITH CSV
+        """, buffer)
+        self.conn.commit()
+        cur.close()
+        self.write_offset(offset + position)
+
+    def read_offset(self):
+        try:
+            with open(self.path + '.offset', 'r') as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def write_offset(self, offset):
+        with open(self.path + '.offset.tmp', 'w') as f:
+            f.write(str(offset))
+        os.replace(self.path + '.offset.tmp', self.path + '.offset')
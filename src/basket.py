@@ -0,0 +1,244 @@
+# src/basket.py
+
+import numpy as np
+
+# Built-in checks evaluated in vector form; any other plugin still runs order by order
+VECTORIZED_PLUGINS = {'credit_limit', 'margin_check', 'notional_limit', 'volume_limit', 'trading_mode'}
+
+class BasketRiskCheck:
+    def __init__(self, risk_management):
+        self.risk_management = risk_management
+
+    def check_orders(self, batch, session_id, risk_settings, pipeline):
+        decisions = [(True, "")] * len(batch)
+        accounts = {}
+        for index, order in enumerate(batch):
+            accounts.setdefault(order['account_id'], []).append(index)
+
+        for account_id, indexes in accounts.items():
+            account = self.risk_management.get_account(account_id)
+            if not account:
+                for index in indexes:
+                    decisions[index] = (False, f"Account ID {account_id} not found.")
+                continue
+            orders = [batch[index] for index in indexes]
+            recorder = self.risk_management.recorder
+            if recorder is not None:
+                recorder.begin(account, session_id)
+            results = self.check_account(orders, account, session_id, risk_settings, pipeline)
+            if recorder is not None:
+                recorder.record_all(
+                    [(order, {'basket': result}, result[0]) for order, result in zip(orders, results)],
+                    account, session_id, risk_settings, pipeline.reference_version
+                )
+            for index, result in zip(indexes, results):
+                decisions[index] = result
+        return decisions
+
+    def check_account(self, orders, account, session_id, risk_settings, pipeline):
+        reference_data = pipeline.reference_data
+        # One consistent view of the account for the whole basket, taken under the risk state lock
+        account_positions, daily_volume, open_exposure = self.risk_management.risk_state.get_account_view(
+            account['account_id'], session_id
+        )
+        held = {}
+        for position in account_positions:
+            # Account-wide per ticker, summed over the sessions that hold it
+            ticker = position['ticker']
+            if ticker not in held:
+                held[ticker] = dict(position, quantity=0)
+            held[ticker]['quantity'] += position['quantity']
+        held = [dict(position, total_quantity=position['quantity']) for position in held.values()]
+        positions = {position['ticker']: position['quantity'] for position in held}
+        # Positions are marked to market by the plugins that own the limits, as order by order
+        credit_limit = pipeline.plugins.get('credit_limit')
+        notional_limit = pipeline.plugins.get('notional_limit')
+        position_value = credit_limit.calculate_position_value(held) if credit_limit is not None else 0.0
+        positions_notional = 0.0
+        if notional_limit is not None:
+            positions_notional = notional_limit.calculate_positions_notional(account['account_id'], held)
+
+        count = len(orders)
+        quantity = np.array([order['quantity'] for order in orders], dtype=np.float64)
+        price = np.array([order.get('price') or 0.0 for order in orders], dtype=np.float64)
+        multiplier = np.ones(count)
+        margin_rate = np.full(count, np.nan)
+        asset_classes = [order.get('asset_class', 'EQUITY') for order in orders]
+        messages = [None] * count
+
+        instruments = reference_data['instruments']
+        is_derivative = np.array([asset_class in ['OPTION', 'FUTURE'] for asset_class in asset_classes])
+        if is_derivative.any():
+            contract_sizes = instruments.contract_sizes(instruments.ids_of([order['ticker'] for order in orders]))
+            multiplier = np.where(is_derivative, contract_sizes, 1.0)
+        for i, order in enumerate(orders):
+            rates = self.get_margin_rates(order, account, reference_data)
+            if rates is not None:
+                margin_rate[i] = rates['initial_margin_rate']
+            else:
+                messages[i] = f"Margin rates not defined for asset class {asset_classes[i]} and account type {account['account_type']}"
+            permissions = reference_data['trading_permissions'].get((account.get('trading_mode', 'NORMAL'), asset_classes[i]))
+            message = self.check_permissions(order, permissions, account, asset_classes[i])
+            if message and messages[i] is None:
+                messages[i] = message
+
+        notional = quantity * price * multiplier
+        for i, order in enumerate(orders):
+            if order.get('order_type') == 'SPREAD':
+                notional[i] = self.get_spread_notional(order, reference_data)
+        self.reject(messages, np.isnan(notional), "Failed to calculate order notional value")
+        notional = np.where(np.isnan(notional), 0.0, notional)
+
+        # Per-order limits, all orders at once
+        self.reject(messages, quantity > (risk_settings.get('max_order_volume') or np.inf),
+                    "Order quantity exceeds maximum order volume.")
+        self.reject(messages, notional > float(risk_settings.get('max_order_value') or np.inf),
+                    "Order value exceeds maximum order value.")
+        notional_limits = {
+            asset_class: reference_data['notional_limits'].get((session_id, asset_class)) or {}
+            for asset_class in set(asset_classes)
+        }
+        max_order_notional = np.array([
+            notional_limits[asset_class].get('max_order_notional') or np.inf for asset_class in asset_classes
+        ])
+        self.reject(messages, notional > max_order_notional, "Order notional value exceeds maximum allowed.")
+        for i, asset_class in enumerate(asset_classes):
+            if not notional_limits[asset_class] and messages[i] is None:
+                messages[i] = f"Notional limits not set for asset class {asset_class}"
+        if notional_limit is not None and positions_notional is None:
+            self.reject(messages, np.ones(count, dtype=bool), "Failed to calculate total notional value")
+            positions_notional = 0.0
+
+        accepted = np.array([message is None for message in messages])
+
+        # Cumulative limits: each accepted order uses up room for the ones behind it. Only
+        # accepted orders count, a rejected order leaves the running totals as they were.
+        constraints = [
+            (quantity, daily_volume, risk_settings.get('max_daily_volume'), "Daily volume limit exceeded."),
+            (
+                notional, position_value + sum(open_exposure.values()),
+                risk_settings.get('max_position_value') if credit_limit is not None else None, "Credit limit exceeded."
+            ),
+            (notional * np.nan_to_num(margin_rate), 0.0, self.get_available_margin(account), "Insufficient margin for the basket.")
+        ]
+        for asset_class, limits in notional_limits.items():
+            is_class = np.array([a == asset_class for a in asset_classes])
+            constraints.append((
+                notional * is_class, positions_notional + open_exposure.get(asset_class, 0.0),
+                limits.get('max_total_notional') if notional_limit is not None else None,
+                f"Total notional value exceeds maximum allowed for {asset_class}."
+            ))
+        constraints.extend(self.get_short_constraints(orders, positions, account, asset_classes, reference_data))
+        self.apply_cumulative(constraints, accepted, messages)
+
+        # Plugins without a vector form run per order on what is left
+        results = []
+        plugins = [plugin for name, plugin in pipeline.plugins.items() if name not in VECTORIZED_PLUGINS]
+        for i, order in enumerate(orders):
+            if messages[i] is not None:
+                results.append((False, messages[i]))
+                continue
+            result = (True, "")
+            for plugin in plugins:
+                result = plugin.check(order, account, session_id, risk_settings)
+                if not result[0]:
+                    break
+            limit_reservations = self.risk_management.limit_reservations
+            if result[0] and limit_reservations is not None:
+                result = limit_reservations.check(order, account, session_id, risk_settings)
+            results.append(result)
+        return results
+
+    def apply_cumulative(self, constraints, accepted, messages):
+        start = 0
+        while True:
+            breach = None
+            for contribution, base, limit, message in constraints:
+                if limit is None:
+                    continue
+                used = base + np.sum(contribution[:start] * accepted[:start])
+                running = used + np.cumsum(contribution[start:] * accepted[start:])
+                over = np.nonzero((running > float(limit)) & accepted[start:])[0]
+                if over.size and (breach is None or start + over[0] < breach[0]):
+                    breach = (start + over[0], message)
+            if breach is None:
+                return
+            # Reject the first order that breaks a limit and re-run from there without it
+            index, message = breach
+            accepted[index] = False
+            messages[index] = message
+            start = index
+
+    def reject(self, messages, mask, message):
+        for i in np.nonzero(mask)[0]:
+            if messages[i] is None:
+                messages[i] = message
+
+    def get_multiplier(self, order, reference_data):
+        if order.get('asset_class', 'EQUITY') not in ['OPTION', 'FUTURE']:
+            return 1.0
+        contract_size = reference_data['instruments'].contract_size(order['ticker'])
+        return float(contract_size) if contract_size is not None else np.nan
+
+    def get_spread_notional(self, order, reference_data):
+        legs = order.get('legs', [])
+        if len(legs) < 2:
+            return np.nan
+        return sum(
+            (leg.get('price') or 0.0) * leg['quantity'] * self.get_multiplier(leg, reference_data)
+            for leg in legs
+        )
+
+    def get_margin_rates(self, order, account, reference_data):
+        ticker = order.get('ticker')
+        if ticker in reference_data['margin_overrides']:
+            return reference_data['margin_overrides'][ticker]
+        return reference_data['margin_requirements'].get((order.get('asset_class', 'EQUITY'), account['account_type']))
+
+    def get_available_margin(self, account):
+        account_type = account['account_type']
+        cash_balance = float(account.get('cash_balance') or 0.0)
+        if account_type == 'CASH':
+            return cash_balance
+        if account_type in ['MARGIN', 'DAY_TRADING_MARGIN']:
+            return cash_balance + float(account.get('margin_balance') or 0.0)
+        if account_type == 'PORTFOLIO_MARGIN':
+            return float(account.get('portfolio_margin_available') or 0.0)
+        return 0.0
+
+    def get_short_constraints(self, orders, positions, account, asset_classes, reference_data):
+        # Without short selling, the sells of a ticker that get accepted can't add up to more than the position
+        trading_mode = account.get('trading_mode', 'NORMAL')
+        constraints = []
+        sells = {}
+        for i, order in enumerate(orders):
+            if order.get('side', 'BUY') == 'SELL':
+                sells.setdefault((order['ticker'], asset_classes[i]), []).append(i)
+        for (ticker, asset_class), indexes in sells.items():
+            permissions = reference_data['trading_permissions'].get((trading_mode, asset_class)) or {}
+            if permissions.get('allow_short', False):
+                continue
+            contribution = np.zeros(len(orders))
+            contribution[indexes] = [orders[i]['quantity'] for i in indexes]
+            constraints.append((
+                contribution, 0.0, max(positions.get(ticker, 0), 0),
+                f"Trading not allowed for {asset_class} in mode {trading_mode} with side SELL"
+            ))
+        return constraints
+
+    def check_permissions(self, order, permissions, account, asset_class):
+        trading_mode = account.get('trading_mode', 'NORMAL')
+        side = order.get('side', 'BUY')
+        if not permissions:
+            return f"Trading permissions not defined for mode {trading_mode} and asset class {asset_class}"
+        message = f"Trading not allowed for {asset_class} in mode {trading_mode} with side {side}"
+        if order.get('order_type') == 'SPREAD' and not permissions.get('allow_spreads', False):
+            return message
+        if asset_class == 'OPTION' and not permissions.get('allow_options', False):
+            return message
+        if side == 'BUY' and not permissions.get('allow_buy', True):
+            return message
+        if side == 'SELL' and not permissions.get('allow_sell', True):
+            return message
+        # Selling more than the position is checked with the cumulative limits
+        return None
@@ -2,6 +2,8 @@
 
 # src/database.py
 
+import csv
+import io
 import psycopg2
 import logging
 from psycopg2.extras import RealDictCursor
@@ -23,12 +25,27 @@ class Database:
             logging.error(f"Failed to fetch open orders: {e}")
             return []
 
-    def get_order(self, order_id):
+    def get_all_open_orders(self):
         try:
             cur = self.conn.cursor(cursor_factory=RealDictCursor)
             cur.execute("""
-                SELECT * FROM orders WHERE order_id = %s;
-            """, (order_id,))
+                SELECT * FROM orders
+                WHERE status IN ('OPEN', 'SENT_TO_MARKET', 'PARTIALLY_FILLED', 'CANCEL_PENDING');
+            """)
+            orders = cur.fetchall()
+            cur.close()
+            return orders
+        except Exception as e:
+            logging.error(f"Failed to fetch open orders: {e}")
+            return []
+
+    def get_order(self, order_id, created_at=None):
+        # With created_at only that day's partition of orders is read
+        try:
+            cur = self.conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                SELECT * FROM orders WHERE order_id = %s AND (created_at = %s OR %s IS NULL);
+            """, (order_id, created_at, created_at))
             order = cur.fetchone()
             cur.close()
             return order
@@ -36,7 +53,7 @@ class Database:
             logging.error(f"Failed to fetch order: {e}")
             return None
 
-    def update_order_status(self, order_id, status, filled_quantity=None, liquidity_tag=None):
+    def update_order_status(self, order_id, status, filled_quantity=None, liquidity_tag=None, created_at=None):
         try:
             cur = self.conn.cursor()
             cur.execute("""
@@ -45,24 +62,121 @@ class Database:
                     filled_quantity = COALESCE(filled_quantity, 0) + COALESCE(%s, 0),
                     liquidity_tag = %s,
                     updated_at = CURRENT_TIMESTAMP
-                WHERE order_id = %s;
-            """, (status, filled_quantity, liquidity_tag, order_id))
+                WHERE order_id = %s AND (created_at = %s OR %s IS NULL);
+            """, (status, filled_quantity, liquidity_tag, order_id, created_at, created_at))
             self.conn.commit()
             cur.close()
         except Exception as e:
             logging.error(f"Failed to update order status: {e}")
 
-    def update_order_quantity(self, order_id, quantity):
+    def update_order_quantity(self, order_id, quantity, created_at=None):
         try:
             cur = self.conn.cursor()
             cur.execute("""
                 UPDATE orders
                 SET quantity = %s,
                     updated_at = CURRENT_TIMESTAMP
-                WHERE order_id = %s;
-            """, (quantity, order_id))
+                WHERE order_id = %s AND (created_at = %s OR %s IS NULL);
+            """, (quantity, order_id, created_at, created_at))
             self.conn.commit()
             cur.close()
         except Exception as e:
             logging.error(f"Failed to update order quantity: {e}")
 
+    def get_fix_session_id(self, sender_comp_id, target_comp_id):
+        try:
+            cur = self.conn.cursor()
+            cur.execute("""
+                SELECT session_id FROM fix_sessions
+                WHERE sender_comp_id = %s AND target_comp_id = %s AND is_active;
+            """, (sender_comp_id, target_comp_id))
+            result = cur.fetchone()
+            cur.close()
+            return result[0] if result else None
+        except Exception as e:
+            logging.error(f"Failed to fetch FIX session {sender_comp_id}->{target_comp_id}: {e}")
+            return None
+
+    def update_account_trading_mode(self, account_id, trading_mode):
+        try:
+            cur = self.conn.cursor()
+            cur.execute("""
+                UPDATE accounts
+                SET trading_mode = %s
+                WHERE account_id = %s;
+            """, (trading_mode, account_id))
+            self.conn.commit()
+            cur.close()
+        except Exception as e:
+            logging.error(f"Failed to update account trading mode: {e}")
+
+
+    def get_all_positions(self):
+        # COPY streams the whole table in one round trip, much faster than a cursor at startup
+        try:
+            buffer = io.StringIO()
+            cur = self.conn.cursor()
+            cur.copy_expert("""
+                COPY (SELECT account_id, session_id, ticker, quantity, average_price, asset_class
+                      FROM positions) TO STDOUT WITH CSV
+            """, buffer)
+            cur.close()
+            buffer.seek(0)
+            positions = [
+                {
+                    'account_id': int(row[0]),
+                    'session_id': int(row[1]) if row[1] else None,
+                    'ticker': row[2],
+                    'quantity': int(row[3]),
+                    'average_price': float(row[4]) if row[4] else 0.0,
+                    'asset_class': row[5] or 'EQUITY'
+                }
+                for row in csv.reader(buffer)
+            ]
+            return positions
+        except Exception as e:
+            logging.error(f"Failed to fetch positions: {e}")
+            return []
+
+    def get_positions_updated_since(self, since):
+        try:
+            cur = self.conn.cursor(cursor_factory=RealDictCursor)
+            cur.execute("""
+                SELECT account_id, session_id, ticker, quantity, average_price, asset_class
+                FROM positions
+                WHERE last_updated >= %s;
+            """, (since,))
+            positions = cur.fetchall()
+            cur.close()
+            return positions
+        except Exception as e:
+            logging.error(f"Failed to fetch updated positions: {e}")
+            return []
+
+    def get_daily_volumes(self, updated_since=None):
+        # Totals are absolute, so replaying them on top of a snapshot is idempotent
+        try:
+            cur = self.conn.cursor()
+            if updated_since is None:
+                cur.execute("""
+                    SELECT session_id, COALESCE(SUM(filled_quantity), 0)
+                    FROM orders
+                    WHERE created_at >= CURRENT_DATE
+                    GROUP BY session_id;
+                """)
+            else:
+                cur.execute("""
+                    SELECT session_id, COALESCE(SUM(filled_quantity), 0)
+                    FROM orders
+                    WHERE created_at >= CURRENT_DATE
+                      AND session_id IN (
+                          SELECT DISTINCT session_id FROM orders WHERE updated_at >= %s
+                      )
+                    GROUP BY session_id;
+                """, (updated_since,))
+            volumes = {row[0]: int(row[1]) for row in cur.fetchall()}
+            cur.close()
+            return volumes
+        except Exception as e:
+            logging.error(f"Failed to fetch daily volumes: {e}")
+            return {}
@@ -0,0 +1,292 @@
+# src/decision_log.py
+
+import json
+import logging
+import mmap
+import os
+import pickle
+import threading
+import time
+from datetime import date
+import numpy as np
+
+# Fixed-width columns, one memory-mapped file each
+COLUMNS = {
+    'timestamp': np.float64,
+    'account_id': np.int64,
+    'session_id': np.int64,
+    'state_version': np.int64,
+    'passed': np.bool_,
+    'quantity': np.float64,
+    'price': np.float64,
+    'blob_offset': np.int64,
+    'blob_length': np.int64
+}
+LOG_VERSION = 1
+
+class DecisionLog:
+    def __init__(self, directory, capacity=1000000, mode='r+'):
+        self.directory = directory
+        self.mode = mode
+        self.lock = threading.Lock()
+        meta_path = os.path.join(directory, 'meta.json')
+
+        if mode == 'r+' and not os.path.exists(meta_path):
+            os.makedirs(directory, exist_ok=True)
+            self.write_meta({'version': LOG_VERSION, 'capacity': capacity})
+        with open(meta_path, 'r') as f:
+            meta = json.load(f)
+        if meta['version'] != LOG_VERSION:
+            raise ValueError(f"Unsupported decision log version {meta['version']} in {directory}")
+
+        self.capacity = meta['capacity']
+        self.count_map = np.memmap(self.path('count'), dtype=np.int64, mode=self.file_mode('count'), shape=(1,))
+        self.columns = {
+            name: np.memmap(self.path(name), dtype=dtype, mode=self.file_mode(name), shape=(self.capacity,))
+            for name, dtype in COLUMNS.items()
+        }
+        self.blobs = open(self.path('blobs'), 'ab' if mode == 'r+' else 'rb')
+        self.blob_size = os.path.getsize(self.path('blobs'))
+        if mode == 'r+':
+            self.validate()
+        self.blob_map = None
+        if mode == 'r' and self.blob_size:
+            self.blob_map = mmap.mmap(self.blobs.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def path(self, name):
+        return os.path.join(self.directory, f"{name}.bin")
+
+    def file_mode(self, name):
+        if self.mode == 'r':
+            return 'r'
+        return 'r+' if os.path.exists(self.path(name)) else 'w+'
+
+    def write_meta(self, meta):
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump(meta, f)
+
+    def __len__(self):
+        return int(self.count_map[0])
+
+    def validate(self):
+        # The columns and the count are shared mappings the kernel writes back on its own, the blobs
+        # are a plain file. After a machine crash rows can outlive their blobs, drop them so new
+        # blobs don't reuse their offsets.
+        count = len(self)
+        ends = self.columns['blob_offset'][:count] + self.columns['blob_length'][:count]
+        missing = np.flatnonzero(ends > self.blob_size)
+        if missing.size:
+            logging.warning(
+                f"Decision log {self.directory} has {count - missing[0]} rows without their inputs, dropped"
+            )
+            self.count_map[0] = missing[0]
+            self.count_map.flush()
+
+    def append(self, record, inputs):
+        blob = pickle.dumps(inputs, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock:
+            index = int(self.count_map[0])
+            if index >= self.capacity:
+                self.grow()
+            # The blob reaches the file before the count is published, a crashed process leaves no
+            # row whose inputs are still in its buffer
+            self.blobs.write(blob)
+            self.blobs.flush()
+            for name, value in record.items():
+                self.columns[name][index] = value
+            self.columns['blob_offset'][index] = self.blob_size
+            self.columns['blob_length'][index] = len(blob)
+            self.blob_size += len(blob)
+            # Publish the row last, a reader never sees a half-written decision
+            self.count_map[0] = index + 1
+
+    def grow(self):
+        self.flush()
+        self.capacity *= 2
+        for name, dtype in COLUMNS.items():
+            with open(self.path(name), 'r+b') as f:
+                f.truncate(self.capacity * np.dtype(dtype).itemsize)
+            self.columns[name] = np.memmap(self.path(name), dtype=dtype, mode='r+', shape=(self.capacity,))
+        self.write_meta({'version': LOG_VERSION, 'capacity': self.capacity})
+
+    def flush(self):
+        self.blobs.flush()
+        for column in self.columns.values():
+            column.flush()
+        self.count_map.flush()
+
+    def column(self, name):
+        return self.columns[name][:len(self)]
+
+    def inputs(self, index):
+        offset = int(self.columns['blob_offset'][index])
+        length = int(self.columns['blob_length'][index])
+        if self.blob_map is not None:
+            return pickle.loads(self.blob_map[offset:offset + length])
+        with open(self.path('blobs'), 'rb') as f:
+            f.seek(offset)
+            return pickle.loads(f.read(length))
+
+    def save_reference_data(self, reference_data, version=None):
+        # Replays use the reference data the live decisions saw, not today's tables. Each pipeline's
+        # data goes to a new numbered file, so a reload never rewrites what earlier records used.
+        if version is None:
+            versions = [
+                int(name.split('.')[1]) for name in os.listdir(self.directory)
+                if name.startswith('reference_data.') and name.count('.') == 2 and name.split('.')[1].isdigit()
+            ]
+            version = max(versions, default=0) + 1
+        with open(os.path.join(self.directory, f'reference_data.{version}.pkl'), 'wb') as f:
+            pickle.dump(reference_data, f, protocol=pickle.HIGHEST_PROTOCOL)
+        return version
+
+    def load_reference_data(self, version=None):
+        # Records written before reference data was versioned all share reference_data.pkl
+        name = 'reference_data.pkl' if version is None else f'reference_data.{version}.pkl'
+        path = os.path.join(self.directory, name)
+        if not os.path.exists(path):
+            return None
+        with open(path, 'rb') as f:
+            return pickle.load(f)
+
+
+class PriceCapture:
+    # Market data as the plugins see it. Between begin() and take() on a thread, every price
+    # handed out is kept, so the decision records the prices its checks actually used.
+    def __init__(self, market_data):
+        self.market_data = market_data
+        self.local = threading.local()
+
+    def __getattr__(self, name):
+        return getattr(self.market_data, name)
+
+    def get_last_trade(self, ticker):
+        price = self.market_data.get_last_trade(ticker)
+        prices = getattr(self.local, 'prices', None)
+        if prices is not None and ticker not in prices:
+            prices[ticker] = price
+        return price
+
+    def begin(self):
+        self.local.prices = {}
+
+    def take(self):
+        prices = getattr(self.local, 'prices', None)
+        self.local.prices = None
+        return prices or {}
+
+
+class DecisionRecorder:
+    def __init__(self, config, risk_state, market_data, path_suffix=''):
+        recorder_config = config.get('decision_log', {})
+        self.path = recorder_config.get('path', 'data/decisions')
+        self.path_suffix = path_suffix
+        self.capacity = recorder_config.get('capacity', 1000000)
+        self.lock = threading.Lock()
+        self.day = date.today()
+        self.directory = os.path.join(self.path, self.day.isoformat() + path_suffix)
+        self.log = DecisionLog(self.directory, self.capacity)
+        self.risk_state = risk_state
+        # RiskManagement hands this to the plugins in place of the market data itself
+        self.market_data = PriceCapture(market_data) if market_data is not None else None
+        self.flush_interval = recorder_config.get('flush_interval', 1.0)
+        self.local = threading.local()
+        self.instruments = None
+        self.references = {}  # version -> reference data of the current and the previous pipeline
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def warm_up(self, reference_data):
+        # Returns the version the pipeline built on this reference data records its decisions with
+        self.instruments = reference_data.get('instruments')
+        with self.lock:
+            version = self.log.save_reference_data(reference_data)
+            self.references[version] = reference_data
+            # Decisions still running on the previous pipeline may record its version
+            for old in sorted(self.references)[:-2]:
+                del self.references[old]
+        return version
+
+    def roll_over(self):
+        # A new directory each day, opened by the flush thread so no order waits on it. The reference
+        # data in use is saved into it under the same versions, so the pipelines running across
+        # midnight record versions that exist there.
+        today = date.today()
+        if today == self.day:
+            return
+        with self.lock:
+            directory = os.path.join(self.path, today.isoformat() + self.path_suffix)
+            log = DecisionLog(directory, self.capacity)
+            for version, reference_data in self.references.items():
+                log.save_reference_data(reference_data, version)
+            old = self.log
+            self.log, self.directory, self.day = log, directory, today
+        old.flush()
+        logging.info(f"Decision log rolled over to {directory}")
+
+    def begin(self, account, session_id):
+        # Called before the checks run. Keeps the state they are checked against, as one consistent
+        # view, and starts collecting the prices they look up.
+        self.local.state = None
+        if self.risk_state is not None:
+            try:
+                self.local.state = self.risk_state.get_decision_view(account['account_id'], session_id)
+            except Exception as e:
+                logging.error(f"Failed to capture risk state for the decision log: {e}")
+        if self.market_data is not None:
+            self.market_data.begin()
+
+    def record(self, order, account, session_id, risk_settings, plugin_results, passed, reference_version=None):
+        self.record_all([(order, plugin_results, passed)], account, session_id, risk_settings, reference_version)
+
+    def record_all(self, decisions, account, session_id, risk_settings, reference_version=None):
+        # decisions: (order, plugin_results, passed) for orders of this account checked after begin(),
+        # a basket records them all against the one view begin() captured
+        used = self.market_data.take() if self.market_data is not None else {}
+        state = getattr(self.local, 'state', None)
+        self.local.state = None
+        try:
+            state_version, positions, daily_volume, open_exposure = state or (0, [], 0, {})
+            # The prices the checks used; the latest known ones for tickers no check looked up
+            last_prices = getattr(self.market_data, 'last_prices', {})
+            for order, plugin_results, passed in decisions:
+                tickers = {order.get('ticker')} | {position['ticker'] for position in positions}
+                for leg in order.get('legs', []):
+                    tickers.add(leg.get('ticker'))
+                if self.instruments is not None:
+                    # Option greeks are priced off the underlying, replays need its price too
+                    instruments = [self.instruments.get(ticker) for ticker in tickers]
+                    tickers |= {instrument['underlying_ticker'] for instrument in instruments
+                                if instrument and instrument['underlying_ticker']}
+                prices = {ticker: last_prices.get(ticker) for ticker in tickers}
+                prices.update(used)
+                self.log.append(
+                    {
+                        'timestamp': time.time(),
+                        'account_id': account['account_id'],
+                        'session_id': session_id,
+                        'state_version': state_version,
+                        'passed': passed,
+                        'quantity': order.get('quantity') or 0.0,
+                        'price': order.get('price') or 0.0
+                    },
+                    {
+                        'order': order,
+                        'account': account,
+                        'session_id': session_id,
+                        'risk_settings': risk_settings,
+                        'positions': positions,
+                        'open_exposure': open_exposure,
+                        'daily_volume': daily_volume,
+                        'prices': prices,
+                        'plugin_results': plugin_results,
+                        'reference_version': reference_version
+                    }
+                )
+        except Exception as e:
+            logging.error(f"Failed to record risk decision: {e}")
+
+    def run(self):
+        while True:
+            time.sleep(self.flush_interval)
+            self.roll_over()
+            self.log.flush()
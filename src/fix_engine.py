@@ -3,6 +3,29 @@
 import quickfix
 import logging
 
+# FIX OrdStatus -> order store status
+ORDER_STATUSES = {
+    quickfix.OrdStatus_PARTIALLY_FILLED: 'PARTIALLY_FILLED',
+    quickfix.OrdStatus_FILLED: 'FILLED',
+    quickfix.OrdStatus_CANCELED: 'CANCELED',
+    quickfix.OrdStatus_PENDING_CANCEL: 'CANCEL_PENDING',
+    quickfix.OrdStatus_REJECTED: 'REJECTED'
+}
+SIDES = {
+    quickfix.Side_BUY: 'BUY',
+    quickfix.Side_SELL: 'SELL',
+    quickfix.Side_SELL_SHORT: 'SELL'
+}
+ORDER_TYPES = {
+    quickfix.OrdType_MARKET: 'MARKET',
+    quickfix.OrdType_LIMIT: 'LIMIT'
+}
+ASSET_CLASSES = {
+    quickfix.SecurityType_COMMON_STOCK: 'EQUITY',
+    quickfix.SecurityType_OPTION: 'OPTION',
+    quickfix.SecurityType_FUTURE: 'FUTURE'
+}
+
 class FIXEngine:
     def __init__(self, config_file, app):
         self.app = app
@@ -10,6 +33,7 @@ class FIXEngine:
         self.store_factory = quickfix.FileStoreFactory(self.settings)
         self.log_factory = quickfix.FileLogFactory(self.settings)
         self.application = FIXApplication(self)
+        self.session_ids = {}  # quickfix SessionID string -> fix_sessions.session_id
         self.acceptor = quickfix.SocketAcceptor(
             self.application,
             self.store_factory,
@@ -24,6 +48,18 @@ class FIXEngine:
     def stop(self):
         self.acceptor.stop()
         logging.info("FIX Engine stopped.")
+
+    def get_session_id(self, sessionID):
+        key = sessionID.toString()
+        session_id = self.session_ids.get(key)
+        if session_id is None:
+            # The client's CompID is the target of our side of the session
+            session_id = self.app.database.get_fix_session_id(
+                sessionID.getTargetCompID().getValue(), sessionID.getSenderCompID().getValue()
+            )
+            if session_id is not None:
+                self.session_ids[key] = session_id
+        return session_id
     
     def send_reject(self, order, session_id, reason):
         # Implement rejection logic
@@ -37,6 +73,11 @@ class FIXEngine:
         # Implement sending an Order Cancel Request via FIX
         pass
 
+    def send_order_cancel_requests(self, orders, session_id):
+        # Batch of cancels for one outbound session
+        for order in orders:
+            self.send_order_cancel_request(order)
+
     def send_new_order(self, order, session_id):
         # Implement sending a New Order Single message via FIX
         pass
@@ -56,6 +97,8 @@ class FIXApplication(quickfix.Application):
     
     def onLogon(self, sessionID):
         logging.info(f"Logon: {sessionID}")
+        # Resolved here so the first order doesn't pay for the lookup
+        self.fix_engine.get_session_id(sessionID)
     
     def onLogout(self, sessionID):
         logging.info(f"Logout: {sessionID}")
@@ -74,16 +117,57 @@ class FIXApplication(quickfix.Application):
     
     def on_message(self, message, sessionID):
         msg_type = message.getHeader().getField(quickfix.MsgType().getField())
-        if msg_type == quickfix.MsgType_OrderCancelReject:
+        if msg_type == quickfix.MsgType_NewOrderSingle:
+            self.handle_new_order(message, sessionID)
+        elif msg_type == quickfix.MsgType_OrderCancelReject:
             self.handle_order_cancel_reject(message, sessionID)
         elif msg_type == quickfix.MsgType_ExecutionReport:
             self.handle_execution_report(message, sessionID)
         # Handle other message types...
 
+    def handle_new_order(self, message, sessionID):
+        try:
+            order = {
+                'order_id': int(message.getField(quickfix.ClOrdID().getField())),
+                'account_id': int(message.getField(quickfix.Account().getField())),
+                'ticker': message.getField(quickfix.Symbol().getField()),
+                'side': SIDES[message.getField(quickfix.Side().getField())],
+                'quantity': int(float(message.getField(quickfix.OrderQty().getField()))),
+                'order_type': ORDER_TYPES.get(message.getField(quickfix.OrdType().getField()), 'LIMIT'),
+                'asset_class': 'EQUITY'
+            }
+            if message.isSetField(quickfix.Price().getField()):
+                order['price'] = float(message.getField(quickfix.Price().getField()))
+            if message.isSetField(quickfix.SecurityType().getField()):
+                order['asset_class'] = ASSET_CLASSES.get(
+                    message.getField(quickfix.SecurityType().getField()), 'EQUITY'
+                )
+        except (quickfix.FieldNotFound, KeyError, ValueError) as e:
+            logging.error(f"Malformed NewOrderSingle from {sessionID}: {e}")
+            return
+        session_id = self.fix_engine.get_session_id(sessionID)
+        if session_id is None:
+            logging.error(f"No fix_sessions row for {sessionID}, order {order['order_id']} rejected.")
+            self.fix_engine.send_reject(order, None, "Unknown FIX session.")
+            return
+        # Queued per session, fromApp returns without waiting for the risk checks
+        self.fix_engine.app.submit_order(order, session_id)
+
     def handle_order_cancel_reject(self, message, sessionID):
-        # Update order status in the database
-        pass
+        # The cancel was refused, the order is still working in the market
+        order_id = int(message.getField(quickfix.ClOrdID().getField()))
+        self.fix_engine.app.order_manager.handle_execution(order_id, 'SENT_TO_MARKET')
 
     def handle_execution_report(self, message, sessionID):
-        # Update order status in the database based on execution report
-        pass
+        # Update order status based on execution report
+        status = ORDER_STATUSES.get(message.getField(quickfix.OrdStatus().getField()))
+        if status is None:
+            return
+        order_id = int(message.getField(quickfix.ClOrdID().getField()))
+        filled_quantity = None
+        price = None
+        if message.isSetField(quickfix.LastQty().getField()):
+            filled_quantity = int(float(message.getField(quickfix.LastQty().getField())))
+        if message.isSetField(quickfix.LastPx().getField()):
+            price = float(message.getField(quickfix.LastPx().getField()))
+        self.fix_engine.app.order_manager.handle_execution(order_id, status, filled_quantity, price)
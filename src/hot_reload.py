@@ -0,0 +1,116 @@
+# src/hot_reload.py
+
+import importlib
+import logging
+import os
+import sys
+import threading
+import time
+import yaml
+import risk_plugins
+
+class HotReloader:
+    # Watches config.yml and the risk_plugins package, builds and warms a new pipeline
+    # on this thread and hands it to RiskManagement, which swaps it in with one assignment.
+    def __init__(self, config_file, risk_management, warmup, plugin_filter=None):
+        self.config_file = config_file
+        self.risk_management = risk_management
+        self.warmup = warmup
+        self.plugin_filter = plugin_filter
+        reload_config = self.read_config().get('hot_reload', {})
+        self.watch = reload_config.get('enabled', True)
+        self.interval = reload_config.get('interval', 1.0)
+        # Accounts and limits are changed in the database during the day, such as a trading mode
+        self.refresh_interval = reload_config.get('refresh_interval', 60)
+        # What the warm-up loaded, so the first timed refresh that finds the same limits does no work
+        pipeline = risk_management.pipeline
+        self.tables = None
+        if pipeline.reference_data is not None:
+            self.tables = self.get_tables(pipeline.reference_data, pipeline.risk_settings)
+        self.plugin_directory = list(risk_plugins.__path__)[0]
+        self.mtimes = self.scan()
+
+    def get_tables(self, reference_data, risk_settings):
+        # The loaded limits, compared between reloads; risk_settings indexed by session as the pipeline holds them
+        return (
+            {name: value for name, value in reference_data.items() if name not in ('instruments', 'option_analytics')},
+            risk_settings
+        )
+
+    def read_config(self):
+        with open(self.config_file, 'r') as f:
+            return yaml.safe_load(f)
+
+    def scan(self):
+        paths = [self.config_file] + [
+            os.path.join(self.plugin_directory, name)
+            for name in os.listdir(self.plugin_directory) if name.endswith('.py')
+        ]
+        mtimes = {}
+        for path in paths:
+            try:
+                mtimes[path] = os.stat(path).st_mtime_ns
+            except FileNotFoundError:
+                continue
+        return mtimes
+
+    def start(self):
+        if not self.watch and not self.refresh_interval:
+            return
+        threading.Thread(target=self.run, daemon=True).start()
+        if self.watch:
+            logging.info(f"Watching {self.config_file} and {self.plugin_directory} for risk changes")
+        if self.refresh_interval:
+            logging.info(f"Refreshing accounts and limits from the database every {self.refresh_interval}s")
+
+    def run(self):
+        last_refresh = time.monotonic()
+        while True:
+            time.sleep(self.interval)
+            mtimes = self.scan() if self.watch else self.mtimes
+            changed = [path for path, mtime in mtimes.items() if self.mtimes.get(path) != mtime]
+            # Limits and accounts live in the database, so they are also refreshed on a timer
+            refresh_due = self.refresh_interval and time.monotonic() - last_refresh >= self.refresh_interval
+            if not changed and not refresh_due:
+                continue
+            self.mtimes = mtimes
+            last_refresh = time.monotonic()
+            try:
+                self.reload(changed)
+            except Exception as e:
+                logging.error(f"Risk reload failed, keeping the current pipeline: {e}")
+
+    def reload(self, changed=()):
+        started = time.perf_counter()
+        self.reload_modules([path for path in changed if path.endswith('.py')])
+
+        config = self.read_config()
+        plugin_names = config.get('risk_management', {}).get('plugins')
+        if plugin_names and self.plugin_filter is not None:
+            plugin_names = [name for name in plugin_names if self.plugin_filter(name)]
+        reference_data, risk_settings, accounts = self.warmup.load_reference_data(config)
+
+        # A timed refresh that finds the same limits only updates the accounts, no new pipeline
+        tables = self.get_tables(reference_data, self.risk_management.index_risk_settings(risk_settings))
+        if changed or tables != self.tables:
+            # Risk settings are part of the pipeline, they switch together with the limits and plugins
+            if not self.risk_management.reload(plugin_names or None, reference_data, risk_settings):
+                return
+            self.tables = tables
+        self.warmup.risk_state.refresh_accounts(accounts)
+        logging.info(f"Risk reload finished in {time.perf_counter() - started:.3f}s, changed: {changed}")
+
+    def reload_modules(self, paths):
+        names = {os.path.splitext(os.path.basename(path))[0] for path in paths}
+        if 'base' in names:
+            # Every plugin subclasses the base class, they all need to pick up the new one
+            names |= {
+                name.split('.', 1)[1] for name in sys.modules
+                if name.startswith('risk_plugins.') and name != 'risk_plugins.base'
+            }
+        for name in sorted(names, key=lambda name: name != 'base'):
+            module = sys.modules.get(f"risk_plugins.{name}")
+            if module is None:
+                continue  # New plugin file, imported when the pipeline is built
+            importlib.reload(module)
+            logging.info(f"Reloaded risk plugin module {name}")
@@ -0,0 +1,130 @@
+# src/instrument_master.py
+
+import os
+from datetime import date
+import numpy as np
+
+INSTRUMENT_TYPES = ['EQUITY', 'OPTION', 'FUTURE']
+OPTION_TYPES = [None, 'CALL', 'PUT']
+TICKER_DTYPE = np.dtype('S50')  # instruments.ticker is VARCHAR(50)
+
+# One row per instrument, 30 bytes instead of a dict per ticker
+INSTRUMENT_DTYPE = np.dtype([
+    ('instrument_type', np.int8),
+    ('option_type', np.int8),
+    ('contract_size', np.float64),  # NaN when not set
+    ('strike_price', np.float64),
+    ('expiration_date', 'datetime64[D]'),
+    ('underlying_id', np.int32)  # -1 when there is no underlying in the master
+])
+
+class InstrumentMaster:
+    # Ticker ids are positions in the sorted ticker array, so interning is a binary search
+    # and both arrays can be memory-mapped and shared between processes as they are.
+    def __init__(self, tickers, columns):
+        self.tickers = tickers
+        self.columns = columns
+
+    @classmethod
+    def from_rows(cls, rows):
+        rows = sorted(rows, key=lambda row: row['ticker'])
+        tickers = np.array([row['ticker'].encode() for row in rows], dtype=TICKER_DTYPE)
+        columns = np.zeros(len(rows), dtype=INSTRUMENT_DTYPE)
+        master = cls(tickers, columns)
+        columns['instrument_type'] = [
+            INSTRUMENT_TYPES.index(row['instrument_type']) if row['instrument_type'] in INSTRUMENT_TYPES else -1
+            for row in rows
+        ]
+        columns['option_type'] = [
+            OPTION_TYPES.index(row['option_type']) if row['option_type'] in OPTION_TYPES else 0 for row in rows
+        ]
+        columns['contract_size'] = [
+            float(row['contract_size']) if row['contract_size'] is not None else np.nan for row in rows
+        ]
+        columns['strike_price'] = [
+            float(row['strike_price']) if row['strike_price'] is not None else np.nan for row in rows
+        ]
+        columns['expiration_date'] = [
+            np.datetime64(row['expiration_date'], 'D') if row['expiration_date'] is not None else np.datetime64('NaT')
+            for row in rows
+        ]
+        columns['underlying_id'] = master.ids_of([row['underlying_ticker'] or '' for row in rows])
+        return master
+
+    @classmethod
+    def open(cls, path):
+        # Read-only maps, every process that opens the same files shares the page cache
+        return cls(
+            np.load(path + '.tickers.npy', mmap_mode='r'),
+            np.load(path + '.columns.npy', mmap_mode='r')
+        )
+
+    @classmethod
+    def is_current(cls, path):
+        if not os.path.exists(path + '.columns.npy'):
+            return False
+        return date.fromtimestamp(os.path.getmtime(path + '.columns.npy')) == date.today()
+
+    def save(self, path):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        for suffix, array in (('.tickers', self.tickers), ('.columns', self.columns)):
+            np.save(path + suffix + '.tmp.npy', array)
+            os.replace(path + suffix + '.tmp.npy', path + suffix + '.npy')
+
+    def __len__(self):
+        return len(self.tickers)
+
+    def __contains__(self, ticker):
+        return self.id_of(ticker) >= 0
+
+    def id_of(self, ticker):
+        return int(self.ids_of([ticker])[0])
+
+    def ids_of(self, tickers):
+        keys = np.array([(ticker or '').encode() for ticker in tickers], dtype=TICKER_DTYPE)
+        if not len(self.tickers):
+            return np.full(len(keys), -1, dtype=np.int32)
+        positions = np.searchsorted(self.tickers, keys)
+        clipped = np.minimum(positions, len(self.tickers) - 1)
+        return np.where(self.tickers[clipped] == keys, clipped, -1).astype(np.int32)
+
+    def ticker_of(self, instrument_id):
+        return self.tickers[instrument_id].decode() if instrument_id >= 0 else None
+
+    def column(self, name, ids, missing):
+        # Vectorized lookup, unknown ids (-1) get the missing value
+        ids = np.asarray(ids)
+        values = self.columns[name][np.maximum(ids, 0)] if len(self.tickers) else np.zeros(len(ids))
+        return np.where(ids >= 0, values, missing)
+
+    def contract_sizes(self, ids):
+        return self.column('contract_size', ids, np.nan)
+
+    def strike_prices(self, ids):
+        return self.column('strike_price', ids, np.nan)
+
+    def contract_size(self, ticker):
+        value = self.contract_sizes([self.id_of(ticker)])[0]
+        return None if np.isnan(value) else float(value)
+
+    def strike_price(self, ticker):
+        value = self.strike_prices([self.id_of(ticker)])[0]
+        return None if np.isnan(value) else float(value)
+
+    def get(self, ticker):
+        instrument_id = self.id_of(ticker)
+        if instrument_id < 0:
+            return None
+        row = self.columns[instrument_id]
+        expiration_date = row['expiration_date']
+        return {
+            'ticker': ticker,
+            'instrument_type': INSTRUMENT_TYPES[row['instrument_type']] if row['instrument_type'] >= 0 else None,
+            'underlying_ticker': self.ticker_of(int(row['underlying_id'])),
+            'expiration_date': None if np.isnat(expiration_date) else expiration_date.astype(date),
+            'strike_price': None if np.isnan(row['strike_price']) else float(row['strike_price']),
+            'option_type': OPTION_TYPES[row['option_type']],
+            'contract_size': None if np.isnan(row['contract_size']) else int(row['contract_size'])
+        }
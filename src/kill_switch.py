@@ -0,0 +1,184 @@
+# src/kill_switch.py
+
+import argparse
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from multiprocessing.managers import BaseManager
+
+class KillSwitchManager(BaseManager):
+    pass
+
+
+class KillSwitch:
+    # database must be a connection of its own, trigger() and reopen() run on the listener's threads
+    def __init__(self, config, order_store, fix_engine, risk_state, database, audit=None, shard_router=None):
+        kill_switch_config = config.get('kill_switch', {})
+        self.order_store = order_store
+        self.fix_engine = fix_engine
+        self.risk_state = risk_state
+        self.database = database
+        self.audit = audit
+        self.shard_router = shard_router
+        self.batch_size = kill_switch_config.get('batch_size', 100)
+        self.confirm_timeout = kill_switch_config.get('confirm_timeout', 5.0)
+        self.lock = threading.Lock()
+        self.database_lock = threading.Lock()
+        self.closed_accounts = {}  # account_id -> trading mode before the kill switch
+        # (account_id, session_id, ticker) scopes no order may be sent for, None matches anything.
+        # Checked under the gate right before an order goes to the market, see OrderManager.
+        self.blocks = set()
+        self.gate = threading.Lock()
+
+    def is_blocked(self, order, session_id):
+        # Called with the gate held
+        return any(
+            (account_id is None or account_id == order['account_id'])
+            and (blocked_session is None or blocked_session == session_id)
+            and (ticker is None or ticker == order['ticker'])
+            for account_id, blocked_session, ticker in self.blocks
+        )
+
+    def trigger(self, account_id=None, session_id=None, ticker=None, close_trading=True):
+        if account_id is None and session_id is None and ticker is None:
+            raise ValueError("Kill switch needs an account, session or ticker.")
+        with self.lock:
+            start = time.monotonic()
+            # Block new flow first, then collect. An order past the risk checks is either sent before
+            # the block, and is in the order store to be cancelled, or sees the block and isn't sent.
+            accounts = set()
+            if close_trading:
+                with self.gate:
+                    self.blocks.add((account_id, session_id, ticker))
+                # Only a kill of a whole account closes it, a session or ticker kill blocks just that
+                if session_id is None and ticker is None:
+                    accounts = {account_id}
+                    self.set_trading_mode(account_id, 'CLOSED')
+            orders = self.order_store.open_orders(account_id, session_id, ticker)
+            blocked = time.monotonic()
+
+            # Fan out per outbound session, each in batches
+            sessions = {}
+            for order in orders:
+                sessions.setdefault(order['session_id'], []).append(order)
+            sent_at = {}
+            if sessions:
+                with ThreadPoolExecutor(max_workers=len(sessions)) as executor:
+                    for sent in executor.map(lambda item: self.cancel_session(*item), sessions.items()):
+                        sent_at.update(sent)
+            sent = time.monotonic()
+
+            closed = self.order_store.wait_until_closed(list(sent_at), self.confirm_timeout)
+            finished = time.monotonic()
+
+        # Persist the trading mode off the critical path, a restart must not reopen the account
+        with self.database_lock:
+            for affected in accounts:
+                self.database.update_account_trading_mode(affected, 'CLOSED')
+
+        latencies = sorted((closed[order_id] - sent_at[order_id]) * 1000 for order_id in closed)
+        report = {
+            'orders': len(sent_at),
+            'sessions': len(sessions),
+            'accounts_closed': sorted(accounts),
+            'blocked': close_trading,
+            'blocked_ms': (blocked - start) * 1000,
+            'sent_ms': (sent - start) * 1000,
+            'confirmed': len(closed),
+            'unconfirmed': sorted(order_id for order_id in sent_at if order_id not in closed),
+            'confirm_ms': {
+                'p50': latencies[len(latencies) // 2] if latencies else None,
+                'p99': latencies[int(len(latencies) * 0.99)] if latencies else None,
+                'max': latencies[-1] if latencies else None
+            },
+            'total_ms': (finished - start) * 1000
+        }
+        logging.warning(
+            f"Kill switch (account={account_id}, session={session_id}, ticker={ticker}): "
+            f"{report['confirmed']}/{report['orders']} cancels confirmed in {report['total_ms']:.1f} ms, "
+            f"accounts closed {report['accounts_closed']}"
+        )
+        return report
+
+    def cancel_session(self, session_id, orders):
+        sent_at = {}
+        for start in range(0, len(orders), self.batch_size):
+            batch = self.order_store.transition_all(
+                [order['order_id'] for order in orders[start:start + self.batch_size]], 'CANCEL_PENDING'
+            )
+            self.fix_engine.send_order_cancel_requests(batch, session_id)
+            now = time.monotonic()
+            for order in batch:
+                sent_at[order['order_id']] = now
+                if self.audit is not None:
+                    self.audit.record_order_status(
+                        order['order_id'], 'CANCEL_PENDING', order['account_id'], session_id, reason='KILL_SWITCH'
+                    )
+        return sent_at
+
+    def set_trading_mode(self, account_id, trading_mode):
+        previous = self.risk_state.set_trading_mode(account_id, trading_mode)
+        if previous is None:
+            logging.error(f"Account ID {account_id} not cached, trading mode not changed in memory.")
+        elif trading_mode == 'CLOSED':
+            self.closed_accounts.setdefault(account_id, previous)
+        if self.shard_router is not None:
+            self.shard_router.set_trading_mode(account_id, trading_mode)
+
+    def reopen(self, account_id, trading_mode=None):
+        # Back to the mode the account had before the kill switch, unless told otherwise
+        with self.lock:
+            trading_mode = trading_mode or self.closed_accounts.pop(account_id, 'NORMAL')
+            self.set_trading_mode(account_id, trading_mode)
+            with self.gate:
+                self.blocks.discard((account_id, None, None))
+        with self.database_lock:
+            self.database.update_account_trading_mode(account_id, trading_mode)
+        logging.warning(f"Account {account_id} reopened in trading mode {trading_mode}")
+        return trading_mode
+
+    def unblock(self, account_id=None, session_id=None, ticker=None):
+        # Lifts a session or ticker kill, held in memory only; a restart lifts it too
+        with self.gate:
+            self.blocks.discard((account_id, session_id, ticker))
+        logging.warning(f"Kill switch lifted (account={account_id}, session={session_id}, ticker={ticker})")
+
+
+def serve(kill_switch, host, port, authkey):
+    # Operators reach the running gateway through this listener, see the command below
+    KillSwitchManager.register('get_kill_switch', callable=lambda: kill_switch)
+    manager = KillSwitchManager(address=(host, port), authkey=authkey.encode())
+    server = manager.get_server()
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Kill switch listening on {host}:{port}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Cancel every open order for an account, session or ticker")
+    parser.add_argument('--account', type=int)
+    parser.add_argument('--session', type=int)
+    parser.add_argument('--ticker')
+    parser.add_argument('--keep-trading', action='store_true', help="Cancel orders without blocking new ones")
+    parser.add_argument('--reopen', type=int, metavar='ACCOUNT', help="Restore trading for an account")
+    parser.add_argument('--unblock', action='store_true', help="Lift a session or ticker kill")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6391)
+    parser.add_argument('--authkey', default=os.environ.get('KILL_SWITCH_AUTHKEY'))
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error("an authkey is required, pass --authkey or set KILL_SWITCH_AUTHKEY")
+
+    KillSwitchManager.register('get_kill_switch')
+    manager = KillSwitchManager(address=(args.host, args.port), authkey=args.authkey.encode())
+    manager.connect()
+    kill_switch = manager.get_kill_switch()
+    if args.reopen is not None:
+        print(f"Account {args.reopen} reopened in trading mode {kill_switch.reopen(args.reopen)}")
+    elif args.unblock:
+        kill_switch.unblock(args.account, args.session, args.ticker)
+    else:
+        report = kill_switch.trigger(args.account, args.session, args.ticker, not args.keep_trading)
+        print(json.dumps(report, indent=2))
@@ -0,0 +1,373 @@
+# src/limit_reservations.py
+
+import argparse
+import logging
+import os
+import threading
+from datetime import date
+from multiprocessing.managers import BaseManager
+
+# Grants up to the requested amount without exceeding the cluster-wide total
+REDIS_LEASE_SCRIPT = """
+local total = tonumber(ARGV[1])
+local amount = tonumber(ARGV[2])
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local grant = math.min(amount, total - used)
+if grant <= 0 then
+    return '0'
+end
+redis.call('INCRBYFLOAT', KEYS[1], grant)
+if string.match(KEYS[1], '^verges:lease:%d%d%d%d%-') then
+    -- Daily budgets, the key of the next day starts from zero
+    redis.call('EXPIRE', KEYS[1], 172800)
+end
+return tostring(grant)
+"""
+
+# Never takes the usage below zero, a release can't create budget nobody leased
+REDIS_RELEASE_SCRIPT = """
+local used = tonumber(redis.call('GET', KEYS[1]) or '0')
+local left = math.max(used - tonumber(ARGV[1]), 0)
+redis.call('SET', KEYS[1], tostring(left), 'KEEPTTL')
+return tostring(left)
+"""
+
+class RedisCoordinator:
+    def __init__(self, url):
+        import redis  # Only needed when Redis is the coordinator
+        self.client = redis.Redis.from_url(url)
+        self.lease_script = self.client.register_script(REDIS_LEASE_SCRIPT)
+        self.release_script = self.client.register_script(REDIS_RELEASE_SCRIPT)
+
+    def lease(self, key, total, amount):
+        return float(self.lease_script(keys=[f"verges:lease:{key}"], args=[total, amount]))
+
+    def release(self, key, amount):
+        if amount > 0:
+            self.release_script(keys=[f"verges:lease:{key}"], args=[amount])
+
+    def reconcile(self, key, used):
+        self.client.set(f"verges:lease:{key}", used)
+
+
+class LeaseLedger:
+    # Lives in the stand-in coordinator process, one instance shared by every node
+    def __init__(self):
+        self.used = {}
+        self.lock = threading.Lock()
+
+    def lease(self, key, total, amount):
+        with self.lock:
+            used = self.used.get(key, 0.0)
+            grant = min(amount, total - used)
+            if grant <= 0:
+                return 0.0
+            self.used[key] = used + grant
+            return grant
+
+    def release(self, key, amount):
+        with self.lock:
+            self.used[key] = max(self.used.get(key, 0.0) - amount, 0.0)
+
+    def reconcile(self, key, used):
+        with self.lock:
+            self.used[key] = used
+
+
+class LeaseManager(BaseManager):
+    pass
+
+
+class LocalCoordinator:
+    def __init__(self, host, port, authkey):
+        LeaseManager.register('get_ledger')
+        self.manager = LeaseManager(address=(host, port), authkey=authkey.encode())
+        self.manager.connect()
+        self.ledger = self.manager.get_ledger()
+        # Proxies are not thread-safe, the refill thread and the order path share this one
+        self.lock = threading.Lock()
+
+    def lease(self, key, total, amount):
+        with self.lock:
+            return self.ledger.lease(key, total, amount)
+
+    def release(self, key, amount):
+        with self.lock:
+            self.ledger.release(key, amount)
+
+    def reconcile(self, key, used):
+        with self.lock:
+            self.ledger.reconcile(key, used)
+
+
+def get_authkey(section_config, variable):
+    # From the config, or the environment when the config leaves it out or holds the placeholder.
+    # There is no default, anyone who knows a default key could call the listener.
+    authkey = section_config.get('authkey')
+    if not authkey or str(authkey).startswith('${'):
+        authkey = os.environ.get(variable)
+    if not authkey:
+        raise RuntimeError(f"No authkey configured, set {variable} or authkey in config.yml")
+    return str(authkey)
+
+
+def serve(host, port, authkey):
+    ledger = LeaseLedger()
+    LeaseManager.register('get_ledger', callable=lambda: ledger)
+    manager = LeaseManager(address=(host, port), authkey=authkey.encode())
+    logging.info(f"Limit lease coordinator listening on {host}:{port}")
+    manager.get_server().serve_forever()
+
+
+class LimitReservations:
+    def __init__(self, coordinator, lease_fraction=0.1, low_watermark=0.5, refill_interval=0.05, risk_state=None):
+        self.coordinator = coordinator
+        self.risk_state = risk_state
+        self.lease_fraction = lease_fraction
+        self.low_watermark = low_watermark
+        self.refill_interval = refill_interval
+        self.leases = {}  # key -> {'total': cluster-wide limit, 'remaining': local slice}
+        self.orders = {}  # order_id -> [account_id, session_id, ticker, side, remaining quantity, [(key, amount per unit, daily)]]
+        # Values orders in the units the checks use, RiskManagement sets its get_order_notional
+        self.notional = lambda order: float(order.get('price') or 0.0) * order['quantity']
+        self.lock = threading.Lock()
+        self.refill_keys = set()
+        self.refill_event = threading.Event()
+        self.reference_data = None
+        threading.Thread(target=self.refill, daemon=True).start()
+
+    def warm_up(self, reference_data):
+        self.reference_data = reference_data
+
+    def check(self, order, account, session_id, risk_settings):
+        # Same contract as a risk plugin, but consumes budget so it runs after every plugin passed
+        try:
+            budgets = self.get_budgets(order, account, session_id, risk_settings)
+            reserved = []
+            for key, total, amount, daily in budgets:
+                if not self.reserve(key, total, amount):
+                    for reserved_key, reserved_amount in reserved:
+                        self.release(reserved_key, reserved_amount)
+                    return False, f"Cluster-wide budget exhausted for {key.split(':')[-1]}."
+                reserved.append((key, amount))
+            if budgets and order.get('order_id') is not None and order['quantity']:
+                # Kept per order so cancels, rejects and fills can give the budget back
+                with self.lock:
+                    self.orders[order['order_id']] = [
+                        account['account_id'], session_id, order['ticker'], order['side'], order['quantity'],
+                        [(key, amount / order['quantity'], daily) for key, _, amount, daily in budgets]
+                    ]
+            return True, ""
+        except Exception as e:
+            logging.error(f"Limit reservation error: {e}")
+            return False, "Error in limit reservation"
+
+    def get_budgets(self, order, account, session_id, risk_settings):
+        # (key, total, amount, daily): volume is per trading day, positions and exposure carry over
+        prefix = f"{account['account_id']}:{session_id}"
+        order_value = self.notional(order)
+        budgets = []
+        if risk_settings.get('max_daily_volume') is not None:
+            budgets.append((
+                f"{date.today().isoformat()}:{prefix}:max_daily_volume",
+                float(risk_settings['max_daily_volume']), order['quantity'], True
+            ))
+        if risk_settings.get('max_position_value') is not None:
+            budgets.append((f"{prefix}:max_position_value", float(risk_settings['max_position_value']), order_value, False))
+        if self.reference_data is not None:
+            asset_class = order.get('asset_class', 'EQUITY')
+            limits = self.reference_data['notional_limits'].get((session_id, asset_class))
+            if limits and limits['max_total_notional'] is not None:
+                budgets.append((
+                    f"{prefix}:{asset_class}:max_total_notional", limits['max_total_notional'], order_value, False
+                ))
+        return budgets
+
+    def reserve(self, key, total, amount):
+        lease_size = total * self.lease_fraction
+        with self.lock:
+            lease = self.leases.setdefault(key, {'total': total, 'remaining': 0.0})
+            lease['total'] = total
+            if lease['remaining'] >= amount:
+                # Common case: decrement the local slice, no network hop
+                lease['remaining'] -= amount
+                if lease['remaining'] < lease_size * self.low_watermark:
+                    self.refill_keys.add(key)
+                    self.refill_event.set()
+                return True
+
+        # Local slice exhausted: one synchronous top-up before rejecting
+        granted = self.coordinator.lease(key, total, max(amount, lease_size))
+        with self.lock:
+            lease['remaining'] += granted
+            if lease['remaining'] >= amount:
+                lease['remaining'] -= amount
+                return True
+        return False
+
+    def release(self, key, amount):
+        with self.lock:
+            lease = self.leases.get(key)
+            if lease is not None:
+                lease['remaining'] += amount
+                return
+        # No slice of it here, as for an order from before a restart, the coordinator takes it back
+        try:
+            self.coordinator.release(key, amount)
+        except Exception as e:
+            logging.error(f"Failed to release {amount} of lease {key}: {e}")
+
+    def release_order(self, order_id, quantity=None):
+        # Without a quantity the working remainder goes back (cancel, reject, no market price).
+        # A fill converts that much into a position: the day's volume stays used, and so does
+        # the position and notional budget, unless the fill closed out part of a position.
+        with self.lock:
+            entry = self.orders.get(order_id)
+            if entry is None:
+                return
+            account_id, session_id, ticker, side, remaining, budgets = entry
+            released = remaining if quantity is None else min(quantity, remaining)
+            entry[4] = remaining - released
+            if entry[4] <= 0:
+                del self.orders[order_id]
+        if quantity is None:
+            amounts = [(key, unit * released) for key, unit, _ in budgets]
+        else:
+            closed, closed_value = self.get_closed(account_id, session_id, ticker, side, released)
+            if not closed:
+                return
+            # The closing part never became a position, and the position it closed is gone
+            amounts = [(key, unit * closed + closed_value) for key, unit, daily in budgets if not daily]
+        for key, amount in amounts:
+            self.release(key, amount)
+
+    def get_closed(self, account_id, session_id, ticker, side, quantity):
+        # Quantity of a fill that reduced an existing position and that part's cost, read after the fill
+        if self.risk_state is None:
+            return 0, 0.0
+        position = next((
+            p for p in self.risk_state.get_positions(account_id)
+            if p['session_id'] == session_id and p['ticker'] == ticker
+        ), None)
+        if position is None:
+            return 0, 0.0
+        signed_quantity = quantity if side == 'BUY' else -quantity
+        before = position['quantity'] - signed_quantity
+        if before == 0 or (before > 0) == (signed_quantity > 0):
+            return 0, 0.0
+        closed = min(quantity, abs(before))
+        return closed, self.notional({
+            'ticker': ticker, 'side': side, 'quantity': closed, 'price': position['average_price'],
+            'asset_class': position.get('asset_class', 'EQUITY')
+        })
+
+    def rebuild(self, orders, get_risk_settings):
+        # Startup: the working orders in the order store get their entries back, so their fills and
+        # cancels give budget back. Each position and notional budget is then set to what the
+        # positions and working orders hold, dropping what a crash or an unseen fill left behind.
+        # Budgets are keyed by session, only the gateway the session trades through uses them.
+        today = date.today().isoformat()
+        used = {}
+        with self.lock:
+            self.orders.clear()
+        for order in orders:
+            remaining = order['quantity'] - (order.get('filled_quantity') or 0)
+            risk_settings = get_risk_settings(order['session_id'])
+            if remaining <= 0 or not risk_settings:
+                continue
+            working = dict(order, quantity=remaining)
+            budgets = self.get_budgets(working, {'account_id': order['account_id']}, order['session_id'], risk_settings)
+            # The day's volume of an order from an earlier day was taken from that day's budget
+            budgets = [budget for budget in budgets if not budget[3] or str(order.get('created_at', ''))[:10] == today]
+            with self.lock:
+                self.orders[order['order_id']] = [
+                    order['account_id'], order['session_id'], order['ticker'], order['side'], remaining,
+                    [(key, amount / remaining, daily) for key, _, amount, daily in budgets]
+                ]
+            for key, _, amount, daily in budgets:
+                if not daily:
+                    used[key] = used.get(key, 0.0) + amount
+        positions = self.risk_state.get_all_positions() if self.risk_state is not None else []
+        for position in positions:
+            risk_settings = get_risk_settings(position['session_id']) if position['session_id'] is not None else None
+            if not risk_settings:
+                continue
+            held = {
+                'ticker': position['ticker'], 'side': 'BUY' if position['quantity'] >= 0 else 'SELL',
+                'quantity': abs(position['quantity']), 'price': position['average_price'],
+                'asset_class': position['asset_class']
+            }
+            for key, _, amount, daily in self.get_budgets(held, position, position['session_id'], risk_settings):
+                if not daily:
+                    used[key] = used.get(key, 0.0) + amount
+        for key, amount in used.items():
+            try:
+                self.coordinator.reconcile(key, amount)
+            except Exception as e:
+                logging.error(f"Failed to reconcile lease {key}: {e}")
+        logging.info(f"Limit reservations rebuilt for {len(self.orders)} working orders, {len(used)} budgets reconciled")
+
+    def refill(self):
+        while True:
+            self.refill_event.wait(self.refill_interval)
+            self.refill_event.clear()
+            with self.lock:
+                keys = list(self.refill_keys)
+                self.refill_keys.clear()
+            for key in keys:
+                try:
+                    with self.lock:
+                        lease = self.leases[key]
+                        wanted = lease['total'] * self.lease_fraction - lease['remaining']
+                        total = lease['total']
+                    if wanted <= 0:
+                        continue
+                    granted = self.coordinator.lease(key, total, wanted)
+                    with self.lock:
+                        lease['remaining'] += granted
+                except Exception as e:
+                    logging.error(f"Failed to refill lease {key}: {e}")
+
+    def return_leases(self):
+        # Hand unused slices back so other nodes can use them
+        with self.lock:
+            leases = [(key, lease['remaining']) for key, lease in self.leases.items()]
+            self.leases.clear()
+        for key, remaining in leases:
+            try:
+                self.coordinator.release(key, remaining)
+            except Exception as e:
+                logging.error(f"Failed to return lease {key}: {e}")
+
+
+def create_limit_reservations(config, risk_state=None):
+    reservation_config = config.get('limit_reservations', {})
+    if not reservation_config.get('enabled', False):
+        return None
+    if reservation_config.get('coordinator', 'local') == 'redis':
+        coordinator = RedisCoordinator(reservation_config['redis_url'])
+    else:
+        coordinator = LocalCoordinator(
+            reservation_config.get('host', '127.0.0.1'),
+            reservation_config.get('port', 6390),
+            get_authkey(reservation_config, 'LEASE_COORDINATOR_AUTHKEY')
+        )
+    return LimitReservations(
+        coordinator,
+        lease_fraction=reservation_config.get('lease_fraction', 0.1),
+        low_watermark=reservation_config.get('low_watermark', 0.5),
+        refill_interval=reservation_config.get('refill_interval', 0.05),
+        risk_state=risk_state
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stand-in limit lease coordinator")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=6390)
+    parser.add_argument('--authkey', default=os.environ.get('LEASE_COORDINATOR_AUTHKEY'))
+    args = parser.parse_args()
+    if not args.authkey:
+        parser.error("an authkey is required, pass --authkey or set LEASE_COORDINATOR_AUTHKEY")
+    logging.basicConfig(level=logging.INFO)
+    serve(args.host, args.port, args.authkey)
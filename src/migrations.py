@@ -0,0 +1,250 @@
+# src/migrations.py
+
+import argparse
+import gzip
+import logging
+import os
+import re
+import time
+from datetime import date, datetime, timedelta
+import psycopg2
+import yaml
+from dotenv import load_dotenv
+
+WORKING_STATUSES = ('OPEN', 'SENT_TO_MARKET', 'PARTIALLY_FILLED', 'CANCEL_PENDING')
+DAYS_AHEAD = 7
+
+def partition_name(day):
+    return f"orders_p{day:%Y%m%d}"
+
+def is_partitioned(cur):
+    cur.execute("SELECT relkind FROM pg_class WHERE oid = 'orders'::regclass;")
+    return cur.fetchone()[0] == 'p'
+
+def create_partitions(cur, first_day, last_day):
+    day = first_day
+    while day <= last_day:
+        cur.execute(f"""
+            CREATE TABLE IF NOT EXISTS {partition_name(day)} PARTITION OF orders
+            FOR VALUES FROM (%s) TO (%s);
+        """, (day, day + timedelta(days=1)))
+        day += timedelta(days=1)
+
+def partition_orders(cur):
+    # Rebuilds orders as one partition per day of created_at; order ids and the sequence are kept.
+    # Rows are copied in one transaction, so run it outside trading hours.
+    if is_partitioned(cur):
+        return
+    cur.execute("ALTER TABLE orders RENAME TO orders_unpartitioned;")
+    cur.execute("ALTER TABLE orders_unpartitioned RENAME CONSTRAINT orders_pkey TO orders_unpartitioned_pkey;")
+    cur.execute("""
+        UPDATE orders_unpartitioned
+        SET created_at = COALESCE(updated_at, CURRENT_TIMESTAMP)
+        WHERE created_at IS NULL;
+    """)
+    cur.execute("""
+        CREATE TABLE orders (LIKE orders_unpartitioned INCLUDING DEFAULTS INCLUDING CONSTRAINTS)
+        PARTITION BY RANGE (created_at);
+    """)
+    cur.execute("ALTER TABLE orders ALTER COLUMN created_at SET NOT NULL;")
+    # The partition key has to be part of every unique constraint
+    cur.execute("ALTER TABLE orders ADD PRIMARY KEY (order_id, created_at);")
+    cur.execute("ALTER TABLE orders ADD FOREIGN KEY (account_id) REFERENCES accounts(account_id);")
+    cur.execute("ALTER TABLE orders ADD FOREIGN KEY (session_id) REFERENCES fix_sessions(session_id);")
+    cur.execute("ALTER SEQUENCE orders_order_id_seq OWNED BY orders.order_id;")
+    # Catches rows outside the created partitions instead of failing the insert
+    cur.execute("CREATE TABLE orders_default PARTITION OF orders DEFAULT;")
+
+    cur.execute("SELECT MIN(created_at)::date FROM orders_unpartitioned;")
+    first_day = cur.fetchone()[0] or date.today()
+    create_partitions(cur, first_day, date.today() + timedelta(days=DAYS_AHEAD))
+    cur.execute("INSERT INTO orders SELECT * FROM orders_unpartitioned;")
+    cur.execute("DROP TABLE orders_unpartitioned;")
+
+MIGRATIONS = [
+    (1, "Add orders.filled_quantity", [
+        "ALTER TABLE orders ADD COLUMN IF NOT EXISTS filled_quantity INTEGER DEFAULT 0;"
+    ]),
+    (2, "Partition orders by day", partition_orders),
+    (3, "Indexes for the order and position queries", [
+        # Database.get_open_orders, only the small OPEN set is indexed
+        """
+        CREATE INDEX IF NOT EXISTS orders_open_match_idx
+        ON orders (account_id, ticker, side, price) WHERE status = 'OPEN';
+        """,
+        # Database.get_all_open_orders at order store recovery
+        """
+        CREATE INDEX IF NOT EXISTS orders_working_idx
+        ON orders (status) WHERE status IN ('OPEN', 'SENT_TO_MARKET', 'PARTIALLY_FILLED', 'CANCEL_PENDING');
+        """,
+        # Database.get_daily_volumes and VolumeLimitCheck, answered from the index alone
+        """
+        CREATE INDEX IF NOT EXISTS orders_session_volume_idx
+        ON orders (session_id, created_at) INCLUDE (filled_quantity);
+        """,
+        # Sessions touched since a snapshot, in the incremental get_daily_volumes
+        """
+        CREATE INDEX IF NOT EXISTS orders_updated_at_idx
+        ON orders (updated_at) INCLUDE (session_id);
+        """,
+        # Database.get_positions_updated_since
+        """
+        CREATE INDEX IF NOT EXISTS positions_last_updated_idx
+        ON positions (last_updated);
+        """
+    ]),
+    (4, "Order store replication checkpoints", [
+        """
+        CREATE TABLE IF NOT EXISTS oms_checkpoints (
+            wal VARCHAR(100) PRIMARY KEY,
+            position INTEGER NOT NULL
+        );
+        """
+    ])
+]
+
+def migrate(conn, target=None):
+    cur = conn.cursor()
+    cur.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version INTEGER PRIMARY KEY,
+            description TEXT,
+            applied_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+        );
+    """)
+    conn.commit()
+    cur.execute("SELECT version FROM schema_migrations;")
+    applied = {row[0] for row in cur.fetchall()}
+
+    for version, description, steps in MIGRATIONS:
+        if version in applied or (target is not None and version > target):
+            continue
+        started = time.perf_counter()
+        try:
+            # One transaction per migration, a failure leaves the schema at the previous version
+            if callable(steps):
+                steps(cur)
+            else:
+                for statement in steps:
+                    cur.execute(statement)
+            cur.execute(
+                "INSERT INTO schema_migrations (version, description) VALUES (%s, %s);", (version, description)
+            )
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            logging.error(f"Migration {version} ({description}) failed, rolled back.")
+            raise
+        logging.info(f"Applied migration {version} ({description}) in {time.perf_counter() - started:.1f}s")
+    cur.close()
+
+def list_partitions(cur):
+    # (name, upper bound) of every orders partition, the upper bound is None for the default partition
+    cur.execute("""
+        SELECT c.relname, pg_get_expr(c.relpartbound, c.oid)
+        FROM pg_inherits i
+        JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'orders'::regclass
+        ORDER BY c.relname;
+    """)
+    partitions = []
+    for name, bound in cur.fetchall():
+        match = re.search(r"TO \('([^']+)'\)", bound)
+        upper = datetime.strptime(match.group(1)[:10], '%Y-%m-%d').date() if match else None
+        partitions.append((name, upper))
+    return partitions
+
+def ensure_partitions(conn, days_ahead=DAYS_AHEAD):
+    # Creates the coming days' partitions. Rows that went to orders_default while the job was not
+    # running are moved to partitions of their own days; a partition can't be created over them.
+    cur = conn.cursor()
+    try:
+        if is_partitioned(cur):
+            cur.execute("SELECT DISTINCT created_at::date FROM orders_default ORDER BY 1;")
+            stranded = [row[0] for row in cur.fetchall()]
+            if stranded:
+                cur.execute("ALTER TABLE orders DETACH PARTITION orders_default;")
+                for day in stranded:
+                    create_partitions(cur, day, day)
+            create_partitions(cur, date.today(), date.today() + timedelta(days=days_ahead))
+            if stranded:
+                cur.execute("""
+                    WITH moved AS (DELETE FROM orders_default RETURNING *)
+                    INSERT INTO orders SELECT * FROM moved;
+                """)
+                cur.execute("ALTER TABLE orders ATTACH PARTITION orders_default DEFAULT;")
+                logging.info(f"Moved orders from orders_default into partitions for {len(stranded)} days")
+        conn.commit()
+    except Exception as e:
+        # Inserts keep going to orders_default, the next run tries again
+        conn.rollback()
+        logging.error(f"Failed to create orders partitions: {e}")
+        return False
+    finally:
+        cur.close()
+    return True
+
+def archive_orders(conn, retention_days, export_path=None):
+    # Detaches whole days older than the retention; no row-by-row deletes on the live table
+    cur = conn.cursor()
+    if not is_partitioned(cur):
+        logging.error("orders is not partitioned, run the migrations first.")
+        cur.close()
+        return []
+    cutoff = date.today() - timedelta(days=retention_days)
+    archived = []
+    for name, upper in list_partitions(cur):
+        if upper is None or upper > cutoff:
+            continue
+        export_file = os.path.join(export_path, f"{name}.csv.gz") if export_path else None
+        try:
+            cur.execute(f"SELECT COUNT(*) FROM {name} WHERE status IN %s;", (WORKING_STATUSES,))
+            working = cur.fetchone()[0]
+            if working:
+                conn.rollback()
+                logging.warning(f"Not archiving {name}, it still has {working} working orders.")
+                continue
+            # Detach, export and drop are one transaction per day, a failure leaves the day attached
+            cur.execute(f"ALTER TABLE orders DETACH PARTITION {name};")
+            if export_file:
+                os.makedirs(export_path, exist_ok=True)
+                with gzip.open(export_file, 'wt') as f:
+                    cur.copy_expert(f"COPY {name} TO STDOUT WITH CSV HEADER", f)
+                cur.execute(f"DROP TABLE {name};")
+            else:
+                cur.execute("CREATE SCHEMA IF NOT EXISTS archive;")
+                cur.execute(f"ALTER TABLE {name} SET SCHEMA archive;")
+            conn.commit()
+        except Exception as e:
+            # The other days are still archived, this one is tried again on the next run
+            conn.rollback()
+            if export_file and os.path.isfile(export_file):
+                os.remove(export_file)
+            logging.error(f"Failed to archive orders partition {name}: {e}")
+            continue
+        archived.append(name)
+        logging.info(f"Archived orders partition {name}")
+    cur.close()
+    return archived
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply schema migrations and archive old order partitions")
+    parser.add_argument('command', choices=['migrate', 'archive'])
+    parser.add_argument('--config', default='config/config.yml')
+    parser.add_argument('--target', type=int, help="Stop at this migration version")
+    args = parser.parse_args()
+
+    load_dotenv()
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    with open(args.config, 'r') as f:
+        config = yaml.safe_load(f)
+    partitions_config = config.get('orders_partitions', {})
+    conn = psycopg2.connect(**config['database'])
+    if args.command == 'migrate':
+        migrate(conn, args.target)
+    else:
+        # Run daily: creates the coming days' partitions, then archives the old ones
+        ensure_partitions(conn, partitions_config.get('days_ahead', DAYS_AHEAD))
+        archive_orders(conn, partitions_config.get('retention_days', 7), partitions_config.get('export_path'))
+    conn.close()
@@ -0,0 +1,122 @@
+# src/option_analytics.py
+
+import math
+from datetime import date
+import numpy as np
+from src.instrument_master import INSTRUMENT_TYPES, OPTION_TYPES
+
+OPTION = INSTRUMENT_TYPES.index('OPTION')
+CALL = OPTION_TYPES.index('CALL')
+MIN_YEARS = 1.0 / (365.0 * 24.0)  # an hour, so expiring options keep a finite gamma
+
+def norm_pdf(x):
+    return np.exp(-0.5 * x * x) / math.sqrt(2.0 * math.pi)
+
+def norm_cdf(x):
+    # Abramowitz-Stegun 26.2.17, absolute error below 7.5e-8
+    t = 1.0 / (1.0 + 0.2316419 * np.abs(x))
+    poly = t * (0.319381530 + t * (-0.356563782 + t * (1.781477937 + t * (-1.821255978 + t * 1.330274429))))
+    upper = 1.0 - norm_pdf(x) * poly
+    return np.where(x >= 0, upper, 1.0 - upper)
+
+def black_scholes_greeks(spot, strike, years, volatility, rate, is_call):
+    years = np.maximum(years, MIN_YEARS)
+    sqrt_years = np.sqrt(years)
+    d1 = (np.log(spot / strike) + (rate + 0.5 * volatility * volatility) * years) / (volatility * sqrt_years)
+    delta = np.where(is_call, norm_cdf(d1), norm_cdf(d1) - 1.0)
+    gamma = norm_pdf(d1) / (spot * volatility * sqrt_years)
+    vega = spot * norm_pdf(d1) * sqrt_years / 100.0  # per volatility point
+    return delta, gamma, vega
+
+
+class OptionAnalytics:
+    def __init__(self, instruments, config=None, valuation_date=None):
+        analytics_config = (config or {}).get('option_analytics', {})
+        self.instruments = instruments
+        self.volatility = analytics_config.get('volatility', 0.3)
+        self.volatilities = analytics_config.get('volatilities', {})  # per underlying ticker
+        self.rate = analytics_config.get('rate', 0.0)
+        self.bucket_size = analytics_config.get('bucket_size', 0.005)  # relative move that invalidates a chain
+        # Rolls to the new day in a live process; recorded copies are pinned, so a replay on a
+        # later day values the options the way the live check did
+        self.valuation_date = np.datetime64(valuation_date or date.today(), 'D')
+        self.pinned = valuation_date is not None
+
+        # Option ids grouped by underlying, each chain sorted by id
+        columns = instruments.columns
+        option_ids = np.nonzero(columns['instrument_type'] == OPTION)[0].astype(np.int32)
+        underlying_ids = columns['underlying_id'][option_ids]
+        order = np.argsort(underlying_ids, kind='stable')
+        option_ids, underlying_ids = option_ids[order], underlying_ids[order]
+        starts = np.flatnonzero(np.r_[True, underlying_ids[1:] != underlying_ids[:-1]]) if len(option_ids) else []
+        bounds = list(starts) + [len(option_ids)]
+        self.chains = {
+            int(underlying_ids[start]): option_ids[start:end] for start, end in zip(bounds[:-1], bounds[1:])
+        }
+        self.cache = {}  # underlying_id -> (price bucket, delta, gamma, vega) for the whole chain
+
+    def __getstate__(self):
+        # Greeks are cheap to rebuild, don't carry them into recorded reference data
+        state = dict(self.__dict__)
+        state['cache'] = {}
+        state['pinned'] = True
+        return state
+
+    def roll_valuation_date(self):
+        today = np.datetime64(date.today(), 'D')
+        if not self.pinned and today != self.valuation_date:
+            # Time to expiry changed for every chain, none of the cached greeks hold
+            self.cache = {}
+            self.valuation_date = today
+
+    def bucket(self, spot):
+        return int(math.floor(math.log(spot) / math.log1p(self.bucket_size)))
+
+    def chain_greeks(self, underlying_id, spot):
+        self.roll_valuation_date()
+        bucket = self.bucket(spot)
+        cached = self.cache.get(underlying_id)
+        if cached is not None and cached[0] == bucket:
+            return cached[1:]
+        # Recomputed for the whole chain whenever the underlying leaves its bucket
+        ids = self.chains[underlying_id]
+        columns = self.instruments.columns[ids]
+        years = (columns['expiration_date'] - self.valuation_date).astype(np.float64) / 365.0
+        years = np.where(np.isnan(years), MIN_YEARS, years)
+        volatility = self.volatilities.get(self.instruments.ticker_of(underlying_id), self.volatility)
+        greeks = black_scholes_greeks(
+            spot, columns['strike_price'], years, volatility, self.rate, columns['option_type'] == CALL
+        )
+        self.cache[underlying_id] = (bucket,) + greeks
+        return greeks
+
+    def greeks(self, ids, get_price):
+        # Delta, gamma and vega per instrument id, NaN for anything that is not a priced option
+        ids = np.asarray(ids, dtype=np.int32)
+        delta, gamma, vega = (np.full(len(ids), np.nan) for _ in range(3))
+        spots = np.full(len(ids), np.nan)
+        known = ids >= 0
+        underlying_ids = np.full(len(ids), -1, dtype=np.int32)
+        underlying_ids[known] = self.instruments.columns['underlying_id'][ids[known]]
+        for underlying_id in np.unique(underlying_ids):
+            if underlying_id < 0 or int(underlying_id) not in self.chains:
+                continue
+            spot = get_price(self.instruments.ticker_of(int(underlying_id)))
+            if not spot:
+                continue
+            chain = self.chains[int(underlying_id)]
+            chain_delta, chain_gamma, chain_vega = self.chain_greeks(int(underlying_id), float(spot))
+            rows = np.nonzero(underlying_ids == underlying_id)[0]
+            positions = np.searchsorted(chain, ids[rows])
+            found = chain[np.minimum(positions, len(chain) - 1)] == ids[rows]
+            rows, positions = rows[found], positions[found]
+            delta[rows], gamma[rows], vega[rows] = chain_delta[positions], chain_gamma[positions], chain_vega[positions]
+            spots[rows] = spot
+        return delta, gamma, vega, spots
+
+    def delta_notionals(self, tickers, quantities, get_price):
+        # Signed underlying-equivalent notional, NaN where no delta could be computed
+        ids = self.instruments.ids_of(tickers)
+        delta, _, _, spots = self.greeks(ids, get_price)
+        contract_sizes = np.nan_to_num(self.instruments.contract_sizes(ids), nan=1.0)
+        return np.asarray(quantities, dtype=np.float64) * contract_sizes * delta * spots
@@ -6,38 +6,70 @@ import logging
 
 import logging
 import threading
+import time
+from contextlib import nullcontext
+
+# Orders still working in the market that internalization may match against
+WORKING_STATES = {'OPEN', 'SENT_TO_MARKET', 'PARTIALLY_FILLED'}
+
+def remaining_quantity(order):
+    # quantity is what the client ordered, filled_quantity the cumulative fill against it
+    return order['quantity'] - (order.get('filled_quantity') or 0)
 
 class OrderManager:
-    def __init__(self, database, fix_engine):
+    def __init__(self, database, fix_engine, risk_state=None, audit=None, order_store=None, limit_reservations=None,
+                 kill_switch=None):
         self.database = database
         self.fix_engine = fix_engine
+        self.risk_state = risk_state
+        self.audit = audit
+        self.order_store = order_store
+        self.limit_reservations = limit_reservations
+        self.kill_switch = kill_switch
+        self.internalizing = set()  # Orders pulled from the market to be filled internally
 
     def process_order(self, order, session_id, price):
+        # False when a kill switch stopped the order, it has been rejected
+        if self.order_store is not None and self.order_store.get(order['order_id']) is None:
+            self.order_store.add(dict(order, session_id=session_id))
         account = self.database.get_account(order['account_id'])
         if account.get('internalization_enabled', False):
             internalized = self.attempt_internalization(order, account, session_id)
             if internalized:
-                return  # Order has been internalized
+                return True  # Order has been internalized
 
         # If not internalized, send the order to the market
-        self.send_order_to_market(order, session_id)
+        return self.send_order_to_market(order, session_id)
 
     def attempt_internalization(self, order, account, session_id):
         # Check for matching open orders
         matching_order = self.find_matching_order(order)
         if matching_order:
-            # Cancel the existing order in the market
-            self.cancel_order_in_market(matching_order)
-            # Wait for cancellation confirmation
-            cancellation_confirmed = self.wait_for_cancellation(matching_order)
-            if cancellation_confirmed:
-                # Internalize the trade
-                self.internalize_trade(order, matching_order, session_id)
-                return True
+            self.internalizing.add(matching_order['order_id'])
+            try:
+                # Cancel the existing order in the market
+                self.cancel_order_in_market(matching_order)
+                # Wait for cancellation confirmation
+                cancellation_confirmed = self.wait_for_cancellation(matching_order)
+                if cancellation_confirmed:
+                    # Internalize the trade
+                    self.internalize_trade(order, matching_order, session_id)
+                    return True
+            finally:
+                self.internalizing.discard(matching_order['order_id'])
         return False
 
     def find_matching_order(self, order):
         # Find open orders in the same account, opposite side, same ticker, same price
+        if self.order_store is not None:
+            matching_orders = self.order_store.find(
+                account_id=order['account_id'],
+                ticker=order['ticker'],
+                side='BUY' if order['side'] == 'SELL' else 'SELL',
+                price=order['price'],
+                statuses=WORKING_STATES
+            )
+            return matching_orders[0] if matching_orders else None
         matching_orders = self.database.get_open_orders(
             account_id=order['account_id'],
             ticker=order['ticker'],
@@ -50,13 +82,18 @@ class OrderManager:
 
     def cancel_order_in_market(self, order):
         # Send cancel request to the market via FIX
+        if self.order_store is not None:
+            self.order_store.transition(order['order_id'], 'CANCEL_PENDING')
         self.fix_engine.send_order_cancel_request(order)
 
-    def wait_for_cancellation(self, order):
+    def wait_for_cancellation(self, order, timeout=5.0):
+        if self.order_store is not None:
+            # Woken by the execution report itself, no database polling
+            return self.order_store.wait_for_status(order['order_id'], {'CANCELED'}, timeout)
         # Wait for cancellation confirmation (implement timeout if necessary)
         # This is a simplified example; in a real application, you'd handle this asynchronously
         for _ in range(10):
-            updated_order = self.database.get_order(order['order_id'])
+            updated_order = self.database.get_order(order['order_id'], order.get('created_at'))
             if updated_order['status'] == 'CANCELED':
                 return True
             time.sleep(0.5)  # Wait 0.5 seconds before checking again
@@ -64,21 +101,17 @@ class OrderManager:
 
     def internalize_trade(self, incoming_order, existing_order, session_id):
         # Determine the execution quantity (handle partial fills)
-        execution_quantity = min(incoming_order['quantity'], existing_order['quantity'])
+        execution_quantity = min(remaining_quantity(incoming_order), remaining_quantity(existing_order))
 
-        # Update orders in the database
-        self.database.update_order_status(
-            order_id=incoming_order['order_id'],
-            status='FILLED',
-            filled_quantity=execution_quantity,
-            liquidity_tag='INTERNALIZED'
-        )
-        self.database.update_order_status(
-            order_id=existing_order['order_id'],
-            status='FILLED',
-            filled_quantity=execution_quantity,
-            liquidity_tag='INTERNALIZED'
-        )
+        # Update orders
+        for order in (incoming_order, existing_order):
+            self.update_order_status(
+                order_id=order['order_id'],
+                status='FILLED' if execution_quantity >= remaining_quantity(order) else 'PARTIALLY_FILLED',
+                filled_quantity=execution_quantity,
+                liquidity_tag='INTERNALIZED',
+                created_at=order.get('created_at')
+            )
 
         # Update positions
         self.database.update_position(
@@ -95,6 +128,30 @@ class OrderManager:
             quantity=execution_quantity if existing_order['side'] == 'BUY' else -execution_quantity,
             average_price=existing_order['price']
         )
+        if self.audit is not None:
+            for order, order_session_id in ((incoming_order, session_id), (existing_order, existing_order['session_id'])):
+                signed_quantity = execution_quantity if order['side'] == 'BUY' else -execution_quantity
+                self.audit.record_order_status(
+                    order['order_id'],
+                    'FILLED' if execution_quantity >= remaining_quantity(order) else 'PARTIALLY_FILLED',
+                    order['account_id'], order_session_id,
+                    filled_quantity=execution_quantity, liquidity_tag='INTERNALIZED'
+                )
+                self.audit.record_position(
+                    order['account_id'], order_session_id, order['ticker'], signed_quantity, order['price']
+                )
+        if self.risk_state is not None:
+            for order, order_session_id in ((incoming_order, session_id), (existing_order, existing_order['session_id'])):
+                self.risk_state.apply_fill(
+                    account_id=order['account_id'],
+                    session_id=order_session_id,
+                    ticker=order['ticker'],
+                    quantity=execution_quantity if order['side'] == 'BUY' else -execution_quantity,
+                    price=order['price'],
+                    asset_class=order.get('asset_class', 'EQUITY')
+                )
+                # The filled part moves from working-order exposure into the position
+                self.release_order(order, execution_quantity)
 
         # Send execution reports via FIX
         self.fix_engine.send_execution_report(
@@ -116,33 +173,107 @@ class OrderManager:
         self.handle_partial_fills(incoming_order, existing_order, execution_quantity)
 
     def handle_partial_fills(self, incoming_order, existing_order, execution_quantity):
-        # Check if there are remaining quantities
-        incoming_remaining = incoming_order['quantity'] - execution_quantity
-        existing_remaining = existing_order['quantity'] - execution_quantity
+        # The stored quantity stays what the client ordered and filled_quantity has grown by the
+        # internal fill; only the market is sent the remainder, as a fresh order
+        incoming_remaining = remaining_quantity(incoming_order) - execution_quantity
+        existing_remaining = remaining_quantity(existing_order) - execution_quantity
 
         if incoming_remaining > 0:
-            # Update incoming order with remaining quantity
-            self.database.update_order_quantity(
-                order_id=incoming_order['order_id'],
-                quantity=incoming_remaining
-            )
+            if self.audit is not None:
+                self.audit.record_order_status(
+                    incoming_order['order_id'], 'PARTIALLY_FILLED', incoming_order['account_id'],
+                    incoming_order['session_id'], remaining_quantity=incoming_remaining
+                )
             # Continue processing the remaining order
-            self.send_order_to_market(incoming_order, incoming_order['session_id'])
+            self.send_order_to_market(dict(incoming_order, quantity=incoming_remaining), incoming_order['session_id'])
         if existing_remaining > 0:
-            # Update existing order with remaining quantity
-            self.database.update_order_quantity(
-                order_id=existing_order['order_id'],
-                quantity=existing_remaining
-            )
+            if self.audit is not None:
+                self.audit.record_order_status(
+                    existing_order['order_id'], 'PARTIALLY_FILLED', existing_order['account_id'],
+                    existing_order['session_id'], remaining_quantity=existing_remaining
+                )
             # Resubmit the existing order to the market
-            self.send_order_to_market(existing_order, existing_order['session_id'])
+            self.send_order_to_market(dict(existing_order, quantity=existing_remaining), existing_order['session_id'])
 
     def send_order_to_market(self, order, session_id):
-        # Implement sending the order to the external market via FIX
-        self.fix_engine.send_new_order(order, session_id)
-        # Update order status in the database
-        self.database.update_order_status(
-            order_id=order['order_id'],
-            status='SENT_TO_MARKET'
-        )
+        # Checked and sent under the kill switch's gate: a kill either finds the order in the order
+        # store as sent and cancels it, or has blocked it before it goes out
+        with self.kill_switch.gate if self.kill_switch is not None else nullcontext():
+            if self.kill_switch is not None and self.kill_switch.is_blocked(order, session_id):
+                blocked = True
+            else:
+                blocked = False
+                # Implement sending the order to the external market via FIX
+                self.fix_engine.send_new_order(order, session_id)
+                # Update order status
+                self.update_order_status(
+                    order_id=order['order_id'],
+                    status='SENT_TO_MARKET',
+                    created_at=order.get('created_at')
+                )
+        if blocked:
+            self.stop_order(order, session_id)
+            return False
+        if self.audit is not None:
+            self.audit.record_order_status(order['order_id'], 'SENT_TO_MARKET', order['account_id'], session_id)
+        return True
+
+    def stop_order(self, order, session_id):
+        # Never reached the market. Rejected when it is new, cancelled once the kill switch has
+        # taken it or part of it was filled internally; the client gets a reject unless filled.
+        current = self.get_order(order['order_id']) or {}
+        status = 'REJECTED' if current.get('status', 'OPEN') == 'OPEN' else 'CANCELED'
+        self.update_order_status(order_id=order['order_id'], status=status, created_at=order.get('created_at'))
+        self.release_order(order)
+        if self.audit is not None:
+            self.audit.record_order_status(
+                order['order_id'], status, order['account_id'], session_id, reason='KILL_SWITCH'
+            )
+        if not current.get('filled_quantity'):
+            self.fix_engine.send_reject(order, session_id, "Kill switch active.")
+        logging.warning(f"Order {order['order_id']} stopped by the kill switch before reaching the market")
+
+    def handle_execution(self, order_id, status, filled_quantity=None, price=None):
+        # Status changes reported by the market
+        self.update_order_status(order_id=order_id, status=status, filled_quantity=filled_quantity)
+        order = self.get_order(order_id) or {}
+        if self.audit is not None:
+            self.audit.record_order_status(
+                order_id, status, order.get('account_id'), order.get('session_id'), filled_quantity=filled_quantity
+            )
+        if not order or self.risk_state is None:
+            return
+        if filled_quantity and price is not None:
+            signed_quantity = filled_quantity if order['side'] == 'BUY' else -filled_quantity
+            self.risk_state.apply_fill(
+                account_id=order['account_id'],
+                session_id=order['session_id'],
+                ticker=order['ticker'],
+                quantity=signed_quantity,
+                price=price,
+                asset_class=order.get('asset_class', 'EQUITY')
+            )
+            self.release_order(order, filled_quantity)
+        # An order canceled for internalization keeps its exposure, the internal fill converts it
+        if status in ('CANCELED', 'REJECTED') and order_id not in self.internalizing:
+            self.release_order(order)
+
+    def release_order(self, order, quantity=None):
+        # Give back working-order exposure, all of it unless a fill converts part of it
+        if self.risk_state is not None:
+            self.risk_state.release_order(order['order_id'], order['account_id'], quantity)
+        # Leased budgets too; with shards the leases live in the shard and follow the release there
+        if self.limit_reservations is not None:
+            self.limit_reservations.release_order(order['order_id'], quantity)
+
+    def get_order(self, order_id):
+        if self.order_store is not None:
+            return self.order_store.get(order_id)
+        return self.database.get_order(order_id)
 
+    def update_order_status(self, order_id, status, filled_quantity=None, liquidity_tag=None, created_at=None):
+        # The order store logs the transition before returning and replicates it to the orders table
+        if self.order_store is not None:
+            self.order_store.transition(order_id, status, filled_quantity=filled_quantity, liquidity_tag=liquidity_tag)
+        else:
+            self.database.update_order_status(order_id, status, filled_quantity, liquidity_tag, created_at)
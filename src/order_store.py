@@ -0,0 +1,482 @@
+# src/order_store.py
+
+import json
+import logging
+import os
+import threading
+import time
+from datetime import date, datetime
+import psycopg2
+from psycopg2.extras import execute_batch
+
+# Allowed status changes, anything else is refused
+TRANSITIONS = {
+    'OPEN': {'OPEN', 'SENT_TO_MARKET', 'PARTIALLY_FILLED', 'FILLED', 'CANCEL_PENDING', 'CANCELED', 'REJECTED'},
+    'SENT_TO_MARKET': {'PARTIALLY_FILLED', 'FILLED', 'CANCEL_PENDING', 'CANCELED', 'REJECTED'},
+    'PARTIALLY_FILLED': {'PARTIALLY_FILLED', 'FILLED', 'SENT_TO_MARKET', 'CANCEL_PENDING', 'CANCELED'},
+    # A fill can race the cancel, and a rejected cancel leaves the order working
+    'CANCEL_PENDING': {'CANCELED', 'PARTIALLY_FILLED', 'FILLED', 'SENT_TO_MARKET'},
+    # Internalization fills an order that was pulled back from the market
+    'CANCELED': {'PARTIALLY_FILLED', 'FILLED'},
+    'FILLED': set(),
+    'REJECTED': set()
+}
+TERMINAL_STATES = {'FILLED', 'CANCELED', 'REJECTED'}
+
+class OrderRecord:
+    __slots__ = (
+        'order_id', 'account_id', 'session_id', 'ticker', 'side', 'quantity', 'price',
+        'order_type', 'asset_class', 'status', 'filled_quantity', 'liquidity_tag', 'updated_at', 'created_at'
+    )
+
+    def __init__(self, order):
+        self.order_id = order['order_id']
+        self.account_id = order['account_id']
+        self.session_id = order.get('session_id')
+        self.ticker = order['ticker']
+        self.side = order['side']
+        self.quantity = order['quantity']
+        self.price = float(order['price']) if order.get('price') is not None else None
+        self.order_type = order.get('order_type', 'LIMIT')
+        self.asset_class = order.get('asset_class', 'EQUITY')
+        self.status = order.get('status', 'OPEN')
+        self.filled_quantity = order.get('filled_quantity') or 0
+        self.liquidity_tag = order.get('liquidity_tag')
+        self.updated_at = time.time()
+        # Partition key of the orders table, every update carries it so Postgres looks at one day only
+        created_at = order.get('created_at')
+        if created_at is None:
+            created_at = datetime.fromtimestamp(order.get('updated_at') or self.updated_at)
+        self.created_at = str(created_at)
+
+    def to_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def wal_name(day):
+    return f"wal-{day.isoformat()}.log"
+
+def repair(path):
+    # A crash can leave the last line half written. It was never acknowledged, so it is cut off;
+    # left in place, every entry appended after it would be unreadable at the next recovery.
+    if not os.path.exists(path):
+        return
+    with open(path, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        end = size
+        # Back from the end to the last newline, only the tail is read
+        while end > 0:
+            start = max(end - 65536, 0)
+            f.seek(start)
+            newline = f.read(end - start).rfind(b'\n')
+            if newline >= 0:
+                end = start + newline + 1
+                break
+            end = start
+        if end < size:
+            logging.warning(f"Truncating {size - end} bytes of a torn entry at the end of {path}")
+            f.truncate(end)
+            f.flush()
+            os.fsync(f.fileno())
+
+def read_entries(path):
+    if not os.path.exists(path):
+        return []
+    entries = []
+    with open(path, 'r') as f:
+        for number, line in enumerate(f, 1):
+            try:
+                entries.append(json.loads(line))
+            except ValueError:
+                # A complete line that doesn't parse is damage, not a torn write; keep what follows
+                logging.error(f"Skipping unreadable entry at line {number} of {path}")
+    return entries
+
+
+class WriteAheadLog:
+    # Group commit: callers block until their entry is fsynced, one fsync covers every waiting caller.
+    # One file per day, the writer moves to the next one when the date changes.
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.open(date.today())
+        self.condition = threading.Condition()
+        self.pending = []
+        self.next_sequence = 0
+        self.synced_sequence = -1
+        self.listeners = []
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def open(self, day):
+        self.day = day
+        self.name = wal_name(day)
+        self.path = os.path.join(self.directory, self.name)
+        repair(self.path)
+        self.file = open(self.path, 'a')
+
+    def roll(self):
+        if date.today() != self.day:
+            self.file.close()
+            self.open(date.today())
+            logging.info(f"Order store write-ahead log rolled over to {self.path}")
+
+    def names(self):
+        # Every day's log, oldest first
+        return sorted(
+            name for name in os.listdir(self.directory) if name.startswith('wal-') and name.endswith('.log')
+        )
+
+    def append(self, entry):
+        self.wait(self.submit(entry))
+
+    def submit(self, entry):
+        with self.condition:
+            sequence = self.next_sequence
+            self.next_sequence += 1
+            self.pending.append(entry)
+            self.condition.notify_all()
+            return sequence
+
+    def wait(self, sequence):
+        with self.condition:
+            while self.synced_sequence < sequence:
+                self.condition.wait()
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.pending:
+                    self.condition.wait()
+                batch = self.pending
+                self.pending = []
+                last_sequence = self.next_sequence - 1
+            self.roll()
+            self.file.write(''.join(json.dumps(entry, default=str) + '\n' for entry in batch))
+            self.file.flush()
+            os.fsync(self.file.fileno())
+            for listener in self.listeners:
+                listener(self.name, batch)
+            with self.condition:
+                self.synced_sequence = last_sequence
+                self.condition.notify_all()
+
+    def read(self, name=None):
+        path = os.path.join(self.directory, name or self.name)
+        if path != self.path:
+            repair(path)
+        return read_entries(path)
+
+
+class OrderStore:
+    def __init__(self, config):
+        oms_config = config.get('oms', {})
+        directory = oms_config.get('path', 'data/oms')
+        self.db_config = config['database']
+        self.wal = WriteAheadLog(directory)
+        self.replication_interval = oms_config.get('replication_interval', 0.1)
+        self.replication_batch = oms_config.get('replication_batch', 5000)
+
+        self.lock = threading.Lock()
+        self.changed = threading.Condition(self.lock)
+        self.orders = {}      # order_id -> OrderRecord
+        self.by_account = {}  # account_id -> set of order_ids
+        self.by_session = {}
+        self.by_ticker = {}
+        self.open_ids = set()  # Orders not yet in a terminal state, with their own indexes
+        self.open_by_account = {}
+        self.open_by_session = {}
+        self.open_by_ticker = {}
+
+        self.replication_queue = []  # (log name, entry), in log order
+        self.replicated = {}         # log name -> entries written to the database, its checkpoint
+        self.replication_lock = threading.Lock()
+        self.wal.listeners.append(self.enqueue_replication)
+        self.conn = None
+
+    def recover(self, database):
+        # Orders still working from earlier days, then on top every log the database is behind
+        # on, oldest first. Today's log is always replayed, a process that ran past midnight
+        # may have left the tail of yesterday's unreplicated.
+        for order in database.get_all_open_orders():
+            self._index(OrderRecord(order))
+        checkpoints = self.read_checkpoints()
+        pending = 0
+        for name in self.wal.names():
+            entries = self.wal.read(name)
+            checkpoint = min(checkpoints.get(name, 0), len(entries))
+            if checkpoint == len(entries) and name != self.wal.name:
+                continue
+            for entry in entries:
+                self._replay(entry)
+            # Entries past the checkpoint may not have reached Postgres yet
+            with self.replication_lock:
+                self.replication_queue.extend((name, entry) for entry in entries[checkpoint:])
+            self.replicated[name] = checkpoint
+            pending += len(entries) - checkpoint
+        logging.info(f"Order store recovered {len(self.orders)} orders, {pending} to replicate")
+        threading.Thread(target=self.replicate, daemon=True).start()
+
+    def add(self, order):
+        entry = {'op': 'add', 'order': OrderRecord(order).to_dict()}
+        with self.lock:
+            sequence = self.wal.submit(entry)
+            record = self._apply(entry)
+            self.changed.notify_all()
+        self.wal.wait(sequence)
+        return record
+
+    def transition(self, order_id, status, filled_quantity=None, quantity=None, liquidity_tag=None):
+        with self.lock:
+            record = self.orders.get(order_id)
+            if record is None:
+                logging.error(f"Order {order_id} not found in order store.")
+                return None
+            if status not in TRANSITIONS[record.status]:
+                logging.error(f"Invalid transition for order {order_id}: {record.status} -> {status}")
+                return None
+            # filled_quantity is the fill of this execution, the log keeps the cumulative total
+            entry = {
+                'op': 'transition', 'order_id': order_id, 'status': status,
+                'filled_quantity': record.filled_quantity + (filled_quantity or 0),
+                'quantity': quantity, 'liquidity_tag': liquidity_tag, 'created_at': record.created_at
+            }
+            # Queued under the lock so the log has the same order as memory
+            sequence = self.wal.submit(entry)
+            self._apply(entry)
+            self.changed.notify_all()
+        # Not acknowledged until it is on disk, the fsync is shared with other callers
+        self.wal.wait(sequence)
+        return record
+
+    def transition_all(self, order_ids, status):
+        # One fsync for the whole batch instead of one per order
+        records = []
+        sequence = None
+        with self.lock:
+            for order_id in order_ids:
+                record = self.orders.get(order_id)
+                if record is None or status not in TRANSITIONS[record.status]:
+                    continue
+                entry = {
+                    'op': 'transition', 'order_id': order_id, 'status': status,
+                    'filled_quantity': record.filled_quantity, 'quantity': None, 'liquidity_tag': None,
+                    'created_at': record.created_at
+                }
+                sequence = self.wal.submit(entry)
+                records.append(self._apply(entry).to_dict())
+            self.changed.notify_all()
+        if sequence is not None:
+            self.wal.wait(sequence)
+        return records
+
+    def get(self, order_id):
+        with self.lock:
+            record = self.orders.get(order_id)
+            return record.to_dict() if record else None
+
+    def find(self, account_id=None, session_id=None, ticker=None, side=None, price=None, statuses=None):
+        with self.lock:
+            candidates = self._select(
+                (self.by_account, self.by_session, self.by_ticker), (account_id, session_id, ticker), self.orders.keys()
+            )
+            results = []
+            for order_id in candidates:
+                record = self.orders[order_id]
+                if side is not None and record.side != side:
+                    continue
+                if price is not None and record.price != float(price):
+                    continue
+                if statuses is not None and record.status not in statuses:
+                    continue
+                results.append(record.to_dict())
+            return results
+
+    def open_orders(self, account_id=None, session_id=None, ticker=None):
+        with self.lock:
+            candidates = self._select(
+                (self.open_by_account, self.open_by_session, self.open_by_ticker),
+                (account_id, session_id, ticker), self.open_ids
+            )
+            return [self.orders[order_id].to_dict() for order_id in candidates]
+
+    def _select(self, indexes, keys, default):
+        candidates = None
+        for index, key in zip(indexes, keys):
+            if key is None:
+                continue
+            ids = index.get(key, set())
+            candidates = ids if candidates is None else candidates & ids
+        return set(default) if candidates is None else set(candidates)
+
+    def wait_until_closed(self, order_ids, timeout):
+        # Returns when each order reached a terminal state, orders still open at the deadline are left out
+        deadline = time.monotonic() + timeout
+        pending = set(order_ids)
+        closed = {}
+        with self.lock:
+            while True:
+                now = time.monotonic()
+                for order_id in [order_id for order_id in pending if order_id not in self.open_ids]:
+                    closed[order_id] = now
+                    pending.discard(order_id)
+                if not pending or now >= deadline:
+                    return closed
+                self.changed.wait(deadline - now)
+
+    def wait_for_status(self, order_id, statuses, timeout):
+        # Woken by transitions instead of polling the database
+        deadline = time.monotonic() + timeout
+        with self.lock:
+            while True:
+                record = self.orders.get(order_id)
+                if record is not None and record.status in statuses:
+                    return True
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                self.changed.wait(remaining)
+
+    def _replay(self, entry):
+        # The database may be ahead of or behind the log, entries are absolute so replaying converges
+        if entry['op'] == 'add':
+            if entry['order']['order_id'] not in self.orders:
+                self._apply(entry)
+            return
+        record = self.orders.get(entry['order_id'])
+        if record is None:
+            # Closed before the restart, so no longer among the open orders
+            logging.warning(f"Skipping logged transition for unknown order {entry['order_id']}")
+            return
+        if entry['status'] != record.status and entry['status'] not in TRANSITIONS[record.status]:
+            logging.warning(
+                f"Skipping logged transition for order {entry['order_id']}: {record.status} -> {entry['status']}"
+            )
+            return
+        self._apply(entry)
+
+    def _apply(self, entry):
+        if entry['op'] == 'add':
+            record = OrderRecord(entry['order'])
+            self._index(record)
+            return record
+        record = self.orders[entry['order_id']]
+        record.status = entry['status']
+        if entry['filled_quantity'] is not None:
+            record.filled_quantity = entry['filled_quantity']
+        if entry['quantity'] is not None:
+            record.quantity = entry['quantity']
+        if entry['liquidity_tag'] is not None:
+            record.liquidity_tag = entry['liquidity_tag']
+        record.updated_at = time.time()
+        self._index_open(record)
+        return record
+
+    def _index(self, record):
+        self.orders[record.order_id] = record
+        self.by_account.setdefault(record.account_id, set()).add(record.order_id)
+        self.by_session.setdefault(record.session_id, set()).add(record.order_id)
+        self.by_ticker.setdefault(record.ticker, set()).add(record.order_id)
+        self._index_open(record)
+
+    def _index_open(self, record):
+        indexes = (
+            (self.open_by_account, record.account_id),
+            (self.open_by_session, record.session_id),
+            (self.open_by_ticker, record.ticker)
+        )
+        if record.status in TERMINAL_STATES:
+            self.open_ids.discard(record.order_id)
+            for index, key in indexes:
+                ids = index.get(key)
+                if ids is not None:
+                    ids.discard(record.order_id)
+                    if not ids:
+                        del index[key]
+        else:
+            self.open_ids.add(record.order_id)
+            for index, key in indexes:
+                index.setdefault(key, set()).add(record.order_id)
+
+    def enqueue_replication(self, name, batch):
+        with self.replication_lock:
+            self.replication_queue.extend((name, entry) for entry in batch)
+
+    def replicate(self):
+        # The orders table is a downstream copy, kept up to date in batches off the order path
+        while True:
+            time.sleep(self.replication_interval)
+            with self.replication_lock:
+                # A checkpoint belongs to one log, so a batch never spans two of them
+                name = self.replication_queue[0][0] if self.replication_queue else None
+                batch = []
+                for entry_name, entry in self.replication_queue[:self.replication_batch]:
+                    if entry_name != name:
+                        break
+                    batch.append(entry)
+            if not batch:
+                continue
+            checkpoint = self.replicated.get(name, 0) + len(batch)
+            try:
+                self.write_batch(batch, name, checkpoint)
+            except Exception as e:
+                logging.error(f"Failed to replicate orders to the database: {e}")
+                self.conn = None
+                continue
+            with self.replication_lock:
+                del self.replication_queue[:len(batch)]
+            self.replicated[name] = checkpoint
+
+    def connect(self):
+        if self.conn is None:
+            self.conn = psycopg2.connect(**self.db_config)
+        return self.conn
+
+    def write_batch(self, batch, name, checkpoint):
+        cur = self.connect().cursor()
+        adds = [entry['order'] for entry in batch if entry['op'] == 'add']
+        if adds:
+            # created_at comes from the log, so a re-sent add conflicts on the partitioned key as well
+            execute_batch(cur, """
+                INSERT INTO orders (order_id, account_id, session_id, ticker, side, quantity, price,
+                                    status, order_type, asset_class, liquidity_tag, created_at, updated_at)
+                VALUES (%(order_id)s, %(account_id)s, %(session_id)s, %(ticker)s, %(side)s, %(quantity)s,
+                        %(price)s, %(status)s, %(order_type)s, %(asset_class)s, %(liquidity_tag)s,
+                        %(created_at)s, to_timestamp(%(updated_at)s))
+                ON CONFLICT DO NOTHING;
+            """, adds)
+        transitions = [entry for entry in batch if entry['op'] == 'transition']
+        if transitions:
+            # Absolute values, re-sending an entry after a crash changes nothing. Entries logged
+            # without created_at still find their row, by looking in every partition.
+            transitions = [dict(entry, created_at=entry.get('created_at')) for entry in transitions]
+            execute_batch(cur, """
+                UPDATE orders
+                SET status = %(status)s,
+                    filled_quantity = COALESCE(%(filled_quantity)s, filled_quantity),
+                    quantity = COALESCE(%(quantity)s, quantity),
+                    liquidity_tag = COALESCE(%(liquidity_tag)s, liquidity_tag),
+                    updated_at = CURRENT_TIMESTAMP
+                WHERE order_id = %(order_id)s
+                  AND (created_at = %(created_at)s OR %(created_at)s IS NULL);
+            """, transitions)
+        # Same transaction as the rows, the checkpoint can't get ahead of or behind the table
+        cur.execute("""
+            INSERT INTO oms_checkpoints (wal, position) VALUES (%s, %s)
+            ON CONFLICT (wal) DO UPDATE SET position = EXCLUDED.position;
+        """, (name, checkpoint))
+        self.conn.commit()
+        cur.close()
+
+    def read_checkpoints(self):
+        try:
+            cur = self.connect().cursor()
+            cur.execute("SELECT wal, position FROM oms_checkpoints;")
+            checkpoints = dict(cur.fetchall())
+            self.conn.rollback()
+            cur.close()
+            return checkpoints
+        except Exception as e:
+            # Re-sending the logs is safe, only slower
+            logging.error(f"Failed to read the order store checkpoints: {e}")
+            self.conn = None
+            return {}
@@ -0,0 +1,294 @@
+# src/query_benchmark.py
+
+import argparse
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+import numpy as np
+import psycopg2
+from src.database import Database
+from src.migrations import migrate
+
+# Tables as in sql/schema.sql, without the seed rows
+TABLES = [
+    """
+    CREATE TABLE accounts (
+        account_id SERIAL PRIMARY KEY,
+        account_number VARCHAR(50) UNIQUE NOT NULL,
+        account_type VARCHAR(20),
+        cash_balance DECIMAL(20,5) DEFAULT 0.0,
+        margin_balance DECIMAL(20,5) DEFAULT 0.0,
+        trading_mode VARCHAR(20) DEFAULT 'NORMAL',
+        portfolio_margin_available DECIMAL(20,5) DEFAULT 0.0,
+        internalization_enabled BOOLEAN DEFAULT FALSE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE fix_sessions (
+        session_id SERIAL PRIMARY KEY,
+        account_id INTEGER REFERENCES accounts(account_id) ON DELETE CASCADE,
+        sender_comp_id VARCHAR(50) NOT NULL,
+        target_comp_id VARCHAR(50) NOT NULL,
+        is_active BOOLEAN DEFAULT TRUE,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    );
+    """,
+    """
+    CREATE TABLE positions (
+        position_id SERIAL PRIMARY KEY,
+        account_id INTEGER REFERENCES accounts(account_id),
+        session_id INTEGER REFERENCES fix_sessions(session_id),
+        ticker VARCHAR(10) NOT NULL,
+        quantity INTEGER NOT NULL,
+        average_price DECIMAL(15,5),
+        last_updated TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        asset_class VARCHAR(20),
+        UNIQUE (account_id, session_id, ticker)
+    );
+    """,
+    """
+    CREATE TABLE orders (
+        order_id SERIAL PRIMARY KEY,
+        account_id INTEGER REFERENCES accounts(account_id),
+        session_id INTEGER REFERENCES fix_sessions(session_id),
+        ticker VARCHAR(50) NOT NULL,
+        side VARCHAR(10) NOT NULL,
+        quantity INTEGER NOT NULL,
+        price DECIMAL(15,5),
+        status VARCHAR(20) DEFAULT 'OPEN',
+        order_type VARCHAR(20) NOT NULL,
+        asset_class VARCHAR(20) NOT NULL,
+        created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        updated_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+        liquidity_tag VARCHAR(20),
+        filled_quantity INTEGER DEFAULT 0
+    );
+    """
+]
+
+class RecordingConnection:
+    # Hands Database its cursors and keeps them, so the SQL it ran can be explained afterwards
+    def __init__(self, conn):
+        self.conn = conn
+        self.cursors = []
+
+    def cursor(self, *args, **kwargs):
+        cur = self.conn.cursor(*args, **kwargs)
+        self.cursors.append(cur)
+        return cur
+
+    def commit(self):
+        self.conn.commit()
+
+    def last_query(self):
+        return self.cursors[-1].query.decode() if self.cursors else None
+
+
+def load(conn, accounts, sessions, tickers, orders, positions, days, chunk_size=1000000):
+    # Generated server side, a few million rows take seconds instead of minutes of round trips
+    cur = conn.cursor()
+    for statement in TABLES:
+        cur.execute(statement)
+    cur.execute("""
+        INSERT INTO accounts (account_number, account_type, cash_balance)
+        SELECT 'ACC' || g, (ARRAY['CASH', 'MARGIN'])[1 + g %% 2], 1000000
+        FROM generate_series(1, %s) g;
+    """, (accounts,))
+    cur.execute("""
+        INSERT INTO fix_sessions (account_id, sender_comp_id, target_comp_id)
+        SELECT 1 + g %% %s, 'CLIENT' || g, 'VERGES'
+        FROM generate_series(1, %s) g;
+    """, (accounts, sessions))
+    cur.execute("""
+        INSERT INTO positions (account_id, session_id, ticker, quantity, average_price, last_updated, asset_class)
+        SELECT 1 + g %% %(accounts)s, 1 + (g %% %(accounts)s) %% %(sessions)s, 'T' || (g / %(accounts)s),
+               (random() * 2000 - 1000)::int, 10 + random() * 490,
+               now() - random() * interval '1 day', 'EQUITY'
+        FROM generate_series(0, %(positions)s - 1) g;
+    """, {'accounts': accounts, 'sessions': sessions, 'positions': positions})
+    for start in range(0, orders, chunk_size):
+        # Spread over the last days; only today's orders can still be working
+        cur.execute("""
+            INSERT INTO orders (account_id, session_id, ticker, side, quantity, price, status, order_type,
+                                asset_class, created_at, updated_at, filled_quantity)
+            SELECT account_id, 1 + account_id %% %(sessions)s, 'T' || (random() * %(tickers)s)::int,
+                   CASE WHEN random() < 0.5 THEN 'BUY' ELSE 'SELL' END, quantity, round(price::numeric, 2),
+                   CASE
+                       WHEN created_at >= CURRENT_DATE AND r < 0.05 THEN 'OPEN'
+                       WHEN created_at >= CURRENT_DATE AND r < 0.07 THEN 'SENT_TO_MARKET'
+                       WHEN created_at >= CURRENT_DATE AND r < 0.08 THEN 'PARTIALLY_FILLED'
+                       WHEN r < 0.70 THEN 'FILLED'
+                       WHEN r < 0.95 THEN 'CANCELED'
+                       ELSE 'REJECTED'
+                   END,
+                   'LIMIT', 'EQUITY', created_at, created_at + random() * interval '1 minute',
+                   CASE WHEN r >= 0.08 AND r < 0.70 THEN quantity ELSE 0 END
+            FROM (
+                SELECT 1 + (random() * (%(accounts)s - 1))::int AS account_id,
+                       (1 + random() * 10)::int * 100 AS quantity,
+                       10 + random() * 490 AS price,
+                       random() AS r,
+                       now() - (%(days)s * (%(start)s + g)::float / %(orders)s) * interval '1 day' AS created_at
+                FROM generate_series(0, LEAST(%(chunk_size)s, %(orders)s - %(start)s) - 1) g
+            ) generated;
+        """, {
+            'accounts': accounts, 'sessions': sessions, 'tickers': tickers, 'orders': orders,
+            'days': days, 'start': start, 'chunk_size': chunk_size
+        })
+        conn.commit()
+        logging.info(f"Loaded {min(start + chunk_size, orders)} of {orders} orders")
+    conn.commit()
+    cur.execute("ANALYZE;")
+    cur.close()
+
+
+def sample(conn, repeat):
+    # Parameters drawn from the loaded data, so lookups hit real rows
+    cur = conn.cursor()
+    cur.execute("""
+        SELECT account_id, ticker, side, price FROM orders WHERE status = 'OPEN' ORDER BY random() LIMIT %s;
+    """, (repeat,))
+    open_orders = cur.fetchall()
+    # With their created_at, as the order store sends it, so the lookup reads one partition
+    cur.execute("SELECT order_id, created_at FROM orders ORDER BY random() LIMIT %s;", (repeat,))
+    order_keys = cur.fetchall()
+    cur.execute("SELECT MAX(account_id) FROM orders;")
+    max_account_id = cur.fetchone()[0]
+    cur.close()
+    order_keys = [order_keys[i % len(order_keys)] for i in range(repeat)]
+    account_ids = np.random.randint(1, max_account_id + 1, repeat).tolist()
+    return open_orders, order_keys, account_ids
+
+
+def plan_summary(conn, query):
+    # Node types and indexes of the plan, outermost first
+    if query is None or query.lstrip().upper().startswith('COPY'):
+        return 'COPY'
+    cur = conn.cursor()
+    cur.execute("EXPLAIN (FORMAT JSON) " + query)
+    plan = cur.fetchone()[0]
+    conn.rollback()
+    cur.close()
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    nodes = []
+
+    def walk(node):
+        label = node['Node Type']
+        if 'Index Name' in node:
+            label += f" using {node['Index Name']}"
+        elif 'Relation Name' in node:
+            label += f" on {node['Relation Name']}"
+        if label not in nodes:
+            nodes.append(label)
+        for child in node.get('Plans', []):
+            walk(child)
+
+    walk(plan[0]['Plan'])
+    return ' > '.join(nodes[:4]) + (f" (+{len(nodes) - 4})" if len(nodes) > 4 else '')
+
+
+def run_queries(conn, params, repeat, bulk_repeat):
+    open_orders, order_keys, account_ids = params
+    recording = RecordingConnection(conn)
+    # Only the query methods are used, they need nothing but a connection
+    database = Database.__new__(Database)
+    database.conn = recording
+    since = datetime.now() - timedelta(minutes=1)
+    queries = [
+        ('get_open_orders', lambda i: database.get_open_orders(*open_orders[i % len(open_orders)]), repeat),
+        ('get_all_open_orders', lambda i: database.get_all_open_orders(), bulk_repeat),
+        ('get_order', lambda i: database.get_order(*order_keys[i]), repeat),
+        ('update_order_status',
+         lambda i: database.update_order_status(order_keys[i][0], 'FILLED', 0, None, order_keys[i][1]), repeat),
+        ('update_order_quantity', lambda i: database.update_order_quantity(order_keys[i][0], 100, order_keys[i][1]),
+         repeat),
+        ('update_account_trading_mode',
+         lambda i: database.update_account_trading_mode(account_ids[i], 'NORMAL'), repeat),
+        ('get_all_positions', lambda i: database.get_all_positions(), bulk_repeat),
+        ('get_positions_updated_since', lambda i: database.get_positions_updated_since(since), repeat),
+        ('get_daily_volumes', lambda i: database.get_daily_volumes(), bulk_repeat),
+        ('get_daily_volumes (incremental)', lambda i: database.get_daily_volumes(since), repeat),
+    ]
+    results = {}
+    for name, call, count in queries:
+        if name == 'get_open_orders' and not open_orders:
+            continue
+        latencies = []
+        for i in range(count):
+            started = time.perf_counter()
+            call(i)
+            latencies.append(time.perf_counter() - started)
+        latencies = np.array(latencies) * 1000
+        results[name] = {
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p99_ms': float(np.percentile(latencies, 99)),
+            'plan': plan_summary(conn, recording.last_query())
+        }
+        recording.cursors.clear()
+    return results
+
+
+def report(before, after):
+    print(f"{'query':34} {'before p50/p99 ms':>20} {'after p50/p99 ms':>20}")
+    for name, result in before.items():
+        migrated = after.get(name, {})
+        print(
+            f"{name:34} {result['p50_ms']:9.3f}/{result['p99_ms']:<10.3f}"
+            f" {migrated.get('p50_ms', float('nan')):9.3f}/{migrated.get('p99_ms', float('nan')):<10.3f}"
+        )
+        print(f"{'':4}before: {result['plan']}")
+        print(f"{'':4}after:  {migrated.get('plan')}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Load a generated dataset into a scratch schema and time every query of src/database.py "
+                    "before and after the migrations"
+    )
+    parser.add_argument('--dsn', default='dbname=postgres', help="libpq connection string of a local Postgres")
+    parser.add_argument('--schema', default='verges_benchmark')
+    parser.add_argument('--orders', type=int, default=5000000)
+    parser.add_argument('--positions', type=int, default=1000000)
+    parser.add_argument('--accounts', type=int, default=10000)
+    parser.add_argument('--sessions', type=int, default=500)
+    parser.add_argument('--tickers', type=int, default=3000)
+    parser.add_argument('--days', type=int, default=30, help="Days of order history")
+    parser.add_argument('--repeat', type=int, default=200, help="Runs of each point query")
+    parser.add_argument('--bulk-repeat', type=int, default=5, help="Runs of each full-table query")
+    parser.add_argument('--keep', action='store_true', help="Keep the schema afterwards")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(levelname)s %(message)s")
+    conn = psycopg2.connect(args.dsn)
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {args.schema} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {args.schema};")
+    cur.execute(f"SET search_path TO {args.schema};")
+    conn.commit()
+    cur.close()
+
+    started = time.perf_counter()
+    load(conn, args.accounts, args.sessions, args.tickers, args.orders, args.positions, args.days)
+    logging.info(f"Loaded dataset in {time.perf_counter() - started:.1f}s")
+    params = sample(conn, args.repeat)
+
+    before = run_queries(conn, params, args.repeat, args.bulk_repeat)
+    started = time.perf_counter()
+    migrate(conn)
+    cur = conn.cursor()
+    cur.execute("ANALYZE;")
+    conn.commit()
+    cur.close()
+    logging.info(f"Migrated in {time.perf_counter() - started:.1f}s")
+    after = run_queries(conn, params, args.repeat, args.bulk_repeat)
+    report(before, after)
+
+    if not args.keep:
+        cur = conn.cursor()
+        cur.execute(f"DROP SCHEMA {args.schema} CASCADE;")
+        conn.commit()
+        cur.close()
+    conn.close()
@@ -0,0 +1,154 @@
+# src/replay.py
+
+import argparse
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from src.decision_log import DecisionLog
+from src.risk_management import RiskManagement, DEFAULT_PLUGINS
+
+class ReplayDatabase:
+    # Serves the recorded inputs of one decision in place of Postgres
+    def __init__(self):
+        self.inputs = None
+
+    def load(self, inputs):
+        self.inputs = inputs
+
+    @property
+    def conn(self):
+        raise RuntimeError("Replay has no live database, warm up plugins with recorded reference data.")
+
+    def get_positions(self, account_id):
+        return [
+            dict(position, total_quantity=position['quantity'])
+            for position in self.inputs['positions']
+            if position['account_id'] == account_id
+        ]
+
+    def get_account(self, account_id):
+        return self.inputs['account']
+
+    def get_risk_settings(self, session_id):
+        return self.inputs['risk_settings']
+
+
+class ReplayRiskState:
+    # Working-order exposure and session volume as the live check saw them
+    def __init__(self):
+        self.inputs = None
+
+    def load(self, inputs):
+        self.inputs = inputs
+
+    def get_daily_volume(self, session_id):
+        return self.inputs.get('daily_volume', 0)
+
+    def get_open_exposure(self, account_id, asset_class=None):
+        exposure = self.inputs.get('open_exposure', {})
+        if asset_class is None:
+            return sum(exposure.values())
+        return exposure.get(asset_class, 0.0)
+
+
+class ReplayMarketData:
+    def __init__(self):
+        self.prices = {}
+        self.last_prices = self.prices
+
+    def get_last_trade(self, ticker):
+        return self.prices.get(ticker)
+
+
+def replay_decision(risk_management, inputs):
+    order = inputs['order']
+    account = inputs['account']
+    session_id = inputs['session_id']
+    risk_settings = inputs['risk_settings']
+    recorded = inputs['plugin_results']
+    for name, plugin in risk_management.plugins.items():
+        if plugin.deterministic:
+            result, message = plugin.check(order, account, session_id, risk_settings)
+        else:
+            result, message = recorded.get(name, (True, ""))
+        if not result:
+            return False, message, name
+    # Cluster leases are not part of the plugin set, keep what the live run got
+    result, message = recorded.get('limit_reservations', (True, ""))
+    return result, message, 'limit_reservations' if not result else None
+
+
+def replay_range(directory, start, stop, plugin_names):
+    logging.disable(logging.ERROR)  # Plugins log every reject, keep the report readable
+    log = DecisionLog(directory, mode='r')
+    database = ReplayDatabase()
+    market_data = ReplayMarketData()
+    risk_state = ReplayRiskState()
+    risk_management = RiskManagement(database, plugin_names=plugin_names)
+    for plugin in risk_management.plugins.values():
+        plugin.market_data = market_data
+        plugin.risk_state = risk_state
+
+    passed = log.column('passed')
+    differences = []
+    reference_version = False  # Nothing loaded yet, None is the unversioned reference data
+    for index in range(start, stop):
+        inputs = log.inputs(index)
+        if inputs.get('reference_version') != reference_version:
+            # A reload during the day switched reference data, warm up on the one this decision saw
+            reference_version = inputs.get('reference_version')
+            reference_data = log.load_reference_data(reference_version)
+            if reference_data is not None:
+                risk_management.warm_up(reference_data)
+        database.load(inputs)
+        risk_state.load(inputs)
+        market_data.prices.clear()
+        market_data.prices.update(inputs['prices'])
+        result, message, plugin = replay_decision(risk_management, inputs)
+        if result != bool(passed[index]):
+            recorded = next(
+                ((name, m) for name, (r, m) in inputs['plugin_results'].items() if not r), (None, "")
+            )
+            differences.append({
+                'index': index,
+                'order_id': inputs['order'].get('order_id'),
+                'account_id': inputs['account']['account_id'],
+                'recorded': (bool(passed[index]), recorded[0], recorded[1]),
+                'replayed': (result, plugin, message)
+            })
+    return stop - start, differences
+
+
+def replay(directory, plugin_names=None, workers=None, chunk_size=10000):
+    plugin_names = plugin_names or DEFAULT_PLUGINS
+    total = len(DecisionLog(directory, mode='r'))
+    ranges = [(start, min(start + chunk_size, total)) for start in range(0, total, chunk_size)]
+    replayed = 0
+    differences = []
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        futures = [executor.submit(replay_range, directory, start, stop, plugin_names) for start, stop in ranges]
+        for future in futures:
+            count, range_differences = future.result()
+            replayed += count
+            differences.extend(range_differences)
+    return replayed, differences
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Re-run the current risk plugins over a recorded decision log")
+    parser.add_argument('directory', help="Decision log directory, e.g. data/decisions/2024-01-02")
+    parser.add_argument('--plugins', help="Comma separated plugin names, defaults to the standard set")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--chunk-size', type=int, default=10000)
+    args = parser.parse_args()
+
+    plugin_names = args.plugins.split(',') if args.plugins else None
+    replayed, differences = replay(args.directory, plugin_names, args.workers, args.chunk_size)
+    newly_rejected = [d for d in differences if not d['replayed'][0]]
+    print(f"Replayed {replayed} decisions: {len(differences)} changed, "
+          f"{len(newly_rejected)} now rejected, {len(differences) - len(newly_rejected)} now accepted")
+    for difference in differences:
+        print(
+            f"  #{difference['index']} order {difference['order_id']} account {difference['account_id']}: "
+            f"recorded {difference['recorded']} -> replayed {difference['replayed']}"
+        )
@@ -2,43 +2,293 @@
 
 import importlib
 import logging
+from src.basket import BasketRiskCheck
+
+DEFAULT_PLUGINS = [
+    'credit_limit',
+    'margin_check',
+    'notional_limit',
+    'volume_limit',
+    'trading_mode',
+    'portfolio_margin',
+    'equity_option_spread',
+    'message_throttling',
+    'wash_trade'
+]
+
+# Plugins whose module or class name doesn't follow the <name>.py / <Name>Check convention
+PLUGIN_CLASSES = {
+    'credit_limit': ('credit_limits', 'CreditLimitCheck'),
+    'margin_check': ('margin_risk', 'MarginCheck')
+}
+
+class RiskPipeline:
+    # Built once and never modified; a reload builds a new pipeline and swaps the reference,
+    # so an order that already picked up a pipeline finishes on it without any locking.
+    def __init__(self, plugins, reference_data=None, reference_version=None, risk_settings=None):
+        self.plugins = plugins
+        self.reference_data = reference_data
+        self.reference_version = reference_version  # Decision log file the reference data was saved to
+        self.risk_settings = risk_settings  # session_id -> risk_settings row, swapped with the limits they go with
+        self.checks = tuple((name, plugin.check) for name, plugin in plugins.items())
+
 
 class RiskManagement:
-    def __init__(self, database):
+    def __init__(self, database, risk_state=None, plugin_names=None, limit_reservations=None, audit=None,
+                 recorder=None, market_data=None, reserve_open_orders=True):
         self.database = database
-        self.plugins = {}
+        self.risk_state = risk_state
+        # With a recorder the plugins get its view of the market data, which notes the prices they use
+        if recorder is not None and recorder.market_data is not None:
+            market_data = recorder.market_data
+        self.market_data = market_data
+        # Off for a front end whose account state lives in the shards
+        self.reserve_open_orders = reserve_open_orders and risk_state is not None
+        self.plugin_names = plugin_names
+        self.limit_reservations = limit_reservations
+        if limit_reservations is not None:
+            # Budgets are taken in the units the credit and notional checks use
+            limit_reservations.notional = self.get_order_notional
+        self.audit = audit
+        self.recorder = recorder
+        self.basket = BasketRiskCheck(self)
+        self.pipeline = RiskPipeline({})
         self.load_plugins()
-    
+
+    @property
+    def plugins(self):
+        return self.pipeline.plugins
+
+    @property
+    def reference_data(self):
+        return self.pipeline.reference_data
+
     def load_plugins(self):
-        plugin_names = [
-            'credit_limit',
-            'margin_check',
-            'notional_limit',
-            'volume_limit',
-            'trading_mode',
-            'portfolio_margin',
-            'equity_option_spread',
-            'message_throttling',
-	    'wash_trade'
-        ]
+        self.pipeline = RiskPipeline(self.build_plugins(self.plugin_names or DEFAULT_PLUGINS))
+
+    def build_plugins(self, plugin_names):
+        plugins = {}
         for name in plugin_names:
             try:
-                module = importlib.import_module(f"risk_plugins.{name}")
-                plugin_class_name = ''.join([part.title() for part in name.split('_')]) + "Check"
+                module_name, plugin_class_name = PLUGIN_CLASSES.get(
+                    name, (name, ''.join([part.title() for part in name.split('_')]) + "Check")
+                )
+                module = importlib.import_module(f"risk_plugins.{module_name}")
                 plugin_class = getattr(module, plugin_class_name)
-                self.plugins[name] = plugin_class(self.database)
+                plugins[name] = plugin_class(self.database, self.market_data)
+                plugins[name].risk_state = self.risk_state
                 logging.info(f"Loaded risk plugin: {name}")
             except Exception as e:
                 logging.error(f"Failed to load plugin {name}: {e}")
-    
+        return plugins
+
+    def warm_up(self, reference_data, risk_settings=None):
+        # Startup only, nothing is checking orders yet; reloads go through reload()
+        self.warm_up_plugins(self.pipeline.plugins, reference_data)
+        self.pipeline = RiskPipeline(
+            self.pipeline.plugins, reference_data, self.save_reference_data(reference_data),
+            self.index_risk_settings(risk_settings) if risk_settings is not None else self.pipeline.risk_settings
+        )
+        self.warm_up_dependents(reference_data)
+
+    def index_risk_settings(self, risk_settings):
+        return {settings['session_id']: dict(settings) for settings in risk_settings}
+
+    def warm_up_plugins(self, plugins, reference_data):
+        for name, plugin in plugins.items():
+            try:
+                plugin.warm_up(reference_data)
+            except Exception as e:
+                logging.error(f"Failed to warm up plugin {name}: {e}")
+
+    def warm_up_dependents(self, reference_data):
+        if self.limit_reservations is not None:
+            self.limit_reservations.warm_up(reference_data)
+
+    def save_reference_data(self, reference_data):
+        if self.recorder is None:
+            return None
+        try:
+            return self.recorder.warm_up(reference_data)
+        except Exception as e:
+            logging.error(f"Failed to save reference data to the decision log: {e}")
+            return None
+
+    def reload(self, plugin_names=None, reference_data=None, risk_settings=None):
+        # Everything slow happens here, on the reloading thread; the order path only sees the swap
+        old = self.pipeline
+        if plugin_names is not None:
+            self.plugin_names = plugin_names
+        reference_data = reference_data if reference_data is not None else old.reference_data
+        risk_settings = self.index_risk_settings(risk_settings) if risk_settings is not None else old.risk_settings
+        plugins = self.build_plugins(self.plugin_names or DEFAULT_PLUGINS)
+        if not plugins:
+            logging.error("Reload produced no risk plugins, keeping the current pipeline.")
+            return False
+        if reference_data is not None:
+            self.warm_up_plugins(plugins, reference_data)
+        for name, plugin in plugins.items():
+            # Carry over in-process state such as throttling windows
+            if name in old.plugins:
+                try:
+                    plugin.restore_state(old.plugins[name].get_state())
+                except Exception as e:
+                    logging.error(f"Failed to carry state over for plugin {name}: {e}")
+        changed = reference_data is not None and reference_data is not old.reference_data
+        # Saved before the swap, the first decision on the new pipeline already has its version on disk
+        reference_version = self.save_reference_data(reference_data) if changed else old.reference_version
+        self.pipeline = RiskPipeline(plugins, reference_data, reference_version, risk_settings)
+        if changed:
+            self.warm_up_dependents(reference_data)
+        logging.info(f"Risk pipeline reloaded: {list(plugins)}")
+        return True
+
+    def get_plugin_state(self):
+        state = {}
+        for name, plugin in self.plugins.items():
+            plugin_state = plugin.get_state()
+            if plugin_state is not None:
+                state[name] = plugin_state
+        return state
+
+    def restore_plugin_state(self, state):
+        for name, plugin_state in state.items():
+            plugin = self.plugins.get(name)
+            if plugin is None:
+                continue
+            try:
+                plugin.restore_state(plugin_state)
+            except Exception as e:
+                logging.error(f"Failed to restore state for plugin {name}: {e}")
+
+    def get_risk_settings(self, session_id, pipeline=None):
+        pipeline = pipeline or self.pipeline
+        risk_settings = None
+        if pipeline.risk_settings is not None:
+            risk_settings = pipeline.risk_settings.get(session_id)
+        if risk_settings is None:
+            risk_settings = self.database.get_risk_settings(session_id)
+        return risk_settings
+
+    def check_orders(self, batch, session_id):
+        # Basket / program trade: one decision per order, later orders see the effect of earlier ones
+        pipeline = self.pipeline
+        risk_settings = self.get_risk_settings(session_id, pipeline)
+        if not risk_settings:
+            return [(False, "Risk settings not found for session.")] * len(batch)
+        if pipeline.reference_data is None or self.risk_state is None:
+            logging.warning("Basket check without warmed-up state, checking orders one by one.")
+            decisions = [self.check_order(order, self.get_account(order['account_id']), session_id) for order in batch]
+            if self.audit is not None:
+                # check_order audits its rejects, as for single orders the passes are audited by the caller
+                for order, (result, _) in zip(batch, decisions):
+                    if result:
+                        self.audit.record_decision(order, session_id, True)
+            return decisions
+        try:
+            decisions = self.basket.check_orders(batch, session_id, risk_settings, pipeline)
+        except Exception as e:
+            logging.error(f"Basket risk check error: {e}")
+            decisions = [(False, "Error in basket risk check")] * len(batch)
+        for order, (result, message) in zip(batch, decisions):
+            if result:
+                self.reserve_order(order)
+            if self.audit is not None:
+                self.audit.record_decision(order, session_id, result, '' if result else 'basket', message)
+        return decisions
+
+    def get_account(self, account_id):
+        account = self.risk_state.get_account(account_id) if self.risk_state is not None else None
+        return account or self.database.get_account(account_id)
+
     def check_order(self, order, account, session_id):
-        risk_settings = self.database.get_risk_settings(session_id)
+        # One read of the pipeline, a reload during this order doesn't affect it
+        pipeline = self.pipeline
+        risk_settings = self.get_risk_settings(session_id, pipeline)
         if not risk_settings:
             return False, "Risk settings not found for session."
         
-        for plugin in self.plugins.values():
-            result, message = plugin.check(order, account, session_id, risk_settings)
+        plugin_results = {}
+        if self.recorder is not None:
+            self.recorder.begin(account, session_id)
+        result, message = self.run_plugins(order, account, session_id, risk_settings, plugin_results, pipeline)
+        if self.recorder is not None:
+            self.recorder.record(
+                order, account, session_id, risk_settings, plugin_results, result, pipeline.reference_version
+            )
+        if result:
+            self.reserve_order(order)
+        return result, message
+
+    def reserve_order(self, order):
+        # Working orders count against credit and notional limits until they fill, cancel or get rejected
+        if not self.reserve_open_orders:
+            return
+        try:
+            self.risk_state.reserve_order(
+                order['order_id'], order['account_id'], order.get('asset_class', 'EQUITY'),
+                order['quantity'], self.get_order_notional(order)
+            )
+        except Exception as e:
+            logging.error(f"Failed to reserve exposure for order {order.get('order_id')}: {e}")
+
+    def rebuild_open_orders(self, orders):
+        # The order store is the record of what is working. A cold start has no ledger and a snapshot
+        # can be behind, so reserve the working orders the ledger is missing and drop the ones it
+        # still holds that are no longer working.
+        if self.limit_reservations is not None:
+            try:
+                self.limit_reservations.rebuild(orders, self.get_risk_settings)
+            except Exception as e:
+                logging.error(f"Failed to rebuild limit reservations: {e}")
+        if not self.reserve_open_orders:
+            return
+        working = {order['order_id']: order for order in orders}
+        for order_id in self.risk_state.open_order_ids() - set(working):
+            self.risk_state.release_order(order_id)
+        for order in working.values():
+            remaining = order['quantity'] - (order.get('filled_quantity') or 0)
+            if remaining > 0:
+                self.reserve_order(dict(order, quantity=remaining))
+        logging.info(f"Open-order ledger holds {len(self.risk_state.open_order_ids())} working orders")
+
+    def get_order_notional(self, order):
+        reference_data = self.reference_data
+        if reference_data is not None and order.get('order_type') == 'SPREAD':
+            return abs(self.basket.get_spread_notional(order, reference_data))
+        price = order.get('price')
+        if price is None and self.market_data is not None:
+            price = self.market_data.get_last_trade(order['ticker'])
+        multiplier = 1.0
+        if reference_data is not None:
+            multiplier = self.basket.get_multiplier(order, reference_data)
+        notional = float(price or 0.0) * order['quantity'] * multiplier
+        option_analytics = reference_data.get('option_analytics') if reference_data is not None else None
+        if option_analytics is not None and order.get('asset_class', 'EQUITY') == 'OPTION':
+            # Options count at delta-adjusted notional in the credit and notional checks, reserve the same
+            delta_notional = float(option_analytics.delta_notionals(
+                [order['ticker']], [order['quantity']], self.market_data.get_last_trade
+            )[0]) if self.market_data is not None else float('nan')
+            if delta_notional == delta_notional:
+                notional = abs(delta_notional)
+        return 0.0 if notional != notional else notional  # NaN when the contract size is unknown
+
+    def run_plugins(self, order, account, session_id, risk_settings, plugin_results, pipeline):
+        for name, check in pipeline.checks:
+            result, message = check(order, account, session_id, risk_settings)
+            plugin_results[name] = (result, message)
+            if not result:
+                if self.audit is not None:
+                    self.audit.record_decision(order, session_id, False, name, message)
+                return False, message
+
+        # Take budget from the cluster-wide leases only once every local check passed
+        if self.limit_reservations is not None:
+            result, message = self.limit_reservations.check(order, account, session_id, risk_settings)
+            plugin_results['limit_reservations'] = (result, message)
             if not result:
+                if self.audit is not None:
+                    self.audit.record_decision(order, session_id, False, 'limit_reservations', message)
                 return False, message
         return True, ""
 
@@ -0,0 +1,330 @@
+# src/risk_state.py
+
+import threading
+import logging
+from datetime import date, datetime, timedelta
+
+# A fill can reach the database just before a snapshot and memory just after it. Position rows
+# hold absolute values, so a warm restart replays from a little before the snapshot was taken.
+REPLAY_OVERLAP = timedelta(seconds=5)
+
+class RiskState:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.positions = {}      # account_id -> {(session_id, ticker): position}, one per positions row
+        self.daily_volumes = {}  # session_id -> quantity filled today
+        self.exposure = {}       # account_id -> {asset_class: notional}
+        self.open_orders = {}    # order_id -> [account_id, asset_class, remaining quantity, notional per unit]
+        self.open_exposure = {}  # account_id -> {asset_class: notional of working orders}
+        self.accounts = {}       # account_id -> account row
+        self.mode_overrides = {} # account_id -> trading mode set here, kept until the database agrees
+        self.owns = None         # account_id -> bool when only some accounts are held here (a shard)
+        self.as_of = None        # time the state last matched the database: a sync or a snapshot
+        self.version = 0         # bumped on every change, identifies what a decision saw
+        self.trading_date = date.today()
+
+    def load_from_database(self, database):
+        # Cold start: rebuild everything from Postgres
+        as_of = datetime.now()
+        positions = database.get_all_positions()
+        volumes = database.get_daily_volumes()
+        with self.lock:
+            self.positions.clear()
+            self.exposure.clear()
+            for position in positions:
+                self._apply_position(position)
+            self.daily_volumes = volumes
+            self.version += 1
+            self.as_of = as_of
+            self.trading_date = as_of.date()
+        logging.info(f"Risk state loaded from database: {len(positions)} positions")
+
+    def replay_from_database(self, database):
+        # Warm start: apply only the rows that changed since the snapshot was taken
+        as_of = datetime.now()
+        positions = database.get_positions_updated_since(self.as_of)
+        volumes = database.get_daily_volumes(updated_since=self.as_of)
+        with self.lock:
+            for position in positions:
+                self._apply_position(position)
+            self.daily_volumes.update(volumes)
+            self.version += 1
+            self.as_of = as_of
+        logging.info(f"Risk state replayed {len(positions)} position changes since snapshot")
+
+    def apply_position(self, position):
+        with self.lock:
+            self._apply_position(position)
+
+    def apply_fill(self, account_id, session_id, ticker, quantity, price, asset_class='EQUITY'):
+        with self.lock:
+            account_positions = self.positions.setdefault(account_id, {})
+            position = account_positions.get((session_id, ticker))
+            if position is None:
+                position = {
+                    'account_id': account_id,
+                    'session_id': session_id,
+                    'ticker': ticker,
+                    'quantity': 0,
+                    'average_price': 0.0,
+                    'asset_class': asset_class
+                }
+                account_positions[(session_id, ticker)] = position
+
+            old_quantity = position['quantity']
+            new_quantity = old_quantity + quantity
+            if new_quantity != 0 and (old_quantity == 0 or (old_quantity > 0) != (new_quantity > 0)):
+                # Opened from flat, long or short, or flipped sides: the remainder was opened at this price
+                position['average_price'] = price
+            elif new_quantity != 0 and (old_quantity > 0) == (quantity > 0):
+                # Adding to the position moves the average price
+                position['average_price'] = (
+                    old_quantity * position['average_price'] + quantity * price
+                ) / new_quantity
+            position['quantity'] = new_quantity
+
+            self._roll_trading_date()
+            self.daily_volumes[session_id] = self.daily_volumes.get(session_id, 0) + abs(quantity)
+            self._recompute_exposure(account_id)
+            self.version += 1
+
+    def load_accounts(self, accounts):
+        with self.lock:
+            self.accounts = {
+                account['account_id']: dict(account) for account in accounts
+                if self.owns is None or self.owns(account['account_id'])
+            }
+
+    def refresh_accounts(self, accounts):
+        # Picks up changes made in the database, such as a new trading mode. A mode set here by
+        # the kill switch wins until its own database write shows up in the rows.
+        with self.lock:
+            for row in accounts:
+                account_id = row['account_id']
+                if self.owns is not None and not self.owns(account_id):
+                    continue
+                account = dict(row)
+                override = self.mode_overrides.get(account_id)
+                if override is not None:
+                    if account.get('trading_mode', 'NORMAL') == override:
+                        del self.mode_overrides[account_id]
+                    else:
+                        account['trading_mode'] = override
+                self.accounts[account_id] = account
+            self.version += 1
+
+    def get_account(self, account_id):
+        with self.lock:
+            account = self.accounts.get(account_id)
+            return dict(account) if account else None
+
+    def set_trading_mode(self, account_id, trading_mode):
+        # Returns the mode it replaced, None if the account is not cached
+        with self.lock:
+            account = self.accounts.get(account_id)
+            if account is None:
+                return None
+            previous = account.get('trading_mode', 'NORMAL')
+            account['trading_mode'] = trading_mode
+            self.mode_overrides[account_id] = trading_mode
+            return previous
+
+    def held_tickers(self):
+        with self.lock:
+            return {
+                position['ticker']
+                for account_positions in self.positions.values()
+                for position in account_positions.values()
+                if position['quantity'] != 0
+            }
+
+    def get_all_positions(self):
+        with self.lock:
+            return [
+                dict(position)
+                for account_positions in self.positions.values()
+                for position in account_positions.values()
+            ]
+
+    def get_positions(self, account_id):
+        with self.lock:
+            return [dict(position) for position in self.positions.get(account_id, {}).values()]
+
+    def get_account_view(self, account_id, session_id):
+        # Positions, session volume and working-order exposure read under one lock
+        with self.lock:
+            self._roll_trading_date()
+            return (
+                [dict(position) for position in self.positions.get(account_id, {}).values()],
+                self.daily_volumes.get(session_id, 0),
+                dict(self.open_exposure.get(account_id, {}))
+            )
+
+    def get_decision_view(self, account_id, session_id):
+        # What a decision is checked against and the version that identifies it, read under one lock
+        with self.lock:
+            self._roll_trading_date()
+            return (
+                self.version,
+                [dict(position) for position in self.positions.get(account_id, {}).values()],
+                self.daily_volumes.get(session_id, 0),
+                dict(self.open_exposure.get(account_id, {}))
+            )
+
+    def get_daily_volume(self, session_id):
+        with self.lock:
+            self._roll_trading_date()
+            return self.daily_volumes.get(session_id, 0)
+
+    def reserve_order(self, order_id, account_id, asset_class, quantity, notional):
+        # Accepted orders hold exposure until they fill, cancel or get rejected
+        with self.lock:
+            if order_id in self.open_orders:
+                return
+            unit_notional = notional / quantity if quantity else 0.0
+            self.open_orders[order_id] = [account_id, asset_class, quantity, unit_notional]
+            self._add_open_exposure(account_id, asset_class, notional)
+            self.version += 1
+
+    def release_order(self, order_id, account_id=None, quantity=None):
+        # Partial release on a fill (the position takes over), full release otherwise
+        with self.lock:
+            entry = self.open_orders.get(order_id)
+            if entry is None:
+                return
+            account_id, asset_class, remaining, unit_notional = entry
+            released = remaining if quantity is None else min(quantity, remaining)
+            entry[2] = remaining - released
+            if entry[2] <= 0:
+                del self.open_orders[order_id]
+            self._add_open_exposure(account_id, asset_class, -released * unit_notional)
+            self.version += 1
+
+    def open_order_ids(self):
+        with self.lock:
+            return set(self.open_orders)
+
+    def get_open_exposure(self, account_id, asset_class=None):
+        with self.lock:
+            exposure = self.open_exposure.get(account_id, {})
+            if asset_class is None:
+                return sum(exposure.values())
+            return exposure.get(asset_class, 0.0)
+
+    def get_exposure(self, account_id, asset_class=None):
+        with self.lock:
+            exposure = self.exposure.get(account_id, {})
+            if asset_class is None:
+                return sum(exposure.values())
+            return exposure.get(asset_class, 0.0)
+
+    def retain_accounts(self, owns):
+        # Drop the accounts this process is not responsible for. Set before the warm-up, the
+        # others are never loaded.
+        with self.lock:
+            self.owns = owns
+            for account_id in [a for a in self.positions if not owns(a)]:
+                del self.positions[account_id]
+                self.exposure.pop(account_id, None)
+            for order_id in [o for o, entry in self.open_orders.items() if not owns(entry[0])]:
+                del self.open_orders[order_id]
+            for account_id in [a for a in self.open_exposure if not owns(a)]:
+                del self.open_exposure[account_id]
+            for account_id in [a for a in self.accounts if not owns(a)]:
+                del self.accounts[account_id]
+
+    def export_account(self, account_id):
+        with self.lock:
+            self.exposure.pop(account_id, None)
+            self.open_exposure.pop(account_id, None)
+            open_orders = {o: entry for o, entry in self.open_orders.items() if entry[0] == account_id}
+            for order_id in open_orders:
+                del self.open_orders[order_id]
+            return {
+                'account_id': account_id,
+                'account': self.accounts.pop(account_id, None),
+                'positions': list(self.positions.pop(account_id, {}).values()),
+                'open_orders': open_orders
+            }
+
+    def import_account(self, data):
+        with self.lock:
+            if data['account'] is not None:
+                self.accounts[data['account']['account_id']] = data['account']
+            for position in data['positions']:
+                self._apply_position(position)
+            for order_id, entry in data.get('open_orders', {}).items():
+                self.open_orders[order_id] = list(entry)
+                self._add_open_exposure(entry[0], entry[1], entry[2] * entry[3])
+
+    def to_dict(self):
+        with self.lock:
+            self._roll_trading_date()
+            return {
+                # Taken with the state it describes; None until the state was ever loaded
+                'as_of': datetime.now().isoformat() if self.as_of else None,
+                'trading_date': self.trading_date.isoformat(),
+                'positions': [
+                    position
+                    for account_positions in self.positions.values()
+                    for position in account_positions.values()
+                ],
+                'daily_volumes': self.daily_volumes,
+                'exposure': self.exposure,
+                'open_orders': [[order_id] + entry for order_id, entry in self.open_orders.items()]
+            }
+
+    def load_dict(self, data):
+        with self.lock:
+            self.positions.clear()
+            self.exposure.clear()
+            for position in data['positions']:
+                self._apply_position(position)
+            self.as_of = datetime.fromisoformat(data['as_of']) - REPLAY_OVERLAP if data['as_of'] else None
+            self.trading_date = date.fromisoformat(data['trading_date'])
+            # JSON turns integer keys into strings
+            self.daily_volumes = {int(k): v for k, v in data['daily_volumes'].items()}
+            self.open_orders.clear()
+            self.open_exposure.clear()
+            for order_id, account_id, asset_class, remaining, unit_notional in data.get('open_orders', []):
+                if self.owns is not None and not self.owns(account_id):
+                    continue
+                self.open_orders[order_id] = [account_id, asset_class, remaining, unit_notional]
+                self._add_open_exposure(account_id, asset_class, remaining * unit_notional)
+            self._roll_trading_date()
+
+    def _roll_trading_date(self):
+        # Volumes are per trading day, don't carry them over; checked wherever they are used
+        if self.trading_date != date.today():
+            self.daily_volumes = {}
+            self.trading_date = date.today()
+
+    def _apply_position(self, position):
+        account_id = position['account_id']
+        if self.owns is not None and not self.owns(account_id):
+            return
+        session_id = position.get('session_id')
+        self.positions.setdefault(account_id, {})[(session_id, position['ticker'])] = {
+            'account_id': account_id,
+            'session_id': session_id,
+            'ticker': position['ticker'],
+            'quantity': int(position['quantity']),
+            'average_price': float(position.get('average_price') or 0.0),
+            'asset_class': position.get('asset_class') or 'EQUITY'
+        }
+        self._recompute_exposure(account_id)
+        self.version += 1
+
+    def _recompute_exposure(self, account_id):
+        # Cost-basis notional per asset class, plugins still mark to market
+        exposure = {}
+        for position in self.positions.get(account_id, {}).values():
+            asset_class = position['asset_class']
+            notional = abs(position['quantity']) * position['average_price']
+            exposure[asset_class] = exposure.get(asset_class, 0.0) + notional
+        self.exposure[account_id] = exposure
+
+    def _add_open_exposure(self, account_id, asset_class, notional):
+        exposure = self.open_exposure.setdefault(account_id, {})
+        # Clamp so rounding never leaves a negative reservation behind
+        exposure[asset_class] = max(exposure.get(asset_class, 0.0) + notional, 0.0)
@@ -0,0 +1,162 @@
+# src/scheduler.py
+
+import heapq
+import itertools
+import logging
+import threading
+import time
+from collections import deque
+import numpy as np
+
+DEFAULT_CLASSES = {
+    'latency_sensitive': {'weight': 8, 'shed_at': 1.0},
+    'standard': {'weight': 4, 'shed_at': 0.9},
+    'bulk': {'weight': 1, 'shed_at': 0.5, 'max_wait': 1.0}
+}
+
+class SessionQueue:
+    __slots__ = ('orders', 'last_finish', 'busy')
+
+    def __init__(self):
+        self.orders = deque()  # (start tag, order, priority class, enqueued at)
+        self.last_finish = 0.0
+        self.busy = False
+
+
+class FairScheduler:
+    # Start-time fair queuing across FIX sessions. Each order gets a virtual start tag, spaced
+    # 1/weight apart within its session, and workers always serve the session whose next order
+    # has the smallest tag. A session flooding the gateway only pushes back its own tags.
+    # A session is handled by one worker at a time, so its orders keep their arrival order.
+    def __init__(self, config, handler, reject, workers=None):
+        scheduler_config = config.get('scheduler', {})
+        self.handler = handler
+        self.reject = reject
+        self.classes = scheduler_config.get('priority_classes') or DEFAULT_CLASSES
+        self.default_class = scheduler_config.get('default_class', 'standard')
+        self.account_classes = {
+            int(account_id): priority_class
+            for account_id, priority_class in (scheduler_config.get('accounts') or {}).items()
+        }
+        self.max_queue = scheduler_config.get('max_queue', 10000)
+        self.max_session_queue = scheduler_config.get('max_session_queue', 1000)
+        # process_order shares one database connection and unlocked plugin state, one worker keeps
+        # it single-threaded as under the SocketAcceptor; fairness comes from the order served next.
+        # With shards the application asks for more, they overlap only their waits for the shards.
+        self.workers = workers or scheduler_config.get('workers', 1)
+        self.metrics_interval = scheduler_config.get('metrics_interval', 60)
+
+        self.sessions = {}
+        self.ready = []  # heap of (start tag of the head order, sequence, session_id)
+        self.sequence = itertools.count()
+        self.virtual_time = 0.0
+        self.depth = 0
+        self.condition = threading.Condition()
+        self.metrics = {
+            name: {'queued': 0, 'served': 0, 'shed': 0, 'expired': 0, 'waits': deque(maxlen=10000)}
+            for name in self.classes
+        }
+        self.metrics_lock = threading.Lock()
+
+    def start(self):
+        for _ in range(self.workers):
+            threading.Thread(target=self.run, daemon=True).start()
+        if self.metrics_interval:
+            threading.Thread(target=self.log_metrics, daemon=True).start()
+        logging.info(f"Order scheduler started with {self.workers} workers")
+
+    def priority_class(self, order):
+        priority_class = self.account_classes.get(order.get('account_id'), self.default_class)
+        return priority_class if priority_class in self.classes else self.default_class
+
+    def submit(self, order, session_id):
+        priority_class = self.priority_class(order)
+        settings = self.classes[priority_class]
+        with self.condition:
+            session = self.sessions.get(session_id)
+            session_depth = len(session.orders) if session is not None else 0
+            # Shed before the order has used the database or market data, lower classes first
+            shed = (
+                self.depth >= settings.get('shed_at', 1.0) * self.max_queue
+                or session_depth >= self.max_session_queue
+            )
+            if not shed:
+                if session is None:
+                    session = self.sessions[session_id] = SessionQueue()
+                start = max(self.virtual_time, session.last_finish)
+                session.last_finish = start + 1.0 / settings.get('weight', 1)
+                session.orders.append((start, order, priority_class, time.monotonic()))
+                self.depth += 1
+                if not session.busy and len(session.orders) == 1:
+                    heapq.heappush(self.ready, (start, next(self.sequence), session_id))
+                    self.condition.notify()
+        self.count(priority_class, 'shed' if shed else 'queued')
+        if shed:
+            # Counted rather than logged, a log line per shed order would add to the overload
+            try:
+                self.reject(order, session_id, "Gateway overloaded, order not accepted.")
+            except Exception as e:
+                logging.error(f"Failed to reject shed order for session {session_id}: {e}")
+            return False
+        return True
+
+    def run(self):
+        while True:
+            with self.condition:
+                while not self.ready:
+                    self.condition.wait()
+                start, _, session_id = heapq.heappop(self.ready)
+                session = self.sessions[session_id]
+                _, order, priority_class, enqueued_at = session.orders.popleft()
+                session.busy = True
+                self.depth -= 1
+                self.virtual_time = max(self.virtual_time, start)
+
+            try:
+                self.serve(order, session_id, priority_class, enqueued_at)
+            except Exception as e:
+                logging.error(f"Failed to process order for session {session_id}: {e}")
+            finally:
+                # Whatever happened, the session has to become schedulable again
+                with self.condition:
+                    session.busy = False
+                    if session.orders:
+                        heapq.heappush(self.ready, (session.orders[0][0], next(self.sequence), session_id))
+                        self.condition.notify()
+                    else:
+                        del self.sessions[session_id]
+
+    def serve(self, order, session_id, priority_class, enqueued_at):
+        waited = time.monotonic() - enqueued_at
+        max_wait = self.classes[priority_class].get('max_wait')
+        if max_wait is not None and waited > max_wait:
+            self.count(priority_class, 'expired')
+            self.reject(order, session_id, "Order expired in the gateway queue.")
+            return
+        self.handler(order, session_id)
+        self.count(priority_class, 'served', waited)
+
+    def count(self, priority_class, name, waited=None):
+        with self.metrics_lock:
+            metrics = self.metrics[priority_class]
+            metrics[name] += 1
+            if waited is not None:
+                metrics['waits'].append(waited)
+
+    def get_metrics(self):
+        metrics = {}
+        with self.metrics_lock:
+            snapshot = {name: dict(counts, waits=list(counts['waits'])) for name, counts in self.metrics.items()}
+        for name, counts in snapshot.items():
+            waits = np.array(counts['waits'])
+            metrics[name] = {
+                'queued': counts['queued'], 'served': counts['served'],
+                'shed': counts['shed'], 'expired': counts['expired'],
+                'wait_p99_ms': float(np.percentile(waits, 99) * 1000) if len(waits) else 0.0
+            }
+        return {'depth': self.depth, 'classes': metrics}
+
+    def log_metrics(self):
+        while True:
+            time.sleep(self.metrics_interval)
+            logging.info(f"Order scheduler: {self.get_metrics()}")
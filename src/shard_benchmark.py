@@ -0,0 +1,106 @@
+# src/shard_benchmark.py
+
+import argparse
+import logging
+import threading
+import time
+from src.scheduler import FairScheduler
+from src.sharding import ShardRouter, serve
+from src.shm_ring import SharedRing
+
+def busy(seconds):
+    # Stands in for plugin work that holds the CPU
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+def bench_shard(index, config, overrides, request_ring_name, response_ring_name):
+    # Shard without database or market data, each check costs what the benchmark asks for
+    sharding_config = config['sharding']
+    slots = sharding_config.get('ring_slots', 4096)
+    slot_size = sharding_config.get('slot_size', 4096)
+    requests = SharedRing(request_ring_name, slots, slot_size)
+    responses = SharedRing(response_ring_name, slots, slot_size)
+    cpu = config['benchmark']['cpu_ms'] / 1000.0
+    wait = config['benchmark']['wait_ms'] / 1000.0
+    responses.put(('ready', f"ready-{index}", True))
+
+    def check():
+        busy(cpu)
+        if wait:
+            time.sleep(wait)
+        return True, "Order passed all risk checks"
+
+    def handle(kind, payload):
+        if kind == 'check':
+            return check()
+        if kind == 'check_batch':
+            return [check() for _ in payload[0]]
+        return True
+
+    serve(index, requests, responses, handle)
+
+
+def run(shards, workers, args):
+    config = {
+        'sharding': {'shards': shards, 'ring_slots': 1024, 'slot_size': 4096, 'timeout': 30},
+        'scheduler': {'metrics_interval': 0, 'max_queue': args.orders, 'max_session_queue': args.orders},
+        'benchmark': {'cpu_ms': args.cpu_ms, 'wait_ms': args.wait_ms}
+    }
+    router = ShardRouter(config, target=bench_shard)
+    if not router.start():
+        raise RuntimeError("Benchmark shards failed to start")
+
+    # Same split as TradingApplication.process_order: front-end work under one lock, shard wait outside it
+    order_lock = threading.Lock()
+    done = threading.Semaphore(0)
+
+    def process_order(order, session_id):
+        with order_lock:
+            busy(args.front_ms / 1000.0)
+        router.check_order(order, {'account_id': order['account_id']}, session_id)
+        with order_lock:
+            done.release()
+
+    def reject(order, session_id, message):
+        done.release()
+
+    scheduler = FairScheduler(config, process_order, reject, workers)
+    scheduler.start()
+    started = time.perf_counter()
+    for i in range(args.orders):
+        order = {
+            'order_id': i, 'account_id': i % args.accounts + 1, 'ticker': 'AAPL', 'side': 'BUY',
+            'quantity': 100, 'price': 150.0
+        }
+        scheduler.submit(order, f"SESSION-{i % args.sessions}")
+    for _ in range(args.orders):
+        done.acquire()
+    elapsed = time.perf_counter() - started
+    router.stop()
+    return args.orders / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Order throughput through the scheduler and the risk shards")
+    parser.add_argument('--orders', type=int, default=2000)
+    parser.add_argument('--sessions', type=int, default=32)
+    parser.add_argument('--accounts', type=int, default=1000)
+    parser.add_argument('--shards', type=int, nargs='+', default=[1, 2, 4])
+    parser.add_argument('--in-flight', type=int, default=4, help="orders waiting on each shard at once")
+    parser.add_argument('--cpu-ms', type=float, default=0.2, help="CPU time of a shard check")
+    parser.add_argument('--wait-ms', type=float, default=1.0, help="time a shard check waits, e.g. on the database")
+    parser.add_argument('--front-ms', type=float, default=0.05, help="front-end work of an order, under the lock")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.WARNING)
+
+    print(f"{'shards':>6} {'workers':>7} {'orders/s':>10}")
+    for shards in args.shards:
+        # One worker is the old behaviour, every order waits for its decision before the next is read
+        for workers in (1, shards * args.in_flight):
+            print(f"{shards:>6} {workers:>7} {run(shards, workers, args):>10.0f}")
+
+
+if __name__ == '__main__':
+    main()
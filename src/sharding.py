@@ -0,0 +1,317 @@
+# src/sharding.py
+
+import itertools
+import logging
+import multiprocessing
+import threading
+import zlib
+from concurrent.futures import Future, TimeoutError
+from src.audit import AuditJournal
+from src.database import Database
+from src.hot_reload import HotReloader
+from src.decision_log import DecisionRecorder
+from src.limit_reservations import create_limit_reservations
+from src.risk_management import RiskManagement, DEFAULT_PLUGINS
+from src.risk_state import RiskState
+from src.shm_ring import SharedRing
+from src.snapshot import RiskStateSnapshot
+from src.warmup import StartupWarmup
+from market_data.resilient import create_market_data
+
+class ShardMap:
+    def __init__(self, shards, overrides=None):
+        self.shards = shards
+        # Accounts moved off their hash shard by a rebalance
+        self.overrides = dict(overrides or {})
+
+    def shard_for(self, account_id):
+        shard = self.overrides.get(account_id)
+        if shard is None:
+            # Stable across processes, unlike hash()
+            shard = zlib.crc32(str(account_id).encode()) % self.shards
+        return shard
+
+    def move(self, account_id, shard):
+        self.overrides[account_id] = shard
+
+
+def run_shard(index, config, overrides, request_ring_name, response_ring_name):
+    # Entry point of a worker process, owns the risk state of its partition of accounts
+    logging.basicConfig(level=logging.INFO, format=f"%(asctime)s shard-{index} %(levelname)s %(message)s")
+    sharding_config = config['sharding']
+    slots = sharding_config.get('ring_slots', 4096)
+    slot_size = sharding_config.get('slot_size', 4096)
+    requests = SharedRing(request_ring_name, slots, slot_size)
+    responses = SharedRing(response_ring_name, slots, slot_size)
+
+    shard_map = ShardMap(sharding_config['shards'], overrides)
+    session_plugins = sharding_config.get('session_plugins', ['message_throttling'])
+    plugin_names = config.get('risk_management', {}).get('plugins') or DEFAULT_PLUGINS
+    database = Database(config['database'])
+    risk_state = RiskState()
+    # Every shard is a node of its own towards the lease coordinator
+    limit_reservations = create_limit_reservations(config, risk_state)
+    audit = AuditJournal(config, path_suffix=f".shard{index}")
+    audit.start()
+    market_data = create_market_data(config)
+    recorder = None
+    if config.get('decision_log', {}).get('enabled', True):
+        recorder = DecisionRecorder(config, risk_state, market_data, path_suffix=f".shard{index}")
+    risk_management = RiskManagement(
+        database, risk_state,
+        plugin_names=[name for name in plugin_names if name not in session_plugins],
+        limit_reservations=limit_reservations,
+        audit=audit,
+        recorder=recorder,
+        market_data=market_data
+    )
+    snapshot_config = config.get('snapshot', {})
+    snapshot = RiskStateSnapshot(f"{snapshot_config.get('path', 'data/risk_state.snap')}.shard{index}")
+
+    # Only this shard's accounts are loaded, and only their tickers prefetched
+    risk_state.retain_accounts(lambda account_id: shard_map.shard_for(account_id) == index)
+    warmup = StartupWarmup(
+        config, database, risk_state, risk_management, market_data, snapshot, shared_instruments=True
+    )
+    ready = warmup.run()
+    snapshot.start(risk_state, risk_management, snapshot_config.get('interval', 5))
+    # Every shard watches the files and refreshes from the database itself, and swaps its own pipeline
+    HotReloader(
+        config.get('hot_reload', {}).get('config_file', 'config/config.yml'), risk_management, warmup,
+        plugin_filter=lambda name: name not in session_plugins
+    ).start()
+    responses.put(('ready', f"ready-{index}", ready))
+
+    def handle(kind, payload):
+        if kind == 'check':
+            order, account, session_id = payload
+            return risk_management.check_order(order, account, session_id)
+        if kind == 'check_batch':
+            batch, session_id = payload
+            return risk_management.check_orders(batch, session_id)
+        if kind == 'fill':
+            risk_state.apply_fill(**payload)
+        elif kind == 'release':
+            risk_state.release_order(*payload)
+            if limit_reservations is not None:
+                # Comes after the fill it belongs to, so the position is already up to date
+                limit_reservations.release_order(payload[0], payload[2])
+        elif kind == 'rebuild_open_orders':
+            risk_management.rebuild_open_orders(payload)
+        elif kind == 'trading_mode':
+            return risk_state.set_trading_mode(*payload)
+        elif kind == 'export':
+            # The shard's own map follows the move, it decides which accounts a refresh keeps
+            account_id, target = payload
+            result = risk_state.export_account(account_id)
+            shard_map.move(account_id, target)
+            return result
+        elif kind == 'import':
+            shard_map.move(payload['account_id'], index)
+            risk_state.import_account(payload)
+        elif kind == 'stop':
+            snapshot.write(risk_state, risk_management)
+            if limit_reservations is not None:
+                limit_reservations.return_leases()
+            audit.stop()
+        else:
+            logging.error(f"Unknown shard request: {kind}")
+            return None
+        return True
+
+    serve(index, requests, responses, handle)
+    requests.close()
+    responses.close()
+
+
+def error_result(kind, payload):
+    # The answer to a request the shard could not handle or could not send the result of
+    if kind == 'check':
+        return False, "Error in risk check"
+    if kind == 'check_batch':
+        return [(False, "Error in risk check")] * len(payload[0])
+    return None
+
+
+def serve(index, requests, responses, handle):
+    # Request loop of a shard. Requests without an id (fills, releases) get no response.
+    while True:
+        kind, request_id, payload = requests.get()
+        try:
+            result = handle(kind, payload)
+        except Exception as e:
+            logging.error(f"Shard {index} failed to handle {kind}: {e}")
+            result = error_result(kind, payload)
+        if request_id is not None:
+            try:
+                responses.put((kind, request_id, result))
+            except Exception as e:
+                # An unpicklable or oversized result must not end the loop, the caller still gets an answer
+                logging.error(f"Shard {index} failed to send the result of {kind}: {e}")
+                responses.put((kind, request_id, error_result(kind, payload)))
+        if kind == 'stop':
+            break
+
+
+class ShardRouter:
+    def __init__(self, config, target=run_shard):
+        self.config = config
+        self.target = target  # entry point of the shard processes
+        sharding_config = config['sharding']
+        self.shard_map = ShardMap(sharding_config['shards'])
+        self.slots = sharding_config.get('ring_slots', 4096)
+        self.slot_size = sharding_config.get('slot_size', 4096)
+        self.timeout = sharding_config.get('timeout', 5)
+        self.request_rings = []
+        self.response_rings = []
+        self.put_locks = []
+        self.processes = []
+        self.pending = {}  # request_id -> Future
+        self.request_ids = itertools.count()
+        # Held while routing, so an account never has orders on two shards during a rebalance
+        self.routing_lock = threading.Lock()
+
+    def start(self, timeout=300):
+        # spawn, not fork: the parent already has database connections and FIX threads
+        context = multiprocessing.get_context('spawn')
+        ready = []
+        for index in range(self.shard_map.shards):
+            request_ring = SharedRing(slots=self.slots, slot_size=self.slot_size)
+            response_ring = SharedRing(slots=self.slots, slot_size=self.slot_size)
+            self.request_rings.append(request_ring)
+            self.response_rings.append(response_ring)
+            self.put_locks.append(threading.Lock())
+
+            future = Future()
+            self.pending[f"ready-{index}"] = future
+            ready.append(future)
+
+            process = context.Process(
+                target=self.target,
+                args=(index, self.config, self.shard_map.overrides, request_ring.name, response_ring.name),
+                daemon=True
+            )
+            process.start()
+            self.processes.append(process)
+            threading.Thread(target=self.respond, args=(index,), daemon=True).start()
+
+        try:
+            results = [future.result(timeout) for future in ready]
+        except TimeoutError:
+            logging.error("Risk shards did not become ready in time.")
+            return False
+        logging.info(f"Started {len(self.processes)} risk shards, ready={all(results)}")
+        return all(results)
+
+    def submit(self, shard, kind, payload):
+        request_id = next(self.request_ids)
+        future = Future()
+        self.pending[request_id] = future
+        try:
+            with self.put_locks[shard]:
+                self.request_rings[shard].put((kind, request_id, payload))
+        except Exception as e:
+            # Never sent, so no response will come for it
+            self.pending.pop(request_id, None)
+            future.set_exception(e)
+        return future
+
+    def check_order(self, order, account, session_id):
+        with self.routing_lock:
+            shard = self.shard_map.shard_for(order['account_id'])
+            future = self.submit(shard, 'check', (order, account, session_id))
+        try:
+            return future.result(self.timeout)
+        except TimeoutError:
+            logging.error(f"Risk shard {shard} timed out on order for account {order['account_id']}")
+            return False, "Risk check timed out."
+        except Exception as e:
+            logging.error(f"Risk shard {shard} failed on order for account {order['account_id']}: {e}")
+            return False, "Error in risk check"
+
+    def check_orders(self, batch, session_id):
+        # Each shard evaluates its accounts' part of the basket, in the original order
+        with self.routing_lock:
+            parts = {}
+            for index, order in enumerate(batch):
+                parts.setdefault(self.shard_map.shard_for(order['account_id']), []).append(index)
+            futures = {
+                shard: self.submit(shard, 'check_batch', ([batch[i] for i in indexes], session_id))
+                for shard, indexes in parts.items()
+            }
+        decisions = [None] * len(batch)
+        for shard, future in futures.items():
+            try:
+                results = future.result(self.timeout)
+            except TimeoutError:
+                logging.error(f"Risk shard {shard} timed out on basket")
+                results = [(False, "Risk check timed out.")] * len(parts[shard])
+            except Exception as e:
+                logging.error(f"Risk shard {shard} failed on basket: {e}")
+                results = [(False, "Error in risk check")] * len(parts[shard])
+            for index, result in zip(parts[shard], results):
+                decisions[index] = result
+        return decisions
+
+    def apply_fill(self, **fill):
+        # Same interface as RiskState.apply_fill, so the OrderManager doesn't care where state lives
+        with self.routing_lock:
+            shard = self.shard_map.shard_for(fill['account_id'])
+            with self.put_locks[shard]:
+                self.request_rings[shard].put(('fill', None, fill))
+
+    def release_order(self, order_id, account_id, quantity=None):
+        with self.routing_lock:
+            shard = self.shard_map.shard_for(account_id)
+            with self.put_locks[shard]:
+                self.request_rings[shard].put(('release', None, (order_id, account_id, quantity)))
+
+    def rebuild_open_orders(self, orders):
+        # Every shard gets its part, an empty one too so it drops reservations of finished orders
+        with self.routing_lock:
+            parts = {shard: [] for shard in range(len(self.processes))}
+            for order in orders:
+                parts[self.shard_map.shard_for(order['account_id'])].append(order)
+            futures = [self.submit(shard, 'rebuild_open_orders', part) for shard, part in parts.items()]
+        for future in futures:
+            future.result(self.timeout)
+
+    def set_trading_mode(self, account_id, trading_mode):
+        with self.routing_lock:
+            shard = self.shard_map.shard_for(account_id)
+            future = self.submit(shard, 'trading_mode', (account_id, trading_mode))
+        return future.result(self.timeout)
+
+    def rebalance(self, account_id, shard):
+        with self.routing_lock:
+            old_shard = self.shard_map.shard_for(account_id)
+            if old_shard == shard:
+                return
+            # Requests are handled in ring order, so the export comes after any in-flight order
+            data = self.submit(old_shard, 'export', (account_id, shard)).result(self.timeout)
+            self.submit(shard, 'import', data).result(self.timeout)
+            self.shard_map.move(account_id, shard)
+        logging.info(f"Moved account {account_id} from shard {old_shard} to shard {shard}")
+
+    def respond(self, index):
+        ring = self.response_rings[index]
+        while True:
+            kind, request_id, result = ring.get()
+            future = self.pending.pop(request_id, None)
+            if future is not None:
+                future.set_result(result)
+            if kind == 'stop':
+                break
+
+    def stop(self):
+        stopped = [self.submit(shard, 'stop', None) for shard in range(len(self.processes))]
+        for future in stopped:
+            try:
+                future.result(self.timeout)
+            except TimeoutError:
+                logging.error("Risk shard did not stop in time.")
+        for process in self.processes:
+            process.join(self.timeout)
+        for ring in self.request_rings + self.response_rings:
+            ring.close()
+        logging.info("Risk shards stopped.")
@@ -0,0 +1,111 @@
+# src/shm_ring.py
+
+import pickle
+import struct
+import time
+from multiprocessing import shared_memory
+
+# head (next slot to read) and tail (next slot to write), each on its own cache line. They are
+# indexes into the header viewed as 8-byte words: an item assignment is a single aligned store,
+# while struct.pack_into zero-fills first and the other process can read 0 in between.
+HEAD = 0
+TAIL = 8
+SLOTS_OFFSET = 128
+# Length of the slot's part of the message, and whether more parts follow in the next slots
+SLOT_HEADER = struct.Struct('<IB')
+
+class SharedRing:
+    # Single-producer single-consumer queue in shared memory. Callers with more
+    # than one producer thread must serialise put() themselves.
+    def __init__(self, name=None, slots=4096, slot_size=4096):
+        self.slots = slots
+        self.slot_size = slot_size
+        size = SLOTS_OFFSET + slots * slot_size
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+            self.owner = True
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+            self.owner = False
+        self.buf = self.shm.buf
+        self.counters = self.buf[:SLOTS_OFFSET].cast('Q')
+        if self.owner:
+            self.counters[HEAD] = 0
+            self.counters[TAIL] = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def put(self, item, timeout=None):
+        data = pickle.dumps(item, protocol=pickle.HIGHEST_PROTOCOL)
+        # A message larger than a slot is split over consecutive slots
+        part_size = self.slot_size - SLOT_HEADER.size
+        parts = max(1, -(-len(data) // part_size))
+        if parts > self.slots:
+            raise ValueError(f"Message of {len(data)} bytes does not fit a ring of {self.slots} slots")
+
+        tail = self.counters[TAIL]
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        spins = 0
+        while tail + parts - self.counters[HEAD] > self.slots:
+            spins = self._backoff(spins, deadline)
+            if spins is None:
+                return False
+
+        for part in range(parts):
+            chunk = data[part * part_size:(part + 1) * part_size]
+            offset = SLOTS_OFFSET + ((tail + part) % self.slots) * self.slot_size
+            SLOT_HEADER.pack_into(self.buf, offset, len(chunk), part < parts - 1)
+            start = offset + SLOT_HEADER.size
+            self.buf[start:start + len(chunk)] = chunk
+        # Publish only after every slot of the message is written, the reader never sees part of it
+        self.counters[TAIL] = tail + parts
+        return True
+
+    def get(self, timeout=None):
+        head = self.counters[HEAD]
+        deadline = time.monotonic() + timeout if timeout is not None else None
+        spins = 0
+        while head == self.counters[TAIL]:
+            spins = self._backoff(spins, deadline)
+            if spins is None:
+                return None
+
+        chunks = []
+        more = True
+        while more:
+            offset = SLOTS_OFFSET + (head % self.slots) * self.slot_size
+            length, more = SLOT_HEADER.unpack_from(self.buf, offset)
+            start = offset + SLOT_HEADER.size
+            chunks.append(self.buf[start:start + length])
+            head += 1
+        item = pickle.loads(chunks[0] if len(chunks) == 1 else b''.join(chunks))
+        self.counters[HEAD] = head
+        return item
+
+    def _backoff(self, spins, deadline):
+        # Spin briefly for latency, then yield the CPU
+        if deadline is not None and time.monotonic() >= deadline:
+            return None
+        if spins < 1000:
+            return spins + 1
+        time.sleep(0.00005)
+        return spins
+
+    def close(self):
+        self._release_counters()
+        self.buf = None
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+    def _release_counters(self):
+        # The counters view must go before the mapping can be closed
+        if getattr(self, 'counters', None) is not None:
+            self.counters.release()
+            self.counters = None
+
+    def __del__(self):
+        # Shards exit without close(), the mapping is closed when the SharedMemory is collected
+        self._release_counters()
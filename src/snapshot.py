@@ -0,0 +1,83 @@
+# src/snapshot.py
+
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+SNAPSHOT_MAGIC = b'VERGESNP'
+SNAPSHOT_VERSION = 1
+# magic, format version, crc32 of the payload, payload length
+HEADER = struct.Struct('<8sIIQ')
+
+class RiskStateSnapshot:
+    def __init__(self, path):
+        self.path = path
+
+    def write(self, risk_state, risk_management=None):
+        data = risk_state.to_dict()
+        if risk_management is not None:
+            data['plugins'] = risk_management.get_plugin_state()
+        payload = zlib.compress(json.dumps(data, separators=(',', ':'), default=str).encode())
+        size = HEADER.size + len(payload)
+
+        # Write next to the live file and swap it in, a reader never sees a half-written snapshot
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'wb+') as f:
+            f.truncate(size)
+            with mmap.mmap(f.fileno(), size) as mm:
+                HEADER.pack_into(mm, 0, SNAPSHOT_MAGIC, SNAPSHOT_VERSION, zlib.crc32(payload), len(payload))
+                mm[HEADER.size:size] = payload
+                mm.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    magic, version, crc, length = HEADER.unpack_from(mm, 0)
+                    if magic != SNAPSHOT_MAGIC or version != SNAPSHOT_VERSION:
+                        logging.warning(f"Ignoring risk state snapshot with unknown format: {self.path}")
+                        return None
+                    payload = mm[HEADER.size:HEADER.size + length]
+            if len(payload) != length or zlib.crc32(payload) != crc:
+                logging.warning(f"Ignoring corrupt risk state snapshot: {self.path}")
+                return None
+            return json.loads(zlib.decompress(payload))
+        except Exception as e:
+            logging.error(f"Failed to load risk state snapshot: {e}")
+            return None
+
+    def restore(self, risk_state, risk_management, database):
+        data = self.load()
+        if data is None or data.get('as_of') is None:
+            risk_state.load_from_database(database)
+            return False
+        risk_state.load_dict(data)
+        risk_management.restore_plugin_state(data.get('plugins', {}))
+        risk_state.replay_from_database(database)
+        logging.info(f"Risk state restored from snapshot taken at {data['as_of']}")
+        return True
+
+    def start(self, risk_state, risk_management, interval):
+        threading.Thread(
+            target=self.run, args=(risk_state, risk_management, interval), daemon=True
+        ).start()
+
+    def run(self, risk_state, risk_management, interval):
+        while True:
+            time.sleep(interval)
+            try:
+                self.write(risk_state, risk_management)
+            except Exception as e:
+                logging.error(f"Failed to write risk state snapshot: {e}")
@@ -0,0 +1,221 @@
+# src/warmup.py
+
+import copy
+import logging
+import time
+import psycopg2
+from psycopg2.extras import RealDictCursor
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturesTimeoutError
+from src.instrument_master import InstrumentMaster
+from src.option_analytics import OptionAnalytics
+
+WARMUP_QUERIES = {
+    'instruments': """
+        SELECT ticker, instrument_type, underlying_ticker, expiration_date,
+               strike_price, option_type, contract_size
+        FROM instruments;
+    """,
+    'margin_requirements': """
+        SELECT asset_class, account_type, initial_margin_rate, maintenance_margin_rate
+        FROM margin_requirements;
+    """,
+    'margin_overrides': """
+        SELECT instrument_id, initial_margin_rate, maintenance_margin_rate
+        FROM instrument_margin_overrides;
+    """,
+    'trading_permissions': """
+        SELECT trading_mode, asset_class, allow_buy, allow_sell, allow_short, allow_options, allow_spreads
+        FROM trading_permissions;
+    """,
+    'notional_limits': """
+        SELECT session_id, asset_class, max_order_notional, max_total_notional
+        FROM notional_limits;
+    """,
+    'accounts': """
+        SELECT * FROM accounts;
+    """,
+    'risk_settings': """
+        SELECT * FROM risk_settings;
+    """
+}
+
+# Rates, limits and accounts that may change during the day; instruments and positions are not reloaded
+RELOAD_QUERIES = [
+    'margin_requirements', 'margin_overrides', 'trading_permissions', 'notional_limits', 'risk_settings', 'accounts'
+]
+
+def to_float(value):
+    return float(value) if value is not None else None
+
+class StartupWarmup:
+    def __init__(self, config, database, risk_state, risk_management, market_data, snapshot, shared_instruments=False,
+                 order_store=None):
+        warmup_config = config.get('warmup', {})
+        self.config = config
+        self.db_config = config['database']
+        self.database = database
+        self.risk_state = risk_state
+        self.risk_management = risk_management
+        self.market_data = market_data
+        self.snapshot = snapshot
+        self.order_store = order_store
+        self.workers = warmup_config.get('workers', 8)
+        self.batch_size = warmup_config.get('batch_size', 50000)
+        self.timeout = warmup_config.get('timeout', 120)
+        self.min_price_coverage = warmup_config.get('min_price_coverage', 0.9)
+        self.instruments_path = warmup_config.get('instruments_path', 'data/instruments')
+        # Shards map the instrument master the gateway wrote today instead of loading it again
+        self.instruments = None
+        if shared_instruments and InstrumentMaster.is_current(self.instruments_path):
+            self.instruments = InstrumentMaster.open(self.instruments_path)
+        self.analytics_config = None  # option_analytics settings the current OptionAnalytics was built with
+        self.ready = False
+
+    def run(self):
+        started = time.time()
+        failed = []
+        results = {}
+
+        # The loads are independent, each one gets its own connection and runs in parallel
+        executor = ThreadPoolExecutor(max_workers=self.workers)
+        futures = {
+            name: executor.submit(self.fetch, name, query)
+            for name, query in WARMUP_QUERIES.items()
+            if name != 'instruments' or self.instruments is None
+        }
+        futures['positions'] = executor.submit(
+            self.snapshot.restore, self.risk_state, self.risk_management, self.database
+        )
+        # One deadline for all the loads, a load still running then fails the startup
+        deadline = started + self.timeout
+        for name, future in futures.items():
+            try:
+                results[name] = future.result(timeout=max(deadline - time.time(), 0))
+            except FuturesTimeoutError:
+                logging.error(f"Warm-up load {name} did not finish within {self.timeout}s")
+                failed.append(name)
+            except Exception as e:
+                logging.error(f"Warm-up load {name} failed: {e}")
+                failed.append(name)
+        if failed:
+            # Loads that never started are dropped; shutdown(cancel_futures=True) needs Python 3.9
+            for future in futures.values():
+                future.cancel()
+        executor.shutdown(wait=not failed)
+        if failed:
+            self.ready = self.check_readiness(failed, [], {})
+            return self.ready
+
+        self.risk_state.load_accounts(results['accounts'])
+        self.risk_management.warm_up(self.build_reference_data(results), results['risk_settings'])
+        if self.order_store is not None:
+            self.risk_management.rebuild_open_orders(self.order_store.open_orders())
+
+        tickers = self.risk_state.held_tickers()
+        prices = self.market_data.prefetch(tickers, workers=self.workers) if tickers else {}
+
+        self.ready = self.check_readiness(failed, tickers, prices)
+        logging.info(
+            f"Warm-up finished in {time.time() - started:.2f}s: "
+            f"{len(self.risk_state.accounts)} accounts, {len(tickers)} held tickers, "
+            f"{len(prices)} prices, ready={self.ready}"
+        )
+        return self.ready
+
+    def load_reference_data(self, config=None):
+        # Same parallel loads as startup, for a reload that is swapped in once complete
+        if config is not None:
+            self.config = config
+        current = self.risk_management.reference_data
+        self.instruments = current['instruments'] if current is not None else self.instruments
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            futures = {name: executor.submit(self.fetch, name, WARMUP_QUERIES[name]) for name in RELOAD_QUERIES}
+            results = {name: future.result(timeout=self.timeout) for name, future in futures.items()}
+        return self.build_reference_data(results), results['risk_settings'], results['accounts']
+
+    def fetch(self, name, query):
+        conn = psycopg2.connect(**self.db_config)
+        try:
+            # Named cursor streams the rows from the server in large batches
+            # The server gives up at the warm-up timeout too, a stuck load doesn't outlive the startup
+            conn.cursor().execute("SET statement_timeout = %s;", (int(self.timeout * 1000),))
+            cur = conn.cursor(name=f"warmup_{name}", cursor_factory=RealDictCursor)
+            cur.itersize = self.batch_size
+            cur.execute(query)
+            rows = []
+            while True:
+                batch = cur.fetchmany(self.batch_size)
+                if not batch:
+                    break
+                rows.extend(batch)
+            cur.close()
+            return rows
+        finally:
+            conn.close()
+
+    def build_instruments(self, rows):
+        if self.instruments is not None:
+            return self.instruments
+        # Written once and mapped back, so other processes can open the same pages
+        InstrumentMaster.from_rows(rows).save(self.instruments_path)
+        return InstrumentMaster.open(self.instruments_path)
+
+    def build_reference_data(self, results):
+        instruments = self.build_instruments(results.get('instruments'))
+        analytics_config = self.config.get('option_analytics', {})
+        option_analytics = None
+        if analytics_config.get('delta_adjusted', True):
+            current = self.risk_management.reference_data
+            option_analytics = current.get('option_analytics') if current is not None else None
+            # A reload with the same instruments and settings keeps the chains and cached greeks
+            if (option_analytics is None or option_analytics.instruments is not instruments
+                    or analytics_config != self.analytics_config):
+                option_analytics = OptionAnalytics(instruments, self.config)
+            self.analytics_config = copy.deepcopy(analytics_config)
+        return {
+            'instruments': instruments,
+            'option_analytics': option_analytics,
+            'margin_requirements': {
+                (row['asset_class'], row['account_type']): {
+                    'initial_margin_rate': float(row['initial_margin_rate']),
+                    'maintenance_margin_rate': float(row['maintenance_margin_rate'])
+                }
+                for row in results['margin_requirements']
+            },
+            'margin_overrides': {
+                row['instrument_id']: {
+                    'initial_margin_rate': float(row['initial_margin_rate']),
+                    'maintenance_margin_rate': float(row['maintenance_margin_rate'])
+                }
+                for row in results['margin_overrides']
+            },
+            'trading_permissions': {
+                (row['trading_mode'], row['asset_class']): {
+                    'allow_buy': row['allow_buy'],
+                    'allow_sell': row['allow_sell'],
+                    'allow_short': row['allow_short'],
+                    'allow_options': row['allow_options'],
+                    'allow_spreads': row['allow_spreads']
+                }
+                for row in results['trading_permissions']
+            },
+            'notional_limits': {
+                (row['session_id'], row['asset_class']): {
+                    'max_order_notional': to_float(row['max_order_notional']),
+                    'max_total_notional': to_float(row['max_total_notional'])
+                }
+                for row in results['notional_limits']
+            }
+        }
+
+    def check_readiness(self, failed, tickers, prices):
+        if failed:
+            logging.error(f"Not ready: warm-up loads failed: {failed}")
+            return False
+        if not self.risk_management.plugins:
+            logging.error("Not ready: no risk plugins loaded")
+            return False
+        if tickers and len(prices) / len(tickers) < self.min_price_coverage:
+            logging.error(f"Not ready: market data for only {len(prices)} of {len(tickers)} held tickers")
+            return False
+        return True
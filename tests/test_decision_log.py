@@ -0,0 +1,142 @@
+import os
+from datetime import date
+
+import pytest
+
+import src.decision_log as decision_log
+from src.decision_log import DecisionLog, DecisionRecorder
+from src.risk_management import RiskManagement, RiskPipeline
+from src.risk_state import RiskState
+
+
+class FakeDate(date):
+    current = date(2024, 1, 2)
+
+    @classmethod
+    def today(cls):
+        return cls.current
+
+
+def record(n):
+    return {'timestamp': float(n), 'account_id': 7, 'session_id': 1, 'state_version': n, 'passed': True,
+            'quantity': 100.0, 'price': 10.0}
+
+
+@pytest.fixture
+def today(monkeypatch):
+    monkeypatch.setattr(decision_log, 'date', FakeDate)
+    FakeDate.current = date(2024, 1, 2)
+    return FakeDate
+
+
+def make_recorder(directory, risk_state):
+    # The flush thread never wakes up during a test
+    config = {'decision_log': {'path': str(directory), 'flush_interval': 3600}}
+    return DecisionRecorder(config, risk_state, None)
+
+
+def test_blob_is_in_the_file_before_the_row_is_published(tmp_path):
+    log = DecisionLog(str(tmp_path), capacity=4)
+    log.append(record(1), {'n': 1})
+    # No flush: a process crash right now keeps the row and its inputs together
+    assert os.path.getsize(log.path('blobs')) == log.blob_size
+    assert len(DecisionLog(str(tmp_path), mode='r')) == 1
+
+
+def test_rows_without_their_inputs_are_dropped_on_open(tmp_path):
+    log = DecisionLog(str(tmp_path), capacity=4)
+    for n in range(3):
+        log.append(record(n), {'n': n})
+    log.flush()
+    # A machine crash lost the last blob but not the row pointing at it
+    end = int(log.columns['blob_offset'][2])
+    with open(log.path('blobs'), 'r+b') as f:
+        f.truncate(end)
+
+    log = DecisionLog(str(tmp_path), capacity=4)
+    assert len(log) == 2
+    log.append(record(3), {'n': 3})
+    log.flush()
+    # Grows past the initial capacity as well
+    log.append(record(4), {'n': 4})
+    log.append(record(5), {'n': 5})
+
+    reader = DecisionLog(str(tmp_path), mode='r')
+    assert [reader.inputs(index)['n'] for index in range(len(reader))] == [0, 1, 3, 4, 5]
+
+
+def test_decision_records_the_state_it_was_checked_against(tmp_path, today):
+    risk_state = RiskState()
+    risk_state.apply_position({'account_id': 7, 'session_id': 1, 'ticker': 'AAPL', 'quantity': 100,
+                               'average_price': 10.0})
+    version = risk_state.version
+    recorder = make_recorder(tmp_path, risk_state)
+    order = {'order_id': 1, 'account_id': 7, 'ticker': 'AAPL', 'side': 'BUY', 'quantity': 50, 'price': 10.0}
+    account = {'account_id': 7}
+
+    recorder.begin(account, 1)
+    # A fill lands while the checks run
+    risk_state.apply_fill(7, 1, 'AAPL', 100, 10.0)
+    recorder.record(order, account, 1, {}, {}, True)
+
+    log = DecisionLog(recorder.directory, mode='r')
+    inputs = log.inputs(0)
+    assert inputs['positions'][0]['quantity'] == 100
+    assert inputs['daily_volume'] == 0
+    assert int(log.column('state_version')[0]) == version
+
+
+def test_recording_never_rolls_the_log_over(tmp_path, today):
+    recorder = make_recorder(tmp_path, RiskState())
+    order = {'order_id': 1, 'account_id': 7, 'ticker': 'AAPL', 'side': 'BUY', 'quantity': 50, 'price': 10.0}
+    account = {'account_id': 7}
+    first = recorder.directory
+
+    today.current = date(2024, 1, 3)
+    recorder.begin(account, 1)
+    recorder.record(order, account, 1, {}, {}, True)
+    assert recorder.directory == first
+
+    # The flush thread does it
+    recorder.roll_over()
+    recorder.begin(account, 1)
+    recorder.record(order, account, 1, {}, {}, True)
+    assert recorder.directory == os.path.join(str(tmp_path), '2024-01-03')
+    assert len(DecisionLog(first, mode='r')) == 1
+    assert len(DecisionLog(recorder.directory, mode='r')) == 1
+
+
+def test_every_basket_decision_is_recorded_and_audited(tmp_path, today):
+    class Audit:
+        def __init__(self):
+            self.decisions = []
+
+        def record_decision(self, order, session_id, passed, plugin='', message=''):
+            self.decisions.append((order['order_id'], passed, plugin))
+
+    risk_state = RiskState()
+    risk_state.load_accounts([{'account_id': 7, 'trading_mode': 'NORMAL'},
+                              {'account_id': 8, 'trading_mode': 'NORMAL'}])
+    recorder = make_recorder(tmp_path, risk_state)
+    audit = Audit()
+    risk_management = RiskManagement(None, risk_state, plugin_names=['credit_limit'], audit=audit,
+                                     recorder=recorder)
+    risk_management.pipeline = RiskPipeline({}, {'notional_limits': {}}, risk_settings={1: {'session_id': 1}})
+    # Stands in for the vector checks, the quantity decides
+    risk_management.basket.check_account = lambda orders, *args: [
+        (True, "") if order['quantity'] <= 100 else (False, "Order quantity exceeds maximum order volume.")
+        for order in orders
+    ]
+    basket = [
+        {'order_id': 1, 'account_id': 7, 'ticker': 'AAPL', 'side': 'BUY', 'quantity': 50, 'price': 10.0},
+        {'order_id': 2, 'account_id': 8, 'ticker': 'AAPL', 'side': 'BUY', 'quantity': 500, 'price': 10.0},
+        {'order_id': 3, 'account_id': 7, 'ticker': 'MSFT', 'side': 'BUY', 'quantity': 80, 'price': 10.0}
+    ]
+
+    decisions = risk_management.check_orders(basket, 1)
+
+    assert [passed for passed, _ in decisions] == [True, False, True]
+    assert sorted(audit.decisions) == [(1, True, ''), (2, False, 'basket'), (3, True, '')]
+    log = DecisionLog(recorder.directory, mode='r')
+    recorded = {log.inputs(index)['order']['order_id']: bool(log.column('passed')[index]) for index in range(len(log))}
+    assert recorded == {1: True, 2: False, 3: True}
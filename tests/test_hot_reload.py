@@ -0,0 +1,79 @@
+import yaml
+
+from src.hot_reload import HotReloader
+from src.risk_management import RiskManagement
+from src.risk_state import RiskState
+from src.warmup import StartupWarmup
+
+TABLES = {
+    'instruments': [
+        {'ticker': 'AAPL', 'instrument_type': 'STOCK', 'underlying_ticker': None, 'expiration_date': None,
+         'strike_price': None, 'option_type': None, 'contract_size': 1}
+    ],
+    'margin_requirements': [],
+    'margin_overrides': [],
+    'trading_permissions': [],
+    'notional_limits': [
+        {'session_id': 1, 'asset_class': 'EQUITY', 'max_order_notional': 100000, 'max_total_notional': 1000000}
+    ],
+    'accounts': [{'account_id': 7, 'trading_mode': 'NORMAL'}],
+    'risk_settings': [{'session_id': 1, 'max_position_value': 100000, 'max_daily_volume': 1000}]
+}
+
+
+def write_config(path, volatility=0.3):
+    config = {
+        'database': {},
+        'warmup': {'instruments_path': str(path.parent / 'instruments')},
+        'option_analytics': {'volatility': volatility},
+        'hot_reload': {'enabled': False, 'refresh_interval': 60},
+        'risk_management': {'plugins': ['credit_limit']}
+    }
+    path.write_text(yaml.safe_dump(config))
+    return config
+
+
+def make_reloader(tmp_path):
+    config_file = tmp_path / 'config.yml'
+    config = write_config(config_file)
+    risk_state = RiskState()
+    risk_management = RiskManagement(None, risk_state, plugin_names=['credit_limit'])
+    warmup = StartupWarmup(config, None, risk_state, risk_management, None, None)
+    warmup.fetch = lambda name, query: [dict(row) for row in TABLES[name]]
+    # The loads of StartupWarmup.run, without the snapshot and the prices
+    results = {name: warmup.fetch(name, None) for name in TABLES}
+    risk_state.load_accounts(results['accounts'])
+    risk_management.warm_up(warmup.build_reference_data(results), results['risk_settings'])
+
+    reloads = []
+    reload = risk_management.reload
+    risk_management.reload = lambda *args: reloads.append(args) or reload(*args)
+    return config_file, risk_management, HotReloader(str(config_file), risk_management, warmup), reloads
+
+
+def test_first_refresh_after_warm_up_keeps_the_pipeline(tmp_path):
+    _, risk_management, reloader, reloads = make_reloader(tmp_path)
+    pipeline = risk_management.pipeline
+
+    reloader.reload()
+
+    assert reloads == []
+    assert risk_management.pipeline is pipeline
+
+
+def test_option_analytics_are_rebuilt_only_when_their_inputs_change(tmp_path, monkeypatch):
+    config_file, risk_management, reloader, reloads = make_reloader(tmp_path)
+    option_analytics = risk_management.reference_data['option_analytics']
+
+    # New limits, same instruments and analytics settings
+    monkeypatch.setitem(TABLES, 'risk_settings', [dict(TABLES['risk_settings'][0], max_daily_volume=2000)])
+    reloader.reload()
+    assert len(reloads) == 1
+    assert risk_management.pipeline.risk_settings[1]['max_daily_volume'] == 2000
+    assert risk_management.reference_data['option_analytics'] is option_analytics
+
+    write_config(config_file, volatility=0.4)
+    reloader.reload([str(config_file)])
+    assert len(reloads) == 2
+    assert risk_management.reference_data['option_analytics'] is not option_analytics
+    assert risk_management.reference_data['option_analytics'].volatility == 0.4
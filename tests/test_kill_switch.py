@@ -0,0 +1,123 @@
+import threading
+import time
+
+from src.kill_switch import KillSwitch
+from src.order_manager import OrderManager
+from src.order_store import OrderStore
+from src.risk_state import RiskState
+
+
+class FixEngine:
+    def __init__(self, delay=0.0):
+        self.delay = delay
+        self.sent = []
+        self.cancelled = []
+        self.rejected = []
+        self.lock = threading.Lock()
+
+    def send_new_order(self, order, session_id):
+        # Widens the window between the check and the order store update
+        time.sleep(self.delay)
+        with self.lock:
+            self.sent.append(order['order_id'])
+
+    def send_order_cancel_requests(self, orders, session_id):
+        with self.lock:
+            self.cancelled.extend(order['order_id'] for order in orders)
+
+    def send_reject(self, order, session_id, message):
+        self.rejected.append((order['order_id'], message))
+
+
+class Database:
+    def __init__(self):
+        self.trading_modes = []
+
+    def get_account(self, account_id):
+        return {'account_id': account_id, 'internalization_enabled': False}
+
+    def update_account_trading_mode(self, account_id, trading_mode):
+        self.trading_modes.append((account_id, trading_mode))
+
+
+def order(order_id, account_id=7, ticker='AAPL'):
+    return {
+        'order_id': order_id, 'account_id': account_id, 'session_id': 1, 'ticker': ticker, 'side': 'BUY',
+        'quantity': 100, 'price': 10.0, 'order_type': 'LIMIT', 'asset_class': 'EQUITY'
+    }
+
+
+def make_gateway(tmp_path, delay=0.0):
+    store = OrderStore({'database': {}, 'oms': {'path': str(tmp_path), 'replication_interval': 3600}})
+    store.read_checkpoints = lambda: {}
+    fix_engine = FixEngine(delay)
+    risk_state = RiskState()
+    risk_state.load_accounts([{'account_id': 7, 'trading_mode': 'NORMAL'},
+                              {'account_id': 8, 'trading_mode': 'NORMAL'}])
+    kill_switch_database = Database()
+    kill_switch = KillSwitch({'kill_switch': {'confirm_timeout': 0.05}}, store, fix_engine, risk_state,
+                             kill_switch_database)
+    order_manager = OrderManager(Database(), fix_engine, risk_state, order_store=store, kill_switch=kill_switch)
+    return store, fix_engine, risk_state, kill_switch, kill_switch_database, order_manager
+
+
+def test_order_past_the_checks_is_not_sent_after_a_kill(tmp_path):
+    store, fix_engine, _, kill_switch, _, order_manager = make_gateway(tmp_path)
+
+    # Passed the risk checks, not in the order store yet when the kill collects the open orders
+    kill_switch.trigger(account_id=7)
+    assert order_manager.process_order(order(1), 1, 10.0) is False
+
+    assert fix_engine.sent == []
+    assert fix_engine.rejected == [(1, "Kill switch active.")]
+    assert store.get(1)['status'] == 'REJECTED'
+
+
+def test_every_order_sent_during_a_kill_is_cancelled(tmp_path):
+    store, fix_engine, _, kill_switch, _, order_manager = make_gateway(tmp_path, delay=0.0005)
+
+    def flow():
+        for order_id in range(300):
+            order_manager.process_order(order(order_id), 1, 10.0)
+
+    sender = threading.Thread(target=flow)
+    sender.start()
+    time.sleep(0.02)
+    kill_switch.trigger(account_id=7)
+    sender.join()
+
+    assert fix_engine.sent
+    assert set(fix_engine.sent) <= set(fix_engine.cancelled)
+    stopped = {order_id for order_id, _ in fix_engine.rejected}
+    assert stopped and stopped.isdisjoint(fix_engine.sent)
+    assert len(stopped) + len(fix_engine.sent) == 300
+
+
+def test_ticker_kill_blocks_only_that_ticker(tmp_path):
+    store, fix_engine, risk_state, kill_switch, database, order_manager = make_gateway(tmp_path)
+    order_manager.process_order(order(1, ticker='AAPL'), 1, 10.0)
+
+    report = kill_switch.trigger(ticker='AAPL')
+
+    assert report['accounts_closed'] == [] and fix_engine.cancelled == [1]
+    assert risk_state.get_account(7)['trading_mode'] == 'NORMAL'
+    assert database.trading_modes == []
+    assert order_manager.process_order(order(2, ticker='AAPL'), 1, 10.0) is False
+    assert order_manager.process_order(order(3, ticker='MSFT'), 1, 10.0) is True
+
+    kill_switch.unblock(ticker='AAPL')
+    assert order_manager.process_order(order(4, ticker='AAPL'), 1, 10.0) is True
+
+
+def test_account_kill_closes_the_account_on_its_own_connection(tmp_path):
+    _, _, risk_state, kill_switch, database, order_manager = make_gateway(tmp_path)
+
+    kill_switch.trigger(account_id=7)
+
+    assert risk_state.get_account(7)['trading_mode'] == 'CLOSED'
+    assert risk_state.get_account(8)['trading_mode'] == 'NORMAL'
+    assert database.trading_modes == [(7, 'CLOSED')]
+    assert order_manager.process_order(order(1, account_id=8), 1, 10.0) is True
+
+    assert kill_switch.reopen(7) == 'NORMAL'
+    assert order_manager.process_order(order(2), 1, 10.0) is True
@@ -0,0 +1,102 @@
+from datetime import date
+
+import pytest
+
+from src.limit_reservations import LeaseLedger, LimitReservations, get_authkey
+from src.risk_management import RiskManagement, RiskPipeline
+from src.risk_state import RiskState
+
+SETTINGS = {'session_id': 1, 'max_position_value': 100000.0, 'max_daily_volume': 1000}
+POSITION_KEY = "7:1:max_position_value"
+
+
+class Instruments:
+    def contract_size(self, ticker):
+        return 50.0 if ticker == 'ESZ4' else None
+
+
+class MarketData:
+    def get_last_trade(self, ticker):
+        return 20.0
+
+
+def order(order_id, quantity=100, price=10.0, **fields):
+    return dict({
+        'order_id': order_id, 'account_id': 7, 'session_id': 1, 'ticker': 'AAPL', 'side': 'BUY',
+        'quantity': quantity, 'price': price, 'order_type': 'LIMIT', 'asset_class': 'EQUITY'
+    }, **fields)
+
+
+def make_reservations(risk_state=None, lease_fraction=0.1):
+    ledger = LeaseLedger()
+    reservations = LimitReservations(ledger, lease_fraction=lease_fraction, risk_state=risk_state)
+    risk_management = RiskManagement(None, risk_state, plugin_names=['credit_limit'],
+                                     limit_reservations=reservations, market_data=MarketData())
+    reference_data = {'notional_limits': {}, 'instruments': Instruments()}
+    risk_management.pipeline = RiskPipeline({}, reference_data, risk_settings={1: SETTINGS})
+    reservations.warm_up(reference_data)
+    return ledger, reservations, risk_management
+
+
+def test_budgets_are_taken_at_the_notional_the_checks_use():
+    _, reservations, _ = make_reservations()
+
+    market = reservations.get_budgets(order(1, price=None, order_type='MARKET'), {'account_id': 7}, 1, SETTINGS)
+    future = reservations.get_budgets(order(2, quantity=2, price=5000.0, ticker='ESZ4', asset_class='FUTURE'),
+                                      {'account_id': 7}, 1, SETTINGS)
+
+    assert dict((key, amount) for key, _, amount, _ in market)[POSITION_KEY] == 2000.0
+    assert dict((key, amount) for key, _, amount, _ in future)[POSITION_KEY] == 500000.0
+
+
+def test_cancel_gives_the_remainder_back_and_leases_return_to_the_coordinator():
+    ledger, reservations, _ = make_reservations()
+
+    assert reservations.check(order(1), {'account_id': 7}, 1, SETTINGS) == (True, "")
+    assert reservations.leases[POSITION_KEY]['remaining'] == 10000.0 - 1000.0
+    reservations.release_order(1)
+    assert reservations.leases[POSITION_KEY]['remaining'] == 10000.0
+    assert 1 not in reservations.orders
+
+    reservations.return_leases()
+    assert ledger.used[POSITION_KEY] == 0.0
+
+
+def test_budget_is_refused_once_the_cluster_total_is_used():
+    ledger, reservations, _ = make_reservations(lease_fraction=1.0)
+    ledger.used[POSITION_KEY] = 99500.0
+
+    passed, message = reservations.check(order(1), {'account_id': 7}, 1, SETTINGS)
+    assert not passed and 'max_position_value' in message
+
+
+def test_restart_rebuilds_working_orders_and_reconciles_positions():
+    risk_state = RiskState()
+    risk_state.apply_position({'account_id': 7, 'session_id': 1, 'ticker': 'MSFT', 'quantity': 50,
+                               'average_price': 20.0})
+    # Closed while the gateway was down, its budget must not stay used
+    risk_state.apply_position({'account_id': 7, 'session_id': 1, 'ticker': 'IBM', 'quantity': 0,
+                               'average_price': 30.0})
+    ledger, reservations, risk_management = make_reservations(risk_state)
+    ledger.used[POSITION_KEY] = 50000.0
+
+    working = order(1, quantity=100, filled_quantity=40, created_at=f"{date.today().isoformat()} 09:30:00")
+    risk_management.rebuild_open_orders([working])
+
+    # 50 x 20 held plus 60 x 10 still working
+    assert ledger.used[POSITION_KEY] == 1600.0
+    assert reservations.orders[1][4] == 60
+    # A cancel after the restart gives the working part back
+    reservations.release_order(1)
+    assert ledger.used[POSITION_KEY] == 1000.0
+
+
+def test_authkey_comes_from_the_config_or_the_environment(monkeypatch):
+    monkeypatch.delenv('LEASE_COORDINATOR_AUTHKEY', raising=False)
+    assert get_authkey({'authkey': 'secret'}, 'LEASE_COORDINATOR_AUTHKEY') == 'secret'
+    with pytest.raises(RuntimeError):
+        get_authkey({'authkey': '${LEASE_COORDINATOR_AUTHKEY}'}, 'LEASE_COORDINATOR_AUTHKEY')
+    with pytest.raises(RuntimeError):
+        get_authkey({}, 'LEASE_COORDINATOR_AUTHKEY')
+    monkeypatch.setenv('LEASE_COORDINATOR_AUTHKEY', 'from-env')
+    assert get_authkey({'authkey': '${LEASE_COORDINATOR_AUTHKEY}'}, 'LEASE_COORDINATOR_AUTHKEY') == 'from-env'
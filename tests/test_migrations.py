@@ -0,0 +1,78 @@
+import gzip
+import os
+
+import pytest
+
+psycopg2 = pytest.importorskip('psycopg2')
+
+from src.migrations import archive_orders, list_partitions, migrate
+from src.query_benchmark import load
+
+# libpq connection string of a scratch Postgres, e.g. "dbname=postgres host=/tmp/pgdata"
+DSN = os.environ.get('VERGES_TEST_DSN')
+SCHEMA = 'verges_test_migrations'
+
+pytestmark = pytest.mark.skipif(not DSN, reason="VERGES_TEST_DSN is not set")
+
+
+@pytest.fixture
+def conn():
+    conn = psycopg2.connect(DSN)
+    cur = conn.cursor()
+    cur.execute(f"DROP SCHEMA IF EXISTS {SCHEMA} CASCADE;")
+    cur.execute(f"CREATE SCHEMA {SCHEMA};")
+    cur.execute(f"SET search_path TO {SCHEMA};")
+    conn.commit()
+    load(conn, accounts=20, sessions=5, tickers=10, orders=2000, positions=100, days=20)
+    try:
+        yield conn
+    finally:
+        conn.rollback()
+        cur = conn.cursor()
+        cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE;")
+        conn.commit()
+        conn.close()
+
+
+def count(conn, query):
+    cur = conn.cursor()
+    cur.execute(query)
+    value = cur.fetchone()[0]
+    cur.close()
+    return value
+
+
+def test_migrations_partition_orders_and_keep_every_row(conn):
+    orders = count(conn, "SELECT COUNT(*) FROM orders;")
+
+    migrate(conn)
+    migrate(conn)  # Applied versions are skipped
+
+    assert count(conn, "SELECT relkind FROM pg_class WHERE oid = 'orders'::regclass;") == 'p'
+    assert count(conn, "SELECT COUNT(*) FROM orders;") == orders
+    assert count(conn, "SELECT COUNT(*) FROM orders_default;") == 0
+    assert count(conn, "SELECT MAX(version) FROM schema_migrations;") == 4
+
+
+def test_a_day_that_fails_to_archive_stays_attached_and_the_rest_are_archived(conn, tmp_path):
+    migrate(conn)
+    cur = conn.cursor()
+    old = [name for name, upper in list_partitions(cur) if upper is not None][:3]
+    cur.close()
+    # The export of the middle day can't be written
+    os.makedirs(tmp_path / f"{old[1]}.csv.gz")
+    exported = count(conn, f"SELECT COUNT(*) FROM {old[0]};")
+
+    archived = archive_orders(conn, retention_days=7, export_path=str(tmp_path))
+
+    assert old[0] in archived and old[2] in archived and old[1] not in archived
+    cur = conn.cursor()
+    attached = [name for name, _ in list_partitions(cur)]
+    cur.close()
+    assert old[1] in attached and old[0] not in attached
+    assert count(conn, f"SELECT to_regclass('{SCHEMA}.{old[0]}') IS NULL;")
+    with gzip.open(tmp_path / f"{old[0]}.csv.gz", 'rt') as f:
+        assert len(f.readlines()) == exported + 1
+    # Still works for the day left behind once the problem is gone
+    os.rmdir(tmp_path / f"{old[1]}.csv.gz")
+    assert archive_orders(conn, retention_days=7, export_path=str(tmp_path)) == [old[1]]
@@ -0,0 +1,59 @@
+from src.order_manager import OrderManager
+from src.order_store import OrderStore
+from src.risk_management import RiskManagement
+from src.risk_state import RiskState
+
+
+class FixEngine:
+    def __init__(self):
+        self.store = None
+        self.sent = []
+
+    def send_new_order(self, order, session_id):
+        self.sent.append((order['order_id'], order['quantity']))
+
+    def send_order_cancel_request(self, order):
+        # The market confirms straight away
+        self.store.transition(order['order_id'], 'CANCELED')
+
+    def send_execution_report(self, order, session_id, price, quantity=None, liquidity_tag=None):
+        pass
+
+
+class Database:
+    def get_account(self, account_id):
+        return {'account_id': account_id, 'internalization_enabled': True}
+
+    def update_position(self, **position):
+        pass
+
+
+def order(order_id, side, quantity):
+    return {
+        'order_id': order_id, 'account_id': 7, 'session_id': 1, 'ticker': 'AAPL', 'side': side,
+        'quantity': quantity, 'price': 10.0, 'order_type': 'LIMIT', 'asset_class': 'EQUITY'
+    }
+
+
+def test_internal_partial_fills_keep_the_ordered_quantity(tmp_path):
+    store = OrderStore({'database': {}, 'oms': {'path': str(tmp_path), 'replication_interval': 3600}})
+    store.read_checkpoints = lambda: {}
+    fix_engine = FixEngine()
+    fix_engine.store = store
+    order_manager = OrderManager(Database(), fix_engine, RiskState(), order_store=store)
+
+    order_manager.process_order(order(1, 'BUY', 100), 1, 10.0)
+    order_manager.process_order(order(2, 'SELL', 40), 1, 10.0)
+    order_manager.process_order(order(3, 'SELL', 30), 1, 10.0)
+
+    working = store.get(1)
+    assert (working['quantity'], working['filled_quantity']) == (100, 70)
+    assert working['status'] == 'SENT_TO_MARKET'
+    # The market only ever gets what is left
+    assert fix_engine.sent == [(1, 100), (1, 60), (1, 30)]
+    assert store.get(2)['status'] == 'FILLED' and store.get(3)['status'] == 'FILLED'
+
+    # A restart reserves the 30 still working
+    risk_state = RiskState()
+    RiskManagement(None, risk_state, plugin_names=['credit_limit']).rebuild_open_orders([working])
+    assert risk_state.open_orders[1][2] == 30
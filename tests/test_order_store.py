@@ -0,0 +1,146 @@
+import os
+from datetime import date, timedelta
+
+import pytest
+
+import src.order_store as order_store
+from src.order_store import OrderStore, WriteAheadLog, wal_name
+
+
+class FakeDate(date):
+    current = date(2024, 1, 2)
+
+    @classmethod
+    def today(cls):
+        return cls.current
+
+
+class Database:
+    def __init__(self, open_orders=()):
+        self.open_orders = list(open_orders)
+
+    def get_all_open_orders(self):
+        return self.open_orders
+
+
+def order(order_id, **fields):
+    return dict({
+        'order_id': order_id, 'account_id': 7, 'session_id': 1, 'ticker': 'AAPL', 'side': 'BUY',
+        'quantity': 100, 'price': 10.0
+    }, **fields)
+
+
+def make_store(directory, checkpoints=None):
+    # Replication is never due during a test, nothing reaches for a database
+    store = OrderStore({'database': {}, 'oms': {'path': str(directory), 'replication_interval': 3600}})
+    store.read_checkpoints = lambda: dict(checkpoints or {})
+    return store
+
+
+@pytest.fixture
+def today(monkeypatch):
+    monkeypatch.setattr(order_store, 'date', FakeDate)
+    FakeDate.current = date(2024, 1, 2)
+    return FakeDate
+
+
+def test_torn_tail_is_cut_off_and_later_entries_survive(tmp_path, today):
+    wal = WriteAheadLog(str(tmp_path))
+    wal.append({'op': 'add', 'n': 1})
+    wal.file.close()
+    with open(wal.path, 'a') as f:
+        f.write('{"op": "add", "n"')  # crash in the middle of a write
+
+    wal = WriteAheadLog(str(tmp_path))
+    wal.append({'op': 'add', 'n': 2})
+    wal.append({'op': 'add', 'n': 3})
+
+    assert [entry['n'] for entry in WriteAheadLog(str(tmp_path)).read()] == [1, 2, 3]
+
+
+def test_damaged_line_does_not_hide_the_rest(tmp_path, today):
+    path = tmp_path / wal_name(today.current)
+    path.write_text('{"n": 1}\nnot json\n{"n": 3}\n')
+    assert [entry['n'] for entry in WriteAheadLog(str(tmp_path)).read()] == [1, 3]
+
+
+def test_acknowledged_orders_survive_a_crash_after_a_torn_write(tmp_path, today):
+    store = make_store(tmp_path)
+    store.recover(Database())
+    store.add(order(1))
+    store.wal.file.close()
+    with open(store.wal.path, 'a') as f:
+        f.write('{"op": "transition", "order_id": 1, "sta')
+
+    store = make_store(tmp_path)
+    store.recover(Database())
+    store.add(order(2))
+    store.transition(2, 'SENT_TO_MARKET')
+
+    store = make_store(tmp_path)
+    store.recover(Database())
+    assert store.get(1)['status'] == 'OPEN'
+    assert store.get(2)['status'] == 'SENT_TO_MARKET'
+
+
+def test_log_rolls_over_at_midnight(tmp_path, today):
+    store = make_store(tmp_path)
+    store.recover(Database())
+    store.add(order(1))
+    today.current += timedelta(days=1)
+    store.transition(1, 'SENT_TO_MARKET')
+
+    assert sorted(os.listdir(tmp_path)) == [wal_name(date(2024, 1, 2)), wal_name(date(2024, 1, 3))]
+    assert [entry['op'] for entry in store.wal.read()] == ['transition']
+    names = {name for name, entry in store.replication_queue}
+    assert names == {wal_name(date(2024, 1, 2)), wal_name(date(2024, 1, 3))}
+
+
+def test_recovery_replays_the_unreplicated_tail_of_an_earlier_log(tmp_path, today):
+    store = make_store(tmp_path)
+    store.recover(Database())
+    store.add(order(1))
+    store.add(order(2))
+    store.transition(2, 'SENT_TO_MARKET')
+    today.current += timedelta(days=1)
+
+    # The database got the first add of yesterday's log before the process stopped
+    yesterday = wal_name(date(2024, 1, 2))
+    store = make_store(tmp_path, {yesterday: 1})
+    store.recover(Database([order(1)]))
+
+    assert store.get(2)['status'] == 'SENT_TO_MARKET'
+    assert [(name, entry['op']) for name, entry in store.replication_queue] == [
+        (yesterday, 'add'), (yesterday, 'transition')
+    ]
+    assert store.replicated[yesterday] == 1
+
+
+def test_fully_replicated_earlier_logs_are_skipped(tmp_path, today):
+    store = make_store(tmp_path)
+    store.recover(Database())
+    store.add(order(1))
+    store.transition(1, 'FILLED', filled_quantity=100)
+    today.current += timedelta(days=1)
+
+    store = make_store(tmp_path, {wal_name(date(2024, 1, 2)): 2})
+    store.recover(Database())
+    assert store.get(1) is None
+    assert store.replication_queue == []
+
+
+def test_batches_never_span_two_logs(tmp_path, today):
+    store = make_store(tmp_path)
+    store.replication_queue = [('a', {'op': 'add'}), ('a', {'op': 'add'}), ('b', {'op': 'add'})]
+    written = []
+
+    def write_batch(batch, name, checkpoint):
+        written.append((name, len(batch), checkpoint))
+        if len(written) == 2:
+            raise SystemExit  # stop the replication loop
+
+    store.write_batch = write_batch
+    store.replication_interval = 0
+    with pytest.raises(SystemExit):
+        store.replicate()
+    assert written == [('a', 2, 2), ('b', 1, 1)]
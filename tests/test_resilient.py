@@ -0,0 +1,94 @@
+import threading
+import time
+
+from market_data.polygon_io import UpstreamError
+from market_data.resilient import CircuitBreaker, ResilientMarketData
+
+
+class Feed:
+    def __init__(self, prices=None, delay=0.0):
+        self.prices = prices or {}
+        self.delay = delay
+        self.failing = False
+        self.calls = 0
+
+    def get_last_trade(self, ticker):
+        self.calls += 1
+        time.sleep(self.delay)
+        if self.failing:
+            raise UpstreamError("502 from the feed")
+        return self.prices.get(ticker)
+
+
+def make_market_data(primary, secondary=None, **config):
+    return ResilientMarketData(primary, secondary, dict({'metrics_interval': 0}, **config))
+
+
+def test_breaker_opens_at_the_threshold_and_lets_one_probe_through():
+    breaker = CircuitBreaker(failure_threshold=3, reset_timeout=0.05)
+    for _ in range(2):
+        assert breaker.allow()
+        breaker.record_failure()
+    assert breaker.state == 'closed'
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+
+    time.sleep(0.06)
+    allowed = []
+    threads = [threading.Thread(target=lambda: allowed.append(breaker.allow())) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert allowed.count(True) == 1 and breaker.state == 'half_open'
+
+    # A failed probe reopens for another reset_timeout, a good one closes
+    breaker.record_failure()
+    assert breaker.state == 'open' and not breaker.allow()
+    time.sleep(0.06)
+    assert breaker.allow()
+    breaker.record_success()
+    assert breaker.state == 'closed' and breaker.failures == 0 and breaker.allow()
+
+
+def test_failing_feed_is_short_circuited_and_served_from_the_last_price():
+    primary = Feed({'AAPL': 150.0})
+    market_data = make_market_data(primary, failure_threshold=2, reset_timeout=60.0)
+    assert market_data.get_last_trade('AAPL') == 150.0
+
+    primary.failing = True
+    assert market_data.get_last_trade('AAPL') == 150.0
+    assert market_data.get_last_trade('AAPL') == 150.0
+    calls = primary.calls
+    assert market_data.get_last_trade('AAPL') == 150.0
+    # Open: no request goes upstream
+    assert primary.calls == calls
+
+    metrics = market_data.get_metrics()
+    assert metrics['breaker'] == 'open'
+    assert metrics['errors'] == 2 and metrics['short_circuited'] == 1 and metrics['stale'] == 3
+
+
+def test_ticker_without_a_trade_does_not_open_the_breaker():
+    market_data = make_market_data(Feed(), failure_threshold=2)
+    for _ in range(5):
+        assert market_data.get_last_trade('NOPE') is None
+
+    metrics = market_data.get_metrics()
+    assert metrics['breaker'] == 'closed'
+    assert metrics['not_found'] == 5 and metrics['unavailable'] == 5
+
+
+def test_slow_feed_is_hedged_and_answered_by_the_secondary_within_the_deadline():
+    primary = Feed({'AAPL': 150.0}, delay=0.5)
+    market_data = make_market_data(
+        primary, Feed({'AAPL': 149.5}), deadline=0.1, hedge_after=0.02, failure_threshold=1, workers=4
+    )
+
+    started = time.monotonic()
+    assert market_data.get_last_trade('AAPL') == 149.5
+    assert time.monotonic() - started < 0.4
+
+    metrics = market_data.get_metrics()
+    assert metrics['hedged'] == 1 and metrics['timeouts'] == 1 and metrics['secondary'] == 1
+    assert metrics['breaker'] == 'open'
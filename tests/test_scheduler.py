@@ -0,0 +1,111 @@
+import threading
+import time
+
+from src.scheduler import FairScheduler
+
+
+def order(order_id, account_id=1):
+    return {'order_id': order_id, 'account_id': account_id}
+
+
+class Recorder:
+    def __init__(self, expected):
+        self.served = []
+        self.rejected = []
+        self.lock = threading.Lock()
+        self.done = threading.Semaphore(0)
+        self.expected = expected
+
+    def handle(self, order, session_id):
+        with self.lock:
+            self.served.append((session_id, order['order_id']))
+        self.done.release()
+
+    def reject(self, order, session_id, message):
+        with self.lock:
+            self.rejected.append((session_id, order['order_id'], message))
+
+    def wait(self):
+        for _ in range(self.expected):
+            assert self.done.acquire(timeout=10)
+
+
+def make_scheduler(recorder, workers=1, **scheduler_config):
+    config = {'scheduler': dict({'metrics_interval': 0}, **scheduler_config)}
+    return FairScheduler(config, recorder.handle, recorder.reject, workers)
+
+
+def test_flooding_session_does_not_hold_back_the_others():
+    recorder = Recorder(105)
+    scheduler = make_scheduler(recorder)
+    # Queued before any worker runs, the flood is already ahead in arrival order
+    for i in range(100):
+        scheduler.submit(order(i), 'FLOOD')
+    for i in range(5):
+        scheduler.submit(order(100 + i), 'QUIET')
+    scheduler.start()
+    recorder.wait()
+
+    sessions = [session_id for session_id, _ in recorder.served]
+    assert max(index for index, session_id in enumerate(sessions) if session_id == 'QUIET') < 12
+
+
+def test_sessions_are_served_in_proportion_to_their_weights():
+    recorder = Recorder(120)
+    scheduler = make_scheduler(recorder, accounts={1: 'latency_sensitive', 2: 'standard'})
+    for i in range(60):
+        scheduler.submit(order(i, account_id=1), 'FAST')
+        scheduler.submit(order(100 + i, account_id=2), 'SLOW')
+    scheduler.start()
+    recorder.wait()
+
+    first = [session_id for session_id, _ in recorder.served[:30]]
+    # Weights 8 and 4
+    assert abs(first.count('FAST') - 20) <= 1
+
+
+def test_each_session_runs_on_one_worker_at_a_time_in_arrival_order():
+    recorder = Recorder(150)
+    active = set()
+    overlaps = []
+    handle = recorder.handle
+
+    def slow_handle(order, session_id):
+        with recorder.lock:
+            if session_id in active:
+                overlaps.append(session_id)
+            active.add(session_id)
+        time.sleep(0.0005)
+        with recorder.lock:
+            active.discard(session_id)
+        handle(order, session_id)
+
+    scheduler = FairScheduler({'scheduler': {'metrics_interval': 0}}, slow_handle, recorder.reject, 4)
+    scheduler.start()
+    for i in range(50):
+        for session_id in ('A', 'B', 'C'):
+            scheduler.submit(order(i), session_id)
+    recorder.wait()
+
+    assert overlaps == []
+    for session_id in ('A', 'B', 'C'):
+        assert [order_id for served, order_id in recorder.served if served == session_id] == list(range(50))
+    assert scheduler.sessions == {} and scheduler.depth == 0
+
+
+def test_overload_sheds_lower_classes_first():
+    recorder = Recorder(0)
+    scheduler = make_scheduler(recorder, max_queue=10, max_session_queue=3, accounts={2: 'bulk'})
+
+    assert all(scheduler.submit(order(i), f"S{i}") for i in range(5))
+    # Bulk is shed once the queue is half full, standard only at 90%
+    assert not scheduler.submit(order(5, account_id=2), 'S5')
+    assert scheduler.submit(order(6), 'S0') and scheduler.submit(order(7), 'S0')
+    # A session can't take more than its own share of the queue
+    assert not scheduler.submit(order(8), 'S0')
+
+    assert [(session_id, order_id) for session_id, order_id, _ in recorder.rejected] == [('S5', 5), ('S0', 8)]
+    assert all(message == "Gateway overloaded, order not accepted." for _, _, message in recorder.rejected)
+    metrics = scheduler.get_metrics()
+    assert metrics['depth'] == 7
+    assert metrics['classes']['bulk']['shed'] == 1 and metrics['classes']['standard']['shed'] == 1
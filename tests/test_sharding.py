@@ -0,0 +1,117 @@
+import multiprocessing
+import threading
+
+import pytest
+
+from src.shard_benchmark import bench_shard
+from src.sharding import ShardRouter, serve
+from src.shm_ring import SharedRing
+
+
+def order(order_id, account_id):
+    return {
+        'order_id': order_id, 'account_id': account_id, 'ticker': 'AAPL', 'side': 'BUY',
+        'quantity': 100, 'price': 150.0, 'order_type': 'LIMIT', 'asset_class': 'EQUITY'
+    }
+
+
+def produce(name, count):
+    ring = SharedRing(name, 64, 256)
+    for i in range(count):
+        ring.put(i)
+
+
+def test_message_larger_than_a_slot_is_split_and_joined():
+    ring = SharedRing(slots=8, slot_size=256)
+    try:
+        # Wraps around the end of the ring in the middle of a message
+        for n in range(10):
+            ring.put(('check_batch', n, [order(i, i) for i in range(n)]))
+            assert ring.get() == ('check_batch', n, [order(i, i) for i in range(n)])
+    finally:
+        ring.close()
+
+
+def test_message_larger_than_the_ring_is_refused():
+    ring = SharedRing(slots=4, slot_size=256)
+    try:
+        with pytest.raises(ValueError):
+            ring.put('x' * 4096)
+        ring.put('small')
+        assert ring.get() == 'small'
+    finally:
+        ring.close()
+
+
+def test_consumer_in_another_process_never_reads_an_unpublished_slot():
+    ring = SharedRing(slots=64, slot_size=256)
+    producer = multiprocessing.get_context('spawn').Process(target=produce, args=(ring.name, 20000))
+    producer.start()
+    try:
+        assert [ring.get(timeout=30) for _ in range(20000)] == list(range(20000))
+    finally:
+        producer.join(30)
+        ring.close()
+
+
+def test_shard_answers_and_stays_up_when_a_result_cannot_be_sent():
+    requests = SharedRing(slots=16, slot_size=256)
+    responses = SharedRing(slots=16, slot_size=256)
+
+    def handle(kind, payload):
+        if payload == 'unpicklable':
+            return True, lambda: None
+        if payload == 'fails':
+            raise RuntimeError("plugin failed")
+        return True, "Order passed all risk checks"
+
+    shard = threading.Thread(target=serve, args=(0, requests, responses, handle), daemon=True)
+    shard.start()
+    try:
+        requests.put(('check', 1, 'unpicklable'))
+        requests.put(('check', 2, 'fails'))
+        requests.put(('fill', None, 'fails'))
+        requests.put(('check', 3, 'ok'))
+        requests.put(('stop', 4, None))
+        assert responses.get(timeout=5) == ('check', 1, (False, "Error in risk check"))
+        assert responses.get(timeout=5) == ('check', 2, (False, "Error in risk check"))
+        assert responses.get(timeout=5) == ('check', 3, (True, "Order passed all risk checks"))
+        assert responses.get(timeout=5) == ('stop', 4, (True, "Order passed all risk checks"))
+        shard.join(5)
+        assert not shard.is_alive()
+    finally:
+        requests.close()
+        responses.close()
+
+
+def test_router_handles_baskets_and_rebuilds_larger_than_a_slot():
+    config = {
+        'sharding': {'shards': 2, 'ring_slots': 64, 'slot_size': 4096, 'timeout': 30},
+        'benchmark': {'cpu_ms': 0, 'wait_ms': 0}
+    }
+    router = ShardRouter(config, target=bench_shard)
+    assert router.start(timeout=60)
+    try:
+        basket = [order(i, i % 50 + 1) for i in range(300)]
+        assert router.check_orders(basket, 'SESSION-1') == [(True, "Order passed all risk checks")] * 300
+        router.rebuild_open_orders([order(i, i % 50 + 1) for i in range(500)])
+        assert router.check_order(order(1, 1), {'account_id': 1}, 'SESSION-1') == (
+            True, "Order passed all risk checks"
+        )
+        assert router.pending == {}
+    finally:
+        router.stop()
+
+
+def test_failed_send_rejects_the_order_and_leaves_nothing_pending():
+    class BrokenRing:
+        def put(self, item, timeout=None):
+            raise ValueError("ring is broken")
+
+    router = ShardRouter({'sharding': {'shards': 1, 'timeout': 1}})
+    router.request_rings.append(BrokenRing())
+    router.put_locks.append(threading.Lock())
+
+    assert router.check_order(order(1, 1), {'account_id': 1}, 'SESSION-1') == (False, "Error in risk check")
+    assert router.check_orders([order(1, 1), order(2, 1)], 'SESSION-1') == [(False, "Error in risk check")] * 2
+    assert router.pending == {}
@@ -0,0 +1,98 @@
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import src.risk_state as risk_state_module
+from src.risk_state import REPLAY_OVERLAP, RiskState
+from src.snapshot import HEADER, RiskStateSnapshot
+
+
+class FakeDate(date):
+    current = date(2024, 1, 2)
+
+    @classmethod
+    def today(cls):
+        return cls.current
+
+
+class Database:
+    def __init__(self):
+        self.positions_since = []
+        self.volumes_since = []
+
+    def get_all_positions(self):
+        return []
+
+    def get_daily_volumes(self, updated_since=None):
+        self.volumes_since.append(updated_since)
+        return {}
+
+    def get_positions_updated_since(self, updated_since):
+        self.positions_since.append(updated_since)
+        return [{'account_id': 7, 'session_id': 1, 'ticker': 'AAPL', 'quantity': 300, 'average_price': 10.0}]
+
+
+class RiskManagement:
+    def restore_plugin_state(self, state):
+        self.plugins = state
+
+
+@pytest.fixture
+def today(monkeypatch):
+    monkeypatch.setattr(risk_state_module, 'date', FakeDate)
+    FakeDate.current = date(2024, 1, 2)
+    return FakeDate
+
+
+def make_state(database):
+    risk_state = RiskState()
+    risk_state.load_from_database(database)
+    risk_state.apply_fill(7, 1, 'AAPL', 200, 10.0)
+    return risk_state
+
+
+def test_restart_replays_from_the_snapshot_not_from_the_previous_start(tmp_path):
+    database = Database()
+    risk_state = make_state(database)
+    # Started an hour before the snapshot
+    risk_state.as_of -= timedelta(hours=1)
+    started = risk_state.as_of
+    snapshot = RiskStateSnapshot(str(tmp_path / 'risk_state.snap'))
+
+    snapshot.write(risk_state)
+    taken = datetime.now()
+    restored = RiskState()
+    assert snapshot.restore(restored, RiskManagement(), database)
+
+    since = database.positions_since[-1]
+    assert started + timedelta(minutes=59) < since <= taken - REPLAY_OVERLAP
+    assert database.volumes_since[-1] == since
+    assert restored.get_account_view(7, 1)[0][0]['quantity'] == 300
+    assert restored.get_daily_volume(1) == 200
+
+
+def test_corrupt_snapshot_falls_back_to_a_full_load(tmp_path):
+    database = Database()
+    snapshot = RiskStateSnapshot(str(tmp_path / 'risk_state.snap'))
+    snapshot.write(make_state(database))
+    with open(snapshot.path, 'r+b') as f:
+        f.seek(HEADER.size + 4)
+        byte = f.read(1)
+        f.seek(HEADER.size + 4)
+        f.write(bytes([byte[0] ^ 0xFF]))
+
+    assert snapshot.load() is None
+    assert not snapshot.restore(RiskState(), RiskManagement(), database)
+    assert database.positions_since == []
+
+
+def test_daily_volumes_roll_over_at_midnight_in_a_running_process(today):
+    risk_state = RiskState()
+    risk_state.apply_fill(7, 1, 'AAPL', 200, 10.0)
+    assert risk_state.get_daily_volume(1) == 200
+
+    today.current = date(2024, 1, 3)
+    assert risk_state.get_daily_volume(1) == 0
+    risk_state.apply_fill(7, 1, 'AAPL', 50, 10.0)
+    assert risk_state.get_daily_volume(1) == 50
+    assert risk_state.to_dict()['trading_date'] == '2024-01-03'